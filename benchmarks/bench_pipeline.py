@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Per-stage benchmark of the Delphi ingestion pipeline on a synthetic corpus
+
+Stages are timed separately so a regression can be pinned to discovery,
+encoding detection, decoding, parsing, extraction, chunking, tokenization
+or serialization. Nothing is uploaded to LightRAG.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_corpus import PRESETS, generate_corpus
+
+STAGES = ["scan", "encoding", "decode", "parse", "extraction", "chunking", "tokenization", "serialization"]
+
+
+def _time_stage(fn: Callable[[], Dict[str, int]], repeat: int) -> Dict[str, Any]:
+    """Run a stage `repeat` times and keep the fastest run"""
+    best = None
+    counts: Dict[str, int] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counts = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result = {"seconds": round(best, 6), "items": counts.get("items", 0), "bytes": counts.get("bytes", 0)}
+    if best > 0:
+        result["items_per_s"] = round(result["items"] / best, 1)
+        result["mb_per_s"] = round(result["bytes"] / best / 1e6, 3)
+    return result
+
+
+def run_benchmarks(corpus_dir: str, repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    """Time every pipeline stage over the files in `corpus_dir`"""
+    from process_delphi_code_enhanced import EnhancedDelphiProcessor
+
+    with tempfile.TemporaryDirectory() as scratch:
+        processor = EnhancedDelphiProcessor(
+            progress_file=os.path.join(scratch, "progress.json"),
+            analysis_cache_file=None,
+            dedup=False
+        )
+        file_processor = processor.file_processor
+        analyzer = processor.ast_analyzer
+        chunker = processor.text_chunker
+        results: Dict[str, Dict[str, Any]] = {}
+
+        files: List[str] = []
+
+        def scan():
+            files[:] = file_processor.find_delphi_files(corpus_dir)
+            return {"items": len(files)}
+        results["scan"] = _time_stage(scan, repeat)
+        sizes = {path: os.path.getsize(path) for path in files}
+        total_bytes = sum(sizes.values())
+
+        encodings: Dict[str, str] = {}
+
+        def encoding():
+            for path in files:
+                encodings[path] = file_processor.detect_encoding(path)
+            return {"items": len(files), "bytes": total_bytes}
+        results["encoding"] = _time_stage(encoding, repeat)
+
+        contents: Dict[str, str] = {}
+
+        def decode():
+            for path in files:
+                with open(path, 'r', encoding=encodings[path], errors='ignore') as f:
+                    contents[path] = f.read()
+            return {"items": len(files), "bytes": total_bytes}
+        results["decode"] = _time_stage(decode, repeat)
+
+        pas_files = [path for path in files if path.lower().endswith(".pas")]
+        pas_bytes = sum(sizes[path] for path in pas_files)
+        trees: Dict[str, Any] = {}
+
+        def parse():
+            for path in pas_files:
+                trees[path] = analyzer.parse_code(contents[path])
+            return {"items": len(pas_files), "bytes": pas_bytes}
+        results["parse"] = _time_stage(parse, repeat)
+
+        ast_infos: Dict[str, Dict[str, Any]] = {}
+
+        def extraction():
+            for path in pas_files:
+                ast_infos[path] = analyzer.ast_info_from_tree(trees[path])
+            return {"items": len(pas_files), "bytes": pas_bytes}
+        results["extraction"] = _time_stage(extraction, repeat)
+        trees.clear()
+
+        chunks: Dict[str, List[Dict[str, Any]]] = {}
+
+        def chunking():
+            for path in files:
+                if path in ast_infos:
+                    category = file_processor.estimate_file_size_category(path)
+                    chunks[path] = processor.chunk_pas_content(path, contents[path], category, ast_infos[path])
+                else:
+                    chunks[path] = processor.process_dfm_file(path, contents[path])
+            return {"items": sum(len(c) for c in chunks.values()), "bytes": total_bytes}
+        results["chunking"] = _time_stage(chunking, repeat)
+
+        def tokenization():
+            tokens = sum(chunker.count_tokens(contents[path]) for path in files)
+            return {"items": tokens, "bytes": total_bytes}
+        results["tokenization"] = _time_stage(tokenization, repeat)
+
+        def serialization():
+            payload_bytes = 0
+            count = 0
+            for file_chunks in chunks.values():
+                documents = [processor.build_document(chunk) for chunk in file_chunks]
+                payload_bytes += len(json.dumps({"texts": documents}, ensure_ascii=False).encode("utf-8"))
+                count += len(documents)
+            return {"items": count, "bytes": payload_bytes}
+        results["serialization"] = _time_stage(serialization, repeat)
+
+    return results
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25,
+                    min_seconds: float = 0.005) -> List[Dict[str, Any]]:
+    """
+    Compare stage timings against a stored baseline
+
+    A stage regresses when it is slower than the baseline by more than
+    `tolerance`. Stages faster than `min_seconds` in the baseline are too
+    noisy to judge and are reported but never flagged.
+    """
+    rows = []
+    for stage in STAGES:
+        now = current["stages"].get(stage)
+        before = baseline["stages"].get(stage)
+        if now is None or before is None:
+            continue
+        ratio = now["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        rows.append({
+            "stage": stage,
+            "baseline_seconds": before["seconds"],
+            "current_seconds": now["seconds"],
+            "ratio": round(ratio, 3),
+            "regressed": before["seconds"] >= min_seconds and ratio > 1 + tolerance
+        })
+    return rows
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the Delphi ingestion pipeline")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small", help="Synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus generator seed")
+    parser.add_argument("--corpus", help="Reuse (or create) the corpus in this directory instead of a temp dir")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against this stored results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown ratio before a stage counts as regressed")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    args = parser.parse_args()
+
+    # Per-file progress logging would dominate the timings
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or os.path.join(tmp, "corpus")
+        if args.corpus and Path(args.corpus, ".corpus.json").exists():
+            summary = json.loads(Path(args.corpus, ".corpus.json").read_text())
+        else:
+            summary = generate_corpus(corpus_dir, args.preset, args.seed)
+            if args.corpus:
+                Path(args.corpus, ".corpus.json").write_text(json.dumps(
+                    {k: v for k, v in summary.items() if k != "files"}))
+        stages = run_benchmarks(corpus_dir, args.repeat)
+
+    results = {
+        "meta": {
+            "preset": summary["preset"],
+            "seed": summary["seed"],
+            "file_count": summary["file_count"],
+            "total_bytes": summary["total_bytes"],
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "stages": stages
+    }
+
+    print(f"{'stage':<14} {'seconds':>10} {'items':>10} {'MB/s':>10}")
+    for stage in STAGES:
+        r = stages[stage]
+        print(f"{stage:<14} {r['seconds']:>10.4f} {r['items']:>10} {r.get('mb_per_s', 0):>10.2f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.baseline and args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["meta"].get("preset") != results["meta"]["preset"]:
+            print(f"Warning: baseline preset {baseline['meta'].get('preset')} differs from {args.preset}")
+        rows = compare_results(results, baseline, args.tolerance)
+        print(f"\n{'stage':<14} {'baseline':>10} {'current':>10} {'ratio':>8}")
+        for row in rows:
+            flag = "  REGRESSED" if row["regressed"] else ""
+            print(f"{row['stage']:<14} {row['baseline_seconds']:>10.4f} {row['current_seconds']:>10.4f} "
+                  f"{row['ratio']:>8.2f}{flag}")
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic Delphi corpus generator for benchmarks
+"""
+import os
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Corpus shapes; every count scales the amount of generated code
+PRESETS: Dict[str, Dict[str, int]] = {
+    "tiny": {
+        "units": 4, "classes_per_unit": 2, "methods_per_class": 3,
+        "large_units": 1, "large_unit_classes": 20,
+        "forms": 2, "components_per_form": 10, "big_forms": 1, "big_form_components": 60,
+        "sjis_units": 1, "nesting_depth": 3, "nested_block_depth": 6
+    },
+    "small": {
+        "units": 40, "classes_per_unit": 3, "methods_per_class": 6,
+        "large_units": 2, "large_unit_classes": 150,
+        "forms": 20, "components_per_form": 25, "big_forms": 2, "big_form_components": 400,
+        "sjis_units": 10, "nesting_depth": 6, "nested_block_depth": 12
+    },
+    "medium": {
+        "units": 400, "classes_per_unit": 4, "methods_per_class": 8,
+        "large_units": 5, "large_unit_classes": 600,
+        "forms": 150, "components_per_form": 40, "big_forms": 5, "big_form_components": 2000,
+        "sjis_units": 80, "nesting_depth": 10, "nested_block_depth": 20
+    },
+    "large": {
+        "units": 3000, "classes_per_unit": 4, "methods_per_class": 10,
+        "large_units": 10, "large_unit_classes": 2500,
+        "forms": 800, "components_per_form": 60, "big_forms": 10, "big_form_components": 6000,
+        "sjis_units": 500, "nesting_depth": 16, "nested_block_depth": 32
+    },
+}
+
+_COMPONENT_CLASSES = ["TButton", "TEdit", "TLabel", "TPanel", "TMemo", "TCheckBox", "TComboBox"]
+_JAPANESE_COMMENTS = ["値を設定する", "値を取得する", "合計を計算する", "入力を検証する", "画面を更新する"]
+
+
+def _class_declaration(name: str, methods: int) -> str:
+    lines = [f"  {name} = class(TObject)", "  private", "    FValue: Integer;", "    FName: string;", "  public"]
+    lines.append("    constructor Create;")
+    for m in range(methods):
+        lines.append(f"    function Method{m}(A, B: Integer): Integer;")
+    lines.append("  end;")
+    return "\n".join(lines)
+
+
+def _class_implementation(name: str, methods: int, rng: random.Random, comment: str = "") -> str:
+    parts = [f"constructor {name}.Create;\nbegin\n  inherited;\n  FValue := {rng.randint(0, 999)};\n  FName := '{name}';\nend;\n"]
+    for m in range(methods):
+        body = [f"function {name}.Method{m}(A, B: Integer): Integer;"]
+        if comment:
+            body.append(f"// {comment}")
+        body += [
+            "var",
+            "  I: Integer;",
+            "begin",
+            f"  Result := A * {rng.randint(1, 9)} + B;",
+            f"  for I := 0 to {rng.randint(1, 20)} do",
+            "    Result := Result + FValue;",
+            "end;",
+            ""
+        ]
+        parts.append("\n".join(body))
+    return "\n".join(parts)
+
+
+def generate_unit(unit_name: str, classes: int, methods: int, rng: random.Random,
+                  japanese: bool = False) -> str:
+    """A unit with `classes` classes of `methods` methods each"""
+    names = [f"T{unit_name}Class{c}" for c in range(classes)]
+    comment = rng.choice(_JAPANESE_COMMENTS) if japanese else ""
+    header = f"unit {unit_name};\n\n"
+    if japanese:
+        header += f"{{ {unit_name}: 日本語コメントを含むユニット }}\n\n"
+    interface = "\n\n".join(_class_declaration(n, methods) for n in names)
+    implementation = "\n".join(_class_implementation(n, methods, rng, comment) for n in names)
+    return (f"{header}interface\n\nuses\n  System.SysUtils, System.Classes;\n\ntype\n{interface}\n\n"
+            f"implementation\n\n{implementation}\nend.\n")
+
+
+def generate_nested_unit(unit_name: str, depth: int) -> str:
+    """A unit whose single routine nests begin/end and if blocks `depth` levels deep"""
+    lines = [f"unit {unit_name};", "", "interface", "", "procedure Deep(X: Integer);", "",
+             "implementation", "", "procedure Deep(X: Integer);", "begin"]
+    for level in range(depth):
+        indent = "  " * (level + 1)
+        lines.append(f"{indent}if X > {level} then")
+        lines.append(f"{indent}begin")
+    lines.append("  " * (depth + 1) + "X := X - 1;")
+    for level in reversed(range(depth)):
+        lines.append("  " * (level + 1) + "end;")
+    lines += ["end;", "", "end."]
+    return "\n".join(lines) + "\n"
+
+
+def generate_form(form_name: str, components: int, rng: random.Random, binary_blocks: int = 0) -> str:
+    """A text DFM with nested panels, event bindings and optional Picture.Data blocks"""
+    lines = [f"object {form_name}: T{form_name}", "  Left = 0", "  Top = 0",
+             f"  Caption = '{form_name}'", "  ClientHeight = 600", "  ClientWidth = 800",
+             "  OnCreate = FormCreate"]
+    depth = 1
+    for c in range(components):
+        cls = _COMPONENT_CLASSES[c % len(_COMPONENT_CLASSES)]
+        indent = "  " * depth
+        lines.append(f"{indent}object {cls[1:]}{c}: {cls}")
+        lines.append(f"{indent}  Left = {rng.randint(0, 700)}")
+        lines.append(f"{indent}  Top = {rng.randint(0, 500)}")
+        lines.append(f"{indent}  Width = {rng.randint(20, 200)}")
+        if cls == "TButton":
+            lines.append(f"{indent}  Caption = 'Button {c}'")
+            lines.append(f"{indent}  OnClick = {cls[1:]}{c}Click")
+        if c < binary_blocks:
+            lines.append(f"{indent}  Picture.Data = {{")
+            for _ in range(64):
+                lines.append(f"{indent}    " + "".join(rng.choice("0123456789ABCDEF") for _ in range(64)))
+            lines.append(f"{indent}    }}")
+        if cls == "TPanel" and depth < 4:
+            depth += 1
+            continue
+        lines.append(f"{indent}end")
+        if depth > 1 and rng.random() < 0.3:
+            depth -= 1
+            lines.append("  " * depth + "end")
+    while depth > 1:
+        depth -= 1
+        lines.append("  " * depth + "end")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(root: str, preset: str = "small", seed: int = 42) -> Dict[str, Any]:
+    """
+    Write a deterministic corpus under `root`
+
+    The same preset and seed always produce byte-identical files.
+
+    Returns:
+        Summary with the file list, file count and total bytes
+    """
+    spec = PRESETS[preset]
+    rng = random.Random(seed)
+    root_path = Path(root)
+    files: List[Dict[str, Any]] = []
+
+    def write(relative: str, content: str, encoding: str = "utf-8"):
+        path = root_path / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = content.encode(encoding)
+        path.write_bytes(data)
+        files.append({"path": relative, "bytes": len(data), "encoding": encoding})
+
+    # Spread ordinary units over a directory tree `nesting_depth` levels deep
+    for u in range(spec["units"]):
+        depth = u % (spec["nesting_depth"] + 1)
+        directory = "/".join(f"level{d}" for d in range(depth)) or "."
+        name = f"Unit{u:05d}"
+        write(os.path.join(directory, f"{name}.pas"),
+              generate_unit(name, spec["classes_per_unit"], spec["methods_per_class"], rng))
+
+    for u in range(spec["large_units"]):
+        name = f"Generated{u:03d}"
+        write(f"large/{name}.pas", generate_unit(name, spec["large_unit_classes"], 12, rng))
+
+    for u in range(spec["sjis_units"]):
+        name = f"Japanese{u:04d}"
+        write(f"sjis/{name}.pas",
+              generate_unit(name, spec["classes_per_unit"], spec["methods_per_class"], rng, japanese=True),
+              encoding="shift_jis")
+
+    write("nested/DeepNesting.pas", generate_nested_unit("DeepNesting", spec["nested_block_depth"]))
+
+    for f in range(spec["forms"]):
+        name = f"Form{f:04d}"
+        write(f"forms/{name}.dfm", generate_form(name, spec["components_per_form"], rng))
+
+    for f in range(spec["big_forms"]):
+        name = f"BigForm{f:03d}"
+        write(f"forms/big/{name}.dfm",
+              generate_form(name, spec["big_form_components"], rng, binary_blocks=5))
+
+    return {
+        "preset": preset,
+        "seed": seed,
+        "files": files,
+        "file_count": len(files),
+        "total_bytes": sum(f["bytes"] for f in files)
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic Delphi corpus")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    summary = generate_corpus(args.directory, args.preset, args.seed)
+    print(f"Generated {summary['file_count']} files ({summary['total_bytes']:,} bytes) in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Lightweight stand-in for the LightRAG REST API used for offline load testing
+
+Implements the endpoints the processors talk to (/documents/texts,
+/documents, /query, /docs) with configurable latency, error-rate and
+throttling profiles, and records every request so upload throughput and
+retry behavior can be measured without the docker-compose stack.
+
+    python mock_lightrag_server.py --port 8080 --profile throttled --log-file mock_requests.jsonl
+    LIGHTRAG_API_URL=http://localhost:8080 python process_delphi_code_enhanced.py ./src_dir
+    curl http://localhost:8080/mock/stats
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger("mock_lightrag")
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "latency_ms": 0.0,                  # fixed delay added to every response
+    "jitter_ms": 0.0,                   # uniform random extra delay
+    "latency_per_kb_ms": 0.0,           # delay proportional to the request body size
+    "error_rate": 0.0,                  # fraction of write requests answered with a 5xx
+    "error_statuses": [500, 502, 503],
+    "requests_per_minute": 0.0,         # request throttle (0 = unlimited), answered with 429
+    "docs_per_minute": 0.0,             # document throttle on inserts (0 = unlimited)
+    "processing_docs_per_minute": 0.0,  # simulated indexing rate (0 = processed immediately)
+    "failure_rate": 0.0,                # fraction of accepted documents that end up FAILED
+    "seed": 0,
+}
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "instant": {},
+    "realistic": {"latency_ms": 80, "jitter_ms": 40, "latency_per_kb_ms": 0.5,
+                  "processing_docs_per_minute": 120},
+    "flaky": {"latency_ms": 80, "jitter_ms": 40, "error_rate": 0.1,
+              "processing_docs_per_minute": 120, "failure_rate": 0.02},
+    "throttled": {"latency_ms": 30, "requests_per_minute": 60, "docs_per_minute": 600,
+                  "processing_docs_per_minute": 120},
+}
+
+STATUSES = ["pending", "processing", "processed", "failed"]
+
+
+def compute_doc_id(content: str) -> str:
+    """LightRAG's document id for inserted text"""
+    return "doc-" + hashlib.md5(content.strip().encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """Refilling allowance of `per_minute` units; `take` reports the wait when it runs dry"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute / 60.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, amount: float = 1.0) -> float:
+        """Consume `amount` and return 0, or return the seconds to wait without consuming"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Requests larger than the bucket are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)]
+
+
+class MockLightRAG:
+    """Document store, simulated indexing queue and request recorder behind the handler"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, log_file: Optional[str] = None,
+                 history: int = 10000):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config["seed"])
+        self.request_bucket = (TokenBucket(self.config["requests_per_minute"])
+                               if self.config["requests_per_minute"] > 0 else None)
+        self.doc_bucket = (TokenBucket(self.config["docs_per_minute"])
+                           if self.config["docs_per_minute"] > 0 else None)
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.documents: Dict[str, Dict[str, Any]] = {}
+            self.requests: deque = deque(maxlen=self.history)
+            self.totals: Counter = Counter()
+            self.endpoint_durations: Dict[str, List[float]] = {}
+            self.endpoint_statuses: Dict[str, Counter] = {}
+            self.started = time.time()
+            self.queue_free_at = time.monotonic()
+
+    # --- simulated indexing -------------------------------------------------
+
+    def _status(self, doc: Dict[str, Any], now: float) -> str:
+        if now < doc["processing_at"]:
+            return "pending"
+        if now < doc["done_at"]:
+            return "processing"
+        return "failed" if doc["fails"] else "processed"
+
+    def add_documents(self, texts: List[str], file_sources: List[str]) -> Tuple[int, int]:
+        """Queue texts for simulated indexing; returns (new, duplicate) counts"""
+        rate = self.config["processing_docs_per_minute"]
+        per_doc = 60.0 / rate if rate > 0 else 0.0
+        created = datetime.now(timezone.utc).isoformat()
+        new = duplicates = 0
+        with self.lock:
+            now = time.monotonic()
+            for i, text in enumerate(texts):
+                doc_id = compute_doc_id(text)
+                if doc_id in self.documents:
+                    duplicates += 1
+                    continue
+                start = max(now, self.queue_free_at)
+                self.queue_free_at = start + per_doc
+                self.documents[doc_id] = {
+                    "id": doc_id,
+                    "content_summary": text[:100],
+                    "content_length": len(text),
+                    "file_path": file_sources[i] if i < len(file_sources) else "unknown_source",
+                    "created_at": created,
+                    "processing_at": start,
+                    "done_at": start + per_doc,
+                    "fails": self.random.random() < self.config["failure_rate"],
+                    "received_at": now,
+                }
+                new += 1
+        return new, duplicates
+
+    def document_statuses(self) -> Dict[str, List[Dict[str, Any]]]:
+        now = time.monotonic()
+        statuses: Dict[str, List[Dict[str, Any]]] = {status: [] for status in STATUSES}
+        with self.lock:
+            for doc in self.documents.values():
+                status = self._status(doc, now)
+                statuses[status].append({
+                    "id": doc["id"],
+                    "content_summary": doc["content_summary"],
+                    "content_length": doc["content_length"],
+                    "status": status,
+                    "created_at": doc["created_at"],
+                    "updated_at": doc["created_at"],
+                    "file_path": doc["file_path"],
+                    "chunks_count": 1 if status == "processed" else None,
+                    "error_msg": "simulated indexing failure" if status == "failed" else None,
+                })
+        return {status: docs for status, docs in statuses.items() if docs}
+
+    def pipeline_status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            counts = Counter(self._status(doc, now) for doc in self.documents.values())
+        waiting = counts["pending"] + counts["processing"]
+        return {
+            "busy": waiting > 0,
+            "docs": waiting,
+            "pending": counts["pending"],
+            "processing": counts["processing"],
+            "processed": counts["processed"],
+            "failed": counts["failed"],
+            "request_pending": False,
+            "latest_message": f"{waiting} documents waiting" if waiting else "idle",
+        }
+
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        with self.lock:
+            deleted = [doc_id for doc_id in doc_ids if self.documents.pop(doc_id, None) is not None]
+        return len(deleted)
+
+    def clear_documents(self):
+        with self.lock:
+            self.documents.clear()
+            self.queue_free_at = time.monotonic()
+
+    def query(self, text: str, top_k: int = 5) -> Dict[str, Any]:
+        """Very small keyword match over the processed documents"""
+        words = {w.lower() for w in text.split() if len(w) > 2}
+        now = time.monotonic()
+        with self.lock:
+            ranked = sorted(
+                ((sum(w in doc["content_summary"].lower() for w in words), doc)
+                 for doc in self.documents.values() if self._status(doc, now) == "processed"),
+                key=lambda pair: -pair[0])
+        hits = [doc for score, doc in ranked[:top_k] if score > 0]
+        if not hits:
+            return {"response": "No relevant documents found (mock LightRAG)."}
+        lines = [f"- {doc['file_path']}: {doc['content_summary']}" for doc in hits]
+        return {"response": "Mock answer based on:\n" + "\n".join(lines)}
+
+    # --- fault injection ----------------------------------------------------
+
+    def admission(self, method: str, path: str, doc_count: int) -> Optional[Tuple[int, float]]:
+        """Decide whether to throttle or fail a request: (status, retry_after) or None"""
+        if path.startswith("/mock/"):
+            return None
+        with self.lock:
+            if self.request_bucket is not None:
+                wait = self.request_bucket.take()
+                if wait > 0:
+                    return 429, wait
+            if self.doc_bucket is not None and doc_count:
+                wait = self.doc_bucket.take(doc_count)
+                if wait > 0:
+                    return 429, wait
+            if method != "GET" and self.random.random() < self.config["error_rate"]:
+                return self.random.choice(self.config["error_statuses"]), 0.0
+        return None
+
+    def latency(self, body_bytes: int) -> float:
+        with self.lock:
+            jitter = self.random.uniform(0, self.config["jitter_ms"]) if self.config["jitter_ms"] else 0.0
+        return (self.config["latency_ms"] + jitter + self.config["latency_per_kb_ms"] * body_bytes / 1024) / 1000
+
+    # --- recording ----------------------------------------------------------
+
+    def record(self, entry: Dict[str, Any]):
+        endpoint = f"{entry['method']} {entry['path']}"
+        with self.lock:
+            self.requests.append(entry)
+            self.totals["requests"] += 1
+            self.totals["request_bytes"] += entry["request_bytes"]
+            self.totals["response_bytes"] += entry["response_bytes"]
+            self.totals["texts"] += entry.get("texts", 0)
+            if entry["status"] == 429:
+                self.totals["throttled"] += 1
+            elif entry["status"] >= 500:
+                self.totals["errors"] += 1
+            self.endpoint_durations.setdefault(endpoint, []).append(entry["duration_ms"])
+            self.endpoint_statuses.setdefault(endpoint, Counter())[str(entry["status"])] += 1
+            if self.log_file:
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            endpoints = {}
+            for endpoint, durations in self.endpoint_durations.items():
+                endpoints[endpoint] = {
+                    "count": len(durations),
+                    "statuses": dict(self.endpoint_statuses[endpoint]),
+                    "p50_ms": round(_percentile(durations, 0.5), 2),
+                    "p95_ms": round(_percentile(durations, 0.95), 2),
+                    "max_ms": round(max(durations), 2),
+                }
+            accepted = len(self.documents)
+            totals = dict(self.totals)
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests": totals.get("requests", 0),
+            "throttled": totals.get("throttled", 0),
+            "errors": totals.get("errors", 0),
+            "texts_received": totals.get("texts", 0),
+            "documents_stored": accepted,
+            "request_bytes": totals.get("request_bytes", 0),
+            "response_bytes": totals.get("response_bytes", 0),
+            "texts_per_second": round(totals.get("texts", 0) / elapsed, 2),
+            "request_bytes_per_second": round(totals.get("request_bytes", 0) / elapsed, 1),
+            "endpoints": endpoints,
+            "config": self.config,
+        }
+
+
+class MockLightRAGHandler(BaseHTTPRequestHandler):
+    """HTTP front end; `server.mock` holds the shared MockLightRAG"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method: str):
+        started = time.perf_counter()
+        mock: MockLightRAG = self.server.mock
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = None
+        texts = body.get("texts", []) if isinstance(body, dict) and url.path == "/documents/texts" else []
+        if isinstance(body, dict) and url.path == "/documents/text" and "text" in body:
+            texts = [body["text"]]
+
+        time.sleep(mock.latency(len(raw)))
+        headers: Dict[str, str] = {}
+        verdict = mock.admission(method, url.path, len(texts))
+        if verdict is not None:
+            status, retry_after = verdict
+            if status == 429:
+                headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+                payload: Any = {"detail": "Too Many Requests"}
+            else:
+                payload = {"detail": "Simulated server error"}
+        elif body is None:
+            status, payload = 422, {"detail": "Invalid JSON body"}
+        else:
+            status, payload = self._route(mock, method, url.path, parse_qs(url.query), body, texts)
+
+        data = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html" if isinstance(payload, str) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+        mock.record({
+            "ts": round(time.time(), 3),
+            "method": method,
+            "path": url.path,
+            "status": status,
+            "request_bytes": len(raw),
+            "response_bytes": len(data),
+            "texts": len(texts),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+
+    def _route(self, mock: MockLightRAG, method: str, path: str, query: Dict[str, List[str]],
+               body: Dict[str, Any], texts: List[str]) -> Tuple[int, Any]:
+        if method == "GET" and path == "/docs":
+            return 200, "<html><body>Mock LightRAG API</body></html>"
+        if method == "GET" and path == "/health":
+            return 200, {"status": "healthy", "mock": True}
+        if method == "POST" and path in ("/documents/texts", "/documents/text"):
+            if not texts or not all(isinstance(t, str) for t in texts):
+                return 422, {"detail": "texts must be a non-empty list of strings"}
+            sources = body.get("file_sources") or ([body["file_source"]] if body.get("file_source") else [])
+            new, duplicates = mock.add_documents(texts, sources)
+            return 200, {
+                "status": "success",
+                "message": f"{new} documents queued, {duplicates} already present",
+                "track_id": "insert_" + hashlib.md5("".join(texts).encode("utf-8")).hexdigest()[:12],
+            }
+        if method == "GET" and path == "/documents":
+            return 200, {"statuses": mock.document_statuses()}
+        if method == "DELETE" and path == "/documents":
+            mock.clear_documents()
+            return 200, {"status": "success", "message": "All documents cleared"}
+        if method == "DELETE" and path == "/documents/delete_document":
+            doc_ids = body.get("doc_ids") or []
+            deleted = mock.delete_documents(doc_ids)
+            return 200, {"status": "deletion_started", "message": f"{deleted} of {len(doc_ids)} documents deleted",
+                         "doc_id": ", ".join(doc_ids)}
+        if method == "GET" and path == "/documents/pipeline_status":
+            return 200, mock.pipeline_status()
+        if method == "POST" and path == "/query":
+            if not body.get("query"):
+                return 422, {"detail": "query is required"}
+            return 200, mock.query(body["query"], int(body.get("top_k", 5)))
+        if method == "GET" and path == "/mock/stats":
+            return 200, mock.stats()
+        if method == "GET" and path == "/mock/requests":
+            limit = int(query.get("limit", ["100"])[0])
+            with mock.lock:
+                return 200, list(mock.requests)[-limit:]
+        if method == "POST" and path == "/mock/reset":
+            mock.reset()
+            return 200, {"status": "reset"}
+        return 404, {"detail": "Not Found"}
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8080, config: Optional[Dict[str, Any]] = None,
+                  log_file: Optional[str] = None) -> ThreadingHTTPServer:
+    """Build the mock server (port 0 picks a free port; see server.server_address)"""
+    server = ThreadingHTTPServer((host, port), MockLightRAGHandler)
+    server.daemon_threads = True
+    server.mock = MockLightRAG(config, log_file)
+    return server
+
+
+def start_in_thread(config: Optional[Dict[str, Any]] = None, host: str = "127.0.0.1",
+                    port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the mock server on a background thread; returns (server, base_url)"""
+    server = create_server(host, port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mock LightRAG API server for offline load testing")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=8080, help="Port (the docker-compose stack uses 8080)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="instant", help="Base behavior profile")
+    parser.add_argument("--latency-ms", type=float, help="Fixed response latency")
+    parser.add_argument("--jitter-ms", type=float, help="Uniform random extra latency")
+    parser.add_argument("--latency-per-kb-ms", type=float, help="Extra latency per KB of request body")
+    parser.add_argument("--error-rate", type=float, help="Fraction of write requests failing with 5xx")
+    parser.add_argument("--requests-per-minute", type=float, help="Request throttle (429 + Retry-After)")
+    parser.add_argument("--docs-per-minute", type=float, help="Inserted document throttle")
+    parser.add_argument("--processing-docs-per-minute", type=float, help="Simulated indexing rate")
+    parser.add_argument("--failure-rate", type=float, help="Fraction of documents ending up FAILED")
+    parser.add_argument("--seed", type=int, help="Random seed for jitter and fault injection")
+    parser.add_argument("--log-file", help="Append one JSON line per request to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = dict(PROFILES[args.profile])
+    for key in DEFAULT_CONFIG:
+        value = getattr(args, key, None)
+        if value is not None:
+            config[key] = value
+
+    server = create_server(args.host, args.port, config, args.log_file)
+    logger.info(f"Mock LightRAG ({args.profile}) listening on http://{args.host}:{server.server_address[1]}")
+    logger.info(f"Settings: {server.mock.config}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats = server.mock.stats()
+        logger.info(f"Requests: {stats['requests']}, throttled: {stats['throttled']}, "
+                    f"errors: {stats['errors']}, texts: {stats['texts_received']}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from typing import List, Dict, Any
 from pathlib import Path
 from dotenv import load_dotenv
 from src.delphi_ast_analyzer import DelphiASTAnalyzer
+from src.discovery import iter_delphi_files
 
 # Load environment variables
 load_dotenv()
@@ -24,27 +25,20 @@ LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
 
 def read_delphi_files(folder_path: str) -> List[Dict[str, Any]]:
-    """Read all .pas and .dfm files from the specified folder"""
+    """Read all .pas and .dfm files from the specified folder, in path order"""
     files = []
-    path = Path(folder_path)
     
-    for file_path in path.rglob("*.pas"):
+    # A single parallel scandir pass finds both extensions; it yields in completion order,
+    # so sort for stable output. Like the old rglob walk, every directory is searched
+    entries = sorted(iter_delphi_files(folder_path, prune_dirs=False), key=lambda entry: entry.path)
+    for entry in entries:
+        file_path = Path(entry.path)
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
             content = f.read()
             files.append({
                 "path": str(file_path),
                 "name": file_path.name,
-                "type": "pas",
-                "content": content
-            })
-    
-    for file_path in path.rglob("*.dfm"):
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-            files.append({
-                "path": str(file_path),
-                "name": file_path.name,
-                "type": "dfm",
+                "type": file_path.suffix[1:].lower(),
                 "content": content
             })
     
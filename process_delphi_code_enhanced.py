@@ -4,14 +4,44 @@ Enhanced Delphi code processing script with advanced features
 """
 import os
 import sys
+import contextlib
+import copy
+import functools
+import hashlib
+import io
 import json
+import itertools
 import requests
 import logging
-from typing import List, Dict, Any, Optional
+import posixpath
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from typing import List, Dict, Any, Callable, Optional, Iterable, Iterator, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
-from src.delphi_ast_analyzer import DelphiASTAnalyzer
-from src.file_utils import FileProcessor
+from src.analysis_cache import AnalysisCache
+from src.archive_source import ArchiveSource, is_archive
+from src.backpressure import PipelineMonitor, DEFAULT_POLL_SECONDS
+from src.chunk_dedup import ChunkDeduplicator, chunk_location
+from src.chunk_store import ChunkStoreReader, ChunkStoreWriter, summarize_store
+from src.near_duplicate import NearDuplicateDetector, NEAR_DUPLICATE_POLICIES
+from src.discovery import DEFAULT_DISCOVERY_THREADS
+from src.dfm_binary import BINARY_DFM_SIGNATURE, is_binary_dfm, read_binary_dfm
+from src.dfm_parser import BINARY_POLICIES, DFM_CHUNK_TOKENS, DfmComponent, DfmSyntaxError, binary_bytes, chunk_form, parse_dfm
+from src.document_format import DOCUMENT_STYLES, LEGACY_FORMATTER, DocumentFormatter
+from src.file_utils import FileProcessor, ENCODING_SAMPLE_BYTES
+from src.form_pairing import find_form_unit, pair_handlers
+from src.git_changes import GitError, changed_files, head_commit
+from src.lightrag_client import LightRAGClient, compute_doc_id
+from src.metrics import MetricsRecorder, NULL_METRICS
+from src.memory_profiler import MemoryProfiler, NULL_PROFILER
+from src.rate_limiter import UploadThrottle, parse_retry_after
+from src.scheduler import SCHEDULES, estimate_tokens, list_schedule_makespan, makespan_report, order_by_cost
+from src.sharding import assign_shards, merge_progress, merge_references, parse_shard, shard_file
+from src.skip_rules import SkipRules, GENERATED_REASONS, IGNORE_FILE_NAME
+from src.symbol_index import SymbolIndex, symbols_from_analysis
 from src.text_chunker import TextChunker
 
 # Load environment variables
@@ -36,60 +66,729 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Include files are Pascal fragments and are chunked like units
+SOURCE_EXTENSIONS = ('.pas', '.dfm', '.inc')
+# Chunks are deduplicated, uploaded and acknowledged in the progress file in batches of this size
+STREAM_BATCH_CHUNKS = 32
+# Responses meaning LightRAG (or the LLM behind it) is overloaded; the batch is retried after slowing down
+THROTTLE_STATUSES = (429, 503)
+THROTTLE_RETRIES = 5
+# Seconds an upload may take before it counts as an overload response and is retried
+UPLOAD_TIMEOUT_SECONDS = 120.0
+# Analyses kept in memory, so a unit analyzed while pairing its form is not parsed again
+ANALYSIS_MEMO_ENTRIES = 8
+
+
+class UploadError(RuntimeError):
+    """LightRAG did not accept a batch of a file's chunks"""
+
 
 class EnhancedDelphiProcessor:
     """Enhanced Delphi code processor with advanced features"""
     
-    def __init__(self, progress_file: str = ".lightrag_progress.json"):
-        self.file_processor = FileProcessor(progress_file)
-        self.text_chunker = TextChunker(model_name=EMBEDDING_MODEL, max_tokens=8000)
-        self.ast_analyzer = DelphiASTAnalyzer()
+    def __init__(self, progress_file: str = ".lightrag_progress.json",
+                 analysis_cache_file: Optional[str] = ".lightrag_analysis_cache.sqlite",
+                 analysis_cache_max_mb: int = 256,
+                 dedup: bool = True,
+                 chunk_refs_file: Optional[str] = ".lightrag_chunk_refs.json",
+                 dedup_strip_comments: bool = False,
+                 near_dup_policy: Optional[str] = None,
+                 near_dup_threshold: float = 0.9,
+                 workers: int = 1,
+                 docs_per_minute: float = 60.0,
+                 tokens_per_minute: float = 0.0,
+                 collect_metrics: bool = False,
+                 profile_memory: bool = False,
+                 ignore_file: Optional[str] = IGNORE_FILE_NAME,
+                 max_file_mb: float = 0.0,
+                 only_extensions: Optional[List[str]] = None,
+                 skip_patterns: Optional[List[str]] = None,
+                 discovery_threads: int = DEFAULT_DISCOVERY_THREADS,
+                 shard: Optional[Tuple[int, int]] = None,
+                 schedule: str = "discovery",
+                 archive_name: Optional[str] = None,
+                 throttle_uploads: bool = False,
+                 upload_timeout: float = UPLOAD_TIMEOUT_SECONDS,
+                 max_pending_docs: int = 0,
+                 resume_pending_docs: Optional[int] = None,
+                 pipeline_poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 document_style: str = "json",
+                 document_fields: Optional[List[str]] = None,
+                 document_template: Optional[str] = None,
+                 export_store: Optional[str] = None,
+                 dfm_binary: str = "summarize",
+                 dfm_chunk_tokens: int = DFM_CHUNK_TOKENS,
+                 symbol_index_file: Optional[str] = None):
+        # Per-stage timings are only recorded when asked for; otherwise the timers are no-ops
+        self.memory_profiler = NULL_PROFILER
+        if profile_memory:
+            # tracemalloc hooks into the same stage timers, so profiling implies timing
+            self.memory_profiler = MemoryProfiler()
+            self.memory_profiler.start()
+            self.metrics = MetricsRecorder(memory=self.memory_profiler)
+        else:
+            self.metrics = MetricsRecorder() if collect_metrics else NULL_METRICS
+        self.file_processor = FileProcessor(progress_file, metrics=self.metrics)
+        self.text_chunker = TextChunker(model_name=EMBEDDING_MODEL, max_tokens=8000, metrics=self.metrics)
+        self._ast_analyzer = None
+        self.recent_analyses: OrderedDict = OrderedDict()
+        self.analysis_cache = None
+        if analysis_cache_file:
+            self.analysis_cache = AnalysisCache(
+                analysis_cache_file,
+                max_bytes=analysis_cache_max_mb * 1024 * 1024,
+                version=self.ast_analyzer.version_key()
+            )
+        # Class/routine locations of every committed unit, for the `lookup` command
+        self.symbol_index = SymbolIndex(symbol_index_file) if symbol_index_file else None
+        self.deduplicator = None
+        # An export leaves deduplication to the run that loads the store
+        if dedup and not export_store:
+            self.deduplicator = ChunkDeduplicator(chunk_refs_file, strip_comments=dedup_strip_comments)
+        self.near_duplicate_detector = None
+        if near_dup_policy and not export_store:
+            self.near_duplicate_detector = NearDuplicateDetector(
+                threshold=near_dup_threshold, policy=near_dup_policy)
+        self.workers = max(1, workers)
+        # Worker processes only read, analyze and chunk, so they need just these settings
+        self.worker_config = {
+            "progress_file": progress_file,
+            "analysis_cache_file": analysis_cache_file,
+            "analysis_cache_max_mb": analysis_cache_max_mb,
+            "collect_metrics": collect_metrics,
+            "profile_memory": profile_memory,
+            "dfm_binary": dfm_binary,
+            "dfm_chunk_tokens": dfm_chunk_tokens
+        }
+        # Skip rules are rooted at the processed directory, so they are built in process_directory
+        self.skip_config = {
+            "ignore_file": ignore_file,
+            "max_bytes": int(max_file_mb * 1024 * 1024),
+            "extensions": only_extensions,
+            "filename_patterns": skip_patterns
+        }
+        self.skip_reasons: Dict[str, int] = {}
+        self.discovery_threads = discovery_threads
+        # (index, count): only process this host's share of the discovered files
+        self.shard = shard
+        # Order in which files are handed to the workers (see src/scheduler.py)
+        self.schedule = schedule
+        # Archive members are recorded under this name (default: the archive's file name)
+        self.archive_name = archive_name
+        # (start, end) wall-clock time of each file prepared in a worker, for the makespan report
+        self.prepare_spans: List[Tuple[float, float]] = []
+        self.files_queued = 0
+        self.lightrag = LightRAGClient(LIGHTRAG_API_URL)
+        # Stale documents are deleted in batches across files
+        self.stale_doc_ids: List[str] = []
+        self.discovered_files: set = set()
+        # Contents of archive members read by discovery, handed to prepare_files by key (members that
+        # are streamed are memory-mapped temporary files)
+        self.member_data: Dict[str, bytes] = {}
+        self.docs_per_minute = docs_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Without throttling the rates only feed the dry-run estimate; Retry-After is always honoured
+        self.throttle = (UploadThrottle(docs_per_minute, tokens_per_minute) if throttle_uploads
+                         else UploadThrottle())
+        self.upload_timeout = upload_timeout
+        # Pauses uploads while LightRAG's indexing queue is too long and times how long indexing takes
+        self.pipeline_monitor = PipelineMonitor(self.lightrag, max_pending_docs, resume_pending_docs,
+                                                pipeline_poll_seconds, metrics=self.metrics)
+        # With a chunk store, prepared chunks are written there for a later `load` instead of uploaded
+        self.chunk_store = ChunkStoreWriter(export_store) if export_store else None
+        # Renders chunks as document text; changing it changes the document ids
+        self.document_formatter = DocumentFormatter(document_style, document_fields, document_template)
+        # Forms are chunked by component; bulky binary properties (Picture.Data, ...) are summarized or dropped
+        self.dfm_binary = dfm_binary
+        self.dfm_chunk_tokens = dfm_chunk_tokens
+        self.dry_run_totals: Dict[str, Dict[str, int]] = {}
         self.stats = {
             "total_files": 0,
             "processed_files": 0,
             "skipped_files": 0,
             "failed_files": 0,
             "total_chunks": 0,
-            "auto_generated_files": 0
+            "auto_generated_files": 0,
+            "rule_skipped_files": 0,
+            "analysis_cache_hits": 0,
+            "analysis_cache_misses": 0,
+            "duplicate_chunks": 0,
+            "dedup_tokens_saved": 0,
+            "dedup_requests_saved": 0,
+            "near_duplicate_chunks": 0,
+            "near_dup_tokens_saved": 0,
+            "changed_files": 0,
+            "deleted_files": 0,
+            "renamed_files": 0,
+            "deleted_documents": 0,
+            "handed_off_files": 0,
+            "resumed_chunks": 0,
+            "exported_chunks": 0,
+            "header_tokens": 0,
+            "header_tokens_saved": 0,
+            "dfm_binary_bytes": 0,
+            "binary_forms": 0,
+            "paired_handlers": 0,
+            "unpaired_events": 0,
+            "indexed_files": 0,
+            "throttled_requests": 0,
+            "throttle_wait_seconds": 0.0,
+            "backpressure_wait_seconds": 0.0
         }
     
-    def process_directory(self, directory: str, resume: bool = True, reset: bool = False):
-        """Process all Delphi files in a directory"""
-        logger.info(f"Processing directory: {directory}")
+    @property
+    def ast_analyzer(self):
+        """The tree-sitter analyzer, created on first use so loading a chunk store needs no parser"""
+        if self._ast_analyzer is None:
+            from src.delphi_ast_analyzer import DelphiASTAnalyzer
+            self._ast_analyzer = DelphiASTAnalyzer()
+        return self._ast_analyzer
+    
+    def process_directory(self, directory: str, resume: bool = True, reset: bool = False,
+                          dry_run: bool = False):
+        """
+        Process all Delphi files in a directory (dry_run: analyze and chunk without uploading)
         
-        if reset:
+        `directory` may also be a zip or tar archive. Its members are streamed without
+        extracting them and are recorded as `<archive name>/<archive-relative path>`. The
+        name is the archive's file name unless `archive_name` was given, so drops of the
+        same tree processed under one name only re-process what changed.
+        """
+        logger.info(f"Processing directory: {directory}" + (" (dry run)" if dry_run else ""))
+        
+        if reset and not dry_run:
             logger.info("Resetting progress...")
             self.file_processor.reset_progress()
+            if self.deduplicator is not None:
+                self.deduplicator.reset()
         
-        # Find all Delphi files
-        delphi_files = self.file_processor.find_delphi_files(directory)
-        self.stats["total_files"] = len(delphi_files)
-        logger.info(f"Found {len(delphi_files)} Delphi files")
+        if dry_run:
+            self.use_estimating_deduplicator(keep_references=not reset)
         
-        # Process each file
-        for file_path in delphi_files:
-            if resume and self.file_processor.is_file_processed(file_path):
-                logger.info(f"Skipping already processed: {file_path}")
-                self.stats["skipped_files"] += 1
-                continue
-            
+        # Files stream into the pipeline while discovery is still walking the tree
+        self.stats["total_files"] = 0
+        self.files_queued = 0
+        resume = resume and not reset
+        if self.shard is not None and is_archive(directory):
+            raise ValueError("Sharding needs a directory; extract the archive or ingest it on one host")
+        if is_archive(directory):
+            if self.schedule != "discovery":
+                # Reordering would hold every member's content in memory until it is processed
+                logger.warning("Archives are processed in archive order, ignoring --schedule")
+            skip_rules = SkipRules(None, **self.skip_config)
+            key_prefix = self.archive_name or os.path.basename(directory)
+            self.process_pending(".", self.iter_archive_files(directory, skip_rules, resume=resume,
+                                                              key_prefix=key_prefix),
+                                 dry_run=dry_run)
+            # Only files recorded under this archive's name can have vanished from it
+            vanished_root = key_prefix + "/"
+        else:
+            skip_rules = SkipRules(directory, **self.skip_config)
+            pending = self.iter_pending_files(directory, skip_rules, resume=resume)
+            self.process_pending(directory, self.schedule_files(pending), dry_run=dry_run)
+            vanished_root = directory
+        if not reset:
+            self.remove_vanished_files(vanished_root, dry_run)
+        self.flush_stale_documents()
+        if not dry_run:
+            if self.shard is not None:
+                # merge-manifests adds up the per-shard statistics
+                self.file_processor.progress_data["shard"] = "{}/{}".format(*self.shard)
+                self.file_processor.progress_data["stats"] = dict(self.stats)
+            # The file count is only known once discovery has finished
+            self.file_processor.save_progress()
+        
+        # Print final statistics
+        self.print_statistics()
+        if dry_run:
+            self.print_dry_run_report()
+    
+    def use_estimating_deduplicator(self, keep_references: bool = True):
+        """Estimate against what is already uploaded, but leave the reference table untouched"""
+        if self.deduplicator is None:
+            return
+        estimator = ChunkDeduplicator(None, strip_comments=self.deduplicator.strip_comments)
+        if keep_references:
+            estimator.references = copy.deepcopy(self.deduplicator.references)
+        self.deduplicator = estimator
+    
+    def process_pending(self, directory: str, pending_files: Iterable[str], dry_run: bool = False):
+        """Prepare and commit each pending file (reading, analysis and chunking run in the worker pool)"""
+        for position, (file_path, prepared) in enumerate(self.prepare_files(pending_files), 1):
+            self.metrics.gauge("files_remaining", self.files_queued - position)
             try:
-                self.process_file(file_path)
+                if isinstance(prepared, Exception):
+                    raise prepared
+                if "prepare_span" in prepared:
+                    self.prepare_spans.append(prepared["prepare_span"])
+                self.commit_file(prepared, dry_run=dry_run)
                 self.stats["processed_files"] += 1
+                if dry_run:
+                    self.record_dry_run(directory, prepared)
             except Exception as e:
                 logger.error(f"Failed to process {file_path}: {e}")
                 self.stats["failed_files"] += 1
+                # A streamed file's chunk generator leaves its memory tracking scope now, not when collected
+                chunks = prepared.get("chunks") if isinstance(prepared, dict) else None
+                if hasattr(chunks, "close"):
+                    chunks.close()
+    
+    def process_git_changes(self, directory: str, since: Optional[str] = None, reset: bool = False,
+                            dry_run: bool = False):
+        """
+        Process only the files changed between the last ingested commit (or `since`) and HEAD
+        
+        Deleted files have their documents removed, renamed files keep their documents and
+        added or modified files go through the normal pipeline. Without a recorded commit
+        the whole tree is processed once. The commit is recorded only if nothing failed.
+        """
+        head = head_commit(directory)
+        if not reset:
+            since = since or self.file_processor.progress_data.get("last_commit")
+        if reset or since is None:
+            logger.info("No ingested commit recorded yet, processing the whole tree")
+            self.process_directory(directory, reset=reset, dry_run=dry_run)
+            self.record_ingested_commit(head, dry_run)
+            return
+        if since == head:
+            logger.info(f"Already ingested up to {head[:12]}, nothing to do")
+            return
+        
+        changes = changed_files(directory, since, head, SOURCE_EXTENSIONS)
+        logger.info(f"Processing {len(changes)} changed files between {since[:12]} and {head[:12]}"
+                    + (" (dry run)" if dry_run else ""))
+        if dry_run:
+            self.use_estimating_deduplicator()
+        
+        stale_doc_ids: List[str] = []
+        to_process: List[str] = []
+        for change in changes:
+            file_path = os.path.join(directory, change.path)
+            if change.status == "D":
+                stale_doc_ids.extend(self.remove_file(file_path, dry_run))
+            elif change.status == "R":
+                old_path = os.path.join(directory, change.old_path)
+                # Identical content under a new name keeps its documents, nothing is re-embedded
+                if change.similarity == 100 and self.rename_file(old_path, file_path, dry_run):
+                    continue
+                stale_doc_ids.extend(self.remove_file(old_path, dry_run))
+                to_process.append(file_path)
+            else:
+                # Modified files replace their own documents when they are committed
+                to_process.append(file_path)
+        self.delete_documents(stale_doc_ids, dry_run)
+        # Forms whose event handlers were paired from a changed unit are paired again
+        for file_path in self.file_processor.dependent_files(to_process):
+            if file_path not in to_process and os.path.exists(file_path):
+                to_process.append(file_path)
+        
+        skip_rules = SkipRules(directory, **self.skip_config)
+        self.stats["total_files"] = len(to_process)
+        self.files_queued = 0
+        self.process_pending(directory, self.schedule_files(self.iter_changed_files(to_process, skip_rules)),
+                             dry_run=dry_run)
+        self.flush_stale_documents()
+        self.record_ingested_commit(head, dry_run)
         
-        # Print final statistics
         self.print_statistics()
+        if dry_run:
+            self.print_dry_run_report()
+    
+    def record_ingested_commit(self, commit: str, dry_run: bool = False):
+        """Remember the commit the index now reflects, unless some file failed"""
+        if dry_run:
+            return
+        if self.stats["failed_files"]:
+            logger.warning(f"{self.stats['failed_files']} files failed, keeping the previous ingested commit "
+                           f"so they are retried next run")
+            return
+        self.file_processor.progress_data["last_commit"] = commit
+        self.file_processor.save_progress()
+        logger.info(f"Ingested up to commit {commit[:12]}")
+    
+    def iter_changed_files(self, file_paths: List[str], skip_rules: SkipRules) -> Iterator[str]:
+        """Yield changed files that pass the skip rules"""
+        for file_path in file_paths:
+            with self.metrics.stage("skip_rules"):
+                reason = skip_rules.check(file_path)
+            if reason is not None:
+                self.record_skip(file_path, reason)
+                continue
+            self.files_queued += 1
+            yield file_path
+    
+    def remove_vanished_files(self, directory: str, dry_run: bool = False):
+        """Remove files recorded under `directory` that discovery no longer finds (deleted or now ignored)"""
+        vanished = [path for path in self.file_processor.manifest_files(directory)
+                    if path not in self.discovered_files]
+        for file_path in vanished:
+            self.delete_documents(self.remove_file(file_path, dry_run), dry_run)
+    
+    def remove_file(self, file_path: str, dry_run: bool = False) -> List[str]:
+        """Forget a deleted file and return the documents it uploaded (to be deleted by the caller)"""
+        entry = self.file_processor.file_entry(file_path)
+        doc_ids = entry.get("doc_ids", []) if entry else []
+        logger.info(f"Removing {file_path} ({len(doc_ids)} documents)")
+        self.stats["deleted_files"] += 1
+        if dry_run:
+            return doc_ids
+        if self.chunk_store is not None:
+            self.chunk_store.remove_file(file_path)
+        if self.symbol_index is not None:
+            self.symbol_index.remove_file(file_path)
+        self.file_processor.forget_file(file_path)
+        retained = self.release_dedup_references(file_path)
+        self.file_processor.save_progress()
+        return [doc_id for doc_id in doc_ids if doc_id not in retained]
+    
+    def release_dedup_references(self, file_path: str) -> set:
+        """
+        Drop a file's chunk locations from the dedup table
+        
+        Documents the file uploaded for bodies other files still use are handed over to the
+        first remaining file instead of being deleted. Returns the ids of those documents.
+        """
+        if self.deduplicator is None:
+            return set()
+        retained = self.deduplicator.forget_file(file_path)
+        for doc_id, owner in retained.items():
+            self.file_processor.adopt_documents(owner, [doc_id])
+        self.deduplicator.save_references()
+        return set(retained)
+    
+    def rename_file(self, old_path: str, new_path: str, dry_run: bool = False) -> bool:
+        """Move an already processed file's record to its new name; False if it was never processed"""
+        if not self.file_processor.is_file_processed(old_path):
+            return False
+        logger.info(f"Renamed {old_path} -> {new_path}, keeping its documents")
+        self.stats["renamed_files"] += 1
+        if dry_run:
+            return True
+        if self.chunk_store is not None:
+            self.chunk_store.rename_file(old_path, new_path)
+        if self.symbol_index is not None:
+            self.symbol_index.rename_file(old_path, new_path)
+        self.file_processor.rename_file(old_path, new_path)
+        if self.deduplicator is not None:
+            self.deduplicator.rename_file(old_path, new_path)
+            self.deduplicator.save_references()
+        self.file_processor.save_progress()
+        return True
+    
+    def index_directory(self, directory: str):
+        """
+        Bring the symbol index up to date with the units under a directory, without LightRAG
+        
+        Only units whose content changed since they were indexed, or that an ingest run was
+        too large to analyze, are analyzed again (through the analysis cache); units no longer
+        found are dropped. Nothing is chunked or uploaded
+        and the progress file is left alone.
+        """
+        logger.info(f"Indexing symbols: {directory}")
+        skip_rules = SkipRules(directory, **self.skip_config)
+        found = set()
+        for file_path in self.file_processor.iter_delphi_files(directory, ('.pas', '.inc'), skip_rules=skip_rules,
+                                                               threads=self.discovery_threads):
+            self.stats["total_files"] += 1
+            size = self.file_processor.stat_cache[file_path][0]
+            if skip_rules.check(file_path, size=size) is not None:
+                continue
+            found.add(file_path)
+            try:
+                content_hash = self.file_processor.file_hash(file_path)
+                if self.symbol_index.file_hash(file_path) == content_hash:
+                    self.stats["skipped_files"] += 1
+                    continue
+                # Units of any size are analyzed whole here, including those ingest runs left for later
+                content, _ = self.file_processor.read_file_with_encoding(file_path)
+                if self.file_processor.is_auto_generated(file_path, content):
+                    continue
+                symbols = symbols_from_analysis(self.analyze_pas_content(content), content)
+            except Exception as e:
+                logger.error(f"Failed to index {file_path}: {e}")
+                self.stats["failed_files"] += 1
+                continue
+            self.symbol_index.update_file(file_path, symbols, content_hash)
+            self.stats["indexed_files"] += 1
+        prefix = os.path.join(directory, "")
+        for file_path in self.symbol_index.indexed_files():
+            if file_path.startswith(prefix) and file_path not in found:
+                self.symbol_index.remove_file(file_path)
+                self.stats["deleted_files"] += 1
+        summary = self.symbol_index.summary()
+        logger.info(f"Units analyzed: {self.stats['indexed_files']}, unchanged: {self.stats['skipped_files']}, "
+                    f"removed: {self.stats['deleted_files']}, failed: {self.stats['failed_files']}")
+        logger.info(f"Symbol index {self.symbol_index.index_file}: {summary['symbols']} symbols "
+                    f"in {summary['files']} files")
+    
+    def delete_documents(self, doc_ids: List[str], dry_run: bool = False):
+        """Queue stale documents for deletion; they are sent in batches"""
+        if not doc_ids:
+            return
+        if dry_run:
+            logger.info(f"  Would delete {len(doc_ids)} stale documents")
+            self.stats["deleted_documents"] += len(doc_ids)
+            return
+        self.stale_doc_ids.extend(doc_ids)
+        if len(self.stale_doc_ids) >= self.lightrag.delete_batch_size:
+            self.flush_stale_documents()
+    
+    def flush_stale_documents(self):
+        """Delete the queued stale documents from LightRAG"""
+        if not self.stale_doc_ids:
+            return
+        doc_ids, self.stale_doc_ids = self.stale_doc_ids, []
+        deleted = self.lightrag.delete_documents(doc_ids)
+        self.stats["deleted_documents"] += len(deleted)
+        logger.info(f"Deleted {len(deleted)} of {len(doc_ids)} stale documents")
+        if len(deleted) < len(doc_ids):
+            logger.warning(f"{len(doc_ids) - len(deleted)} stale documents could not be deleted; "
+                           f"run the reconcile command to remove them later")
+    
+    def iter_pending_files(self, directory: str, skip_rules: SkipRules, resume: bool = True) -> Iterator[str]:
+        """Yield discovered files that still need processing, as soon as discovery finds them"""
+        file_processor = self.file_processor
+        discovered = file_processor.iter_delphi_files(directory, SOURCE_EXTENSIONS, skip_rules=skip_rules,
+                                                      threads=self.discovery_threads)
+        if self.shard is not None:
+            discovered = self.select_shard_files(directory, discovered)
+        for file_path in discovered:
+            self.stats["total_files"] += 1
+            self.discovered_files.add(file_path)
+            if resume and file_processor.is_file_processed(file_path):
+                # Changed files are re-processed and replace their old documents when committed;
+                # so is a form whose unit changed, to pair its event handlers again
+                changed = file_processor.file_changed(file_path)
+                if not changed and not file_processor.dependencies_changed(file_path):
+                    logger.info(f"Skipping already processed: {file_path}")
+                    self.stats["skipped_files"] += 1
+                    continue
+                logger.info(f"Changed since it was processed: {file_path}" if changed
+                            else f"Unit changed since the form was processed: {file_path}")
+                self.stats["changed_files"] += 1
+            # Rules look at the path, a stat and at most the first few KB, so skipped
+            # files never pay for a full read, encoding detection or parsing
+            with self.metrics.stage("skip_rules"):
+                reason = skip_rules.check(file_path, size=file_processor.stat_cache[file_path][0])
+            if reason is not None:
+                self.record_skip(file_path, reason)
+                continue
+            self.files_queued += 1
+            yield file_path
+        file_processor.progress_data["total_files"] = self.stats["total_files"]
+        logger.info(f"Found {self.stats['total_files']} Delphi files")
+    
+    def iter_archive_files(self, archive_path: str, skip_rules: SkipRules, resume: bool = True,
+                           key_prefix: str = "") -> Iterator[str]:
+        """
+        Yield archive members that still need processing, keyed by `key_prefix/` and their
+        archive-relative path (skip rules see the archive-relative path)
+        
+        Members are read in archive order (tar archives are a single forward stream), so the
+        skip rules and the change check run on each member's header and first bytes before
+        its content is read. The content of a queued member waits in `member_data` until
+        prepare_files picks it up; members large enough to be streamed wait in a memory-mapped
+        temporary file instead, so they are chunked in windows like a file on disk.
+        """
+        file_processor = self.file_processor
+        ignore_file = self.skip_config["ignore_file"]
+        first_names = (ignore_file,) if ignore_file else ()
+        for member, reader in ArchiveSource(archive_path).iter_members(first_names):
+            if ignore_file and posixpath.basename(member.path) == ignore_file:
+                # In tar archives an ignore file only applies to the members stored after it
+                lines = reader.read().decode("utf-8", errors="ignore").splitlines()
+                skip_rules.add_ignore_file(posixpath.dirname(member.path), lines)
+                continue
+            if not member.path.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            file_path = posixpath.join(key_prefix, member.path)
+            self.stats["total_files"] += 1
+            self.discovered_files.add(file_path)
+            file_processor.stat_cache[file_path] = (member.size, member.mtime_ns)
+            load = reader.spool if self.should_stream(file_path, member.size) else reader.read
+            if resume and file_processor.is_file_processed(file_path):
+                # Archive timestamps often change between drops, so equal sizes fall back to the content hash
+                if not file_processor.file_changed(
+                        file_path, compute_hash=lambda: hashlib.sha256(load()).hexdigest()):
+                    logger.info(f"Skipping already processed: {file_path}")
+                    self.stats["skipped_files"] += 1
+                    continue
+                logger.info(f"Changed since it was processed: {file_path}")
+                self.stats["changed_files"] += 1
+            with self.metrics.stage("skip_rules"):
+                reason = skip_rules.check(member.path, size=member.size, read_head=reader.head)
+            if reason is not None:
+                self.record_skip(file_path, reason)
+                continue
+            with self.metrics.stage("archive_read", bytes=member.size):
+                self.member_data[file_path] = load()
+            self.files_queued += 1
+            yield file_path
+        file_processor.progress_data["total_files"] = self.stats["total_files"]
+        logger.info(f"Found {self.stats['total_files']} Delphi files in {archive_path}")
+    
+    def select_shard_files(self, directory: str, file_paths: Iterable[str]) -> List[str]:
+        """
+        Keep only this shard's files
+        
+        The assignment needs every file's size, so discovery has to finish first. It hashes
+        paths relative to `directory`, so hosts mounting the tree elsewhere agree on it.
+        Files recorded here that now belong to another shard are handed off: their record
+        is dropped without deleting documents, which the new owner replaces when it
+        processes them.
+        """
+        index, count = self.shard
+        file_paths = list(file_paths)
+        relative = {file_path: os.path.relpath(file_path, directory) for file_path in file_paths}
+        assignment = assign_shards(
+            ((relative[file_path], self.file_processor.stat_cache[file_path][0]) for file_path in file_paths), count)
+        mine = [file_path for file_path in file_paths if assignment[relative[file_path]] == index]
+        # Every existing file counts as discovered, so only files gone from the tree are removed
+        self.discovered_files.update(file_paths)
+        owned = set(mine)
+        for file_path in self.file_processor.manifest_files(directory):
+            if file_path in relative and file_path not in owned:
+                logger.info(f"Handing off {file_path} to shard {assignment[relative[file_path]]}/{count}")
+                self.file_processor.forget_file(file_path)
+                self.release_dedup_references(file_path)
+                self.stats["handed_off_files"] += 1
+        shard_bytes = sum(self.file_processor.stat_cache[file_path][0] for file_path in mine)
+        logger.info(f"Shard {index}/{count}: {len(mine)} of {len(file_paths)} files, {shard_bytes} bytes")
+        return mine
+    
+    def schedule_files(self, file_paths: Iterable[str]) -> Iterable[str]:
+        """
+        Order pending files for the workers according to `schedule`
+        
+        "lpt" hands out the largest estimated files first, so a huge unit found late can't
+        stretch the run; "small-first" makes many files searchable early. Both wait for
+        discovery to finish. Estimates are tokens: last run's count scaled by the size
+        change, or the size in bytes divided by BYTES_PER_TOKEN.
+        """
+        if self.schedule == "discovery":
+            return file_paths
+        costs = []
+        for file_path in file_paths:
+            stat = self.file_processor.stat_cache.get(file_path)
+            size = stat[0] if stat is not None else os.path.getsize(file_path)
+            costs.append((file_path, estimate_tokens(size, self.file_processor.file_entry(file_path))))
+        ordered = order_by_cost(costs, self.schedule)
+        estimates = dict(costs)
+        planned = list_schedule_makespan((estimates[path] for path in ordered), self.workers)
+        total = sum(estimates.values())
+        ideal = max(total / self.workers, max(estimates.values(), default=0))
+        logger.info(f"Scheduled {len(ordered)} files ({self.schedule}): estimated makespan "
+                    f"{planned:,.0f} tokens per worker, ideal {ideal:,.0f}")
+        return ordered
+    
+    def record_skip(self, file_path: str, reason: str):
+        """Count a file rejected by the skip rules before it was read"""
+        logger.info(f"Skipping ({reason}): {file_path}")
+        self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+        if reason in GENERATED_REASONS:
+            self.stats["auto_generated_files"] += 1
+        else:
+            self.stats["rule_skipped_files"] += 1
+    
+    def prepare_files(self, file_paths: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+        """Yield (file_path, prepared result or exception), using worker processes when configured"""
+        if self.workers <= 1:
+            for file_path in file_paths:
+                yield self._prepare_locally(file_path)
+            return
+        
+        remaining = iter(file_paths)
+        local_files: List[str] = []
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.worker_config,)) as executor:
+            # Keep a bounded number of files in flight so prepared chunks don't pile up in memory
+            pending = {}
+            
+            def submit_next():
+                for file_path in remaining:
+                    # Streamed chunks are a lazy generator, which can't come back from a worker
+                    if self.should_stream(file_path):
+                        local_files.append(file_path)
+                        continue
+                    data = self.member_data.pop(file_path, None)
+                    pending[executor.submit(_prepare_in_worker, file_path, data)] = file_path
+                    return
+            
+            for _ in range(self.workers * 4):
+                submit_next()
+            while pending or local_files:
+                while local_files:
+                    yield self._prepare_locally(local_files.pop(0))
+                if not pending:
+                    break
+                self.metrics.gauge("prepare_in_flight", len(pending))
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    try:
+                        yield file_path, future.result()
+                    except Exception as e:
+                        yield file_path, e
+                    submit_next()
+    
+    def _prepare_locally(self, file_path: str) -> Tuple[str, Any]:
+        try:
+            return file_path, self.prepare_file(file_path, self.member_data.pop(file_path, None))
+        except Exception as e:
+            return file_path, e
+    
+    def should_stream(self, file_path: str, size: Optional[int] = None) -> bool:
+        """Very large files are read and chunked as a stream instead of being loaded whole"""
+        try:
+            return self.file_processor.estimate_file_size_category(file_path, size) == "very_large"
+        except OSError:
+            return False
     
     def process_file(self, file_path: str):
         """Process a single Delphi file"""
+        self.commit_file(self.prepare_file(file_path))
+    
+    def prepare_file(self, file_path: str, data: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Read, analyze and chunk a file without uploading or touching the progress file
+        
+        `data` is the content of an archive member; `file_path` is then only its key.
+        """
         logger.info(f"Processing: {file_path}")
+        size = len(data) if data is not None else os.path.getsize(file_path)
+        tracked = contextlib.ExitStack()
+        with tracked:
+            tracked.enter_context(self.memory_profiler.track_file(file_path, size))
+            with self.metrics.stage("prepare_file", bytes=size):
+                prepared = self._prepare_file(file_path, size, data)
+            if self.memory_profiler.enabled and not isinstance(prepared["chunks"], list):
+                # Streamed chunks are made while they are uploaded; the file's peak includes that
+                prepared["chunks"] = _exhaust_within(prepared["chunks"], tracked.pop_all())
+        return prepared
+    
+    def _prepare_file(self, file_path: str, size: int, data: Optional[bytes] = None) -> Dict[str, Any]:
+        prepared = {
+            "file_path": file_path,
+            "bytes": size,
+            # Lets the next run tell a touched file from a changed one
+            "content_hash": (hashlib.sha256(data).hexdigest() if data is not None
+                             else self.file_processor.file_hash(file_path)),
+            "auto_generated": False,
+            "chunks": []
+        }
+        
+        if Path(file_path).suffix.lower() == '.dfm' and self.is_binary_form(file_path, data):
+            return self.prepare_binary_form(prepared, data)
+        
+        if self.should_stream(file_path, size):
+            return self.prepare_streamed_file(prepared, data)
         
         # Read file with encoding detection
         try:
-            content, encoding = self.file_processor.read_file_with_encoding(file_path)
+            if data is not None:
+                content, encoding = self.file_processor.decode_bytes(data, file_path)
+            else:
+                content, encoding = self.file_processor.read_file_with_encoding(file_path)
             logger.info(f"  Detected encoding: {encoding}")
         except Exception as e:
             logger.error(f"  Failed to read file: {e}")
@@ -97,69 +796,426 @@ class EnhancedDelphiProcessor:
         
         # Check if it's auto-generated
         if self.file_processor.is_auto_generated(file_path, content):
-            logger.warning(f"  Skipping auto-generated file: {file_path}")
-            self.stats["auto_generated_files"] += 1
-            self.file_processor.mark_file_processed(file_path)
-            return
+            prepared["auto_generated"] = True
+            return prepared
         
         # Check file size category
-        size_category = self.file_processor.estimate_file_size_category(file_path)
+        size_category = self.file_processor.estimate_file_size_category(file_path, size)
         logger.info(f"  File size category: {size_category}")
         
         # Analyze and chunk the file
         file_extension = Path(file_path).suffix.lower()
-        chunks = []
         
-        if file_extension == '.pas':
-            chunks = self.process_pas_file(file_path, content, size_category)
+        if file_extension in ('.pas', '.inc'):
+            prepared["chunks"] = self.process_pas_file(file_path, content, size_category, prepared)
         elif file_extension == '.dfm':
-            chunks = self.process_dfm_file(file_path, content)
+            # Only forms read from disk have a unit next to them to pair event handlers with
+            prepared["chunks"] = self.process_dfm_file(file_path, content, prepared if data is None else None)
         
-        # Insert chunks to LightRAG
-        if chunks:
-            self.insert_chunks_to_lightrag(chunks)
-            self.stats["total_chunks"] += len(chunks)
+        return prepared
+    
+    def is_binary_form(self, file_path: str, data: Optional[bytes] = None) -> bool:
+        """Whether a .dfm is stored in binary (TPF0) form, by its magic bytes"""
+        if data is not None:
+            return is_binary_dfm(data[:len(BINARY_DFM_SIGNATURE)])
+        with open(file_path, 'rb') as f:
+            return is_binary_dfm(f.read(len(BINARY_DFM_SIGNATURE)))
+    
+    def prepare_binary_form(self, prepared: Dict[str, Any], data: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Decode a binary form into the same component tree as a text form and chunk it
+        
+        The form is read from the file (or archive member) as a stream, so no encoding
+        detection runs on binary data and image blobs are skipped instead of decoded.
+        """
+        file_path = prepared["file_path"]
+        logger.info("  Binary form (TPF0)")
+        if self.file_processor.is_auto_generated(file_path, ""):
+            prepared["auto_generated"] = True
+            return prepared
+        with self.metrics.stage("parse", bytes=prepared["bytes"]):
+            with (io.BytesIO(data) if data is not None else open(file_path, 'rb')) as stream:
+                form = read_binary_dfm(stream)
+        prepared["chunks"] = self.chunk_form_components(file_path, form, prepared if data is None else None)
+        self.stats["binary_forms"] += 1
+        return prepared
+    
+    def prepare_streamed_file(self, prepared: Dict[str, Any], data: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Set up lazy chunking for a very large file
+        
+        The file is memory-mapped and decoded in windows, the AST analysis is skipped
+        (tree-sitter needs the whole buffer) and chunks are produced section by section,
+        so only the chunk being built and the batch being uploaded are held in memory.
+        An archive member's `data` is decoded in the same windows.
+        """
+        file_path = prepared["file_path"]
+        logger.info("  Very large file, streaming chunks without AST analysis...")
+        if data is not None:
+            sample = data[:ENCODING_SAMPLE_BYTES]
+            encoding = self.file_processor.detect_encoding_bytes(sample, len(sample) == len(data), file_path)
+            open_lines = functools.partial(self.file_processor.iter_buffer_lines, data, encoding)
+        else:
+            encoding = self.file_processor.detect_encoding(file_path, sample_size=ENCODING_SAMPLE_BYTES)
+            open_lines = functools.partial(self.file_processor.iter_lines, file_path, encoding)
+        lines = open_lines()
+        logger.info(f"  Detected encoding: {encoding}")
+        
+        head = list(itertools.islice(lines, 10))
+        if self.file_processor.is_auto_generated(file_path, "\n".join(head)):
+            lines.close()
+            prepared["auto_generated"] = True
+            return prepared
+        if Path(file_path).suffix.lower() in ('.pas', '.inc'):
+            # Decoding the whole unit for tree-sitter would undo the streaming, so the symbol
+            # index records it without members or a hash and the `index` command analyzes it
+            prepared["symbols"] = []
+            prepared["symbols_pending"] = True
+        
+        prepared["chunks"] = self.iter_streamed_chunks(file_path, itertools.chain(head, lines), open_lines)
+        return prepared
+    
+    def iter_streamed_chunks(self, file_path: str, lines: Iterator[str],
+                             reopen: Optional[Callable[[], Iterator[str]]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield LightRAG chunks for a streamed file as soon as each section is complete
         
-        # Mark as processed
-        self.file_processor.mark_file_processed(file_path)
-        logger.info(f"  Completed: {len(chunks)} chunks created")
+        A form is parsed line by line into its component tree (binary data is not kept) and
+        chunked by component; if it can't be parsed, `reopen` reads it again as sections.
+        """
+        file_type = Path(file_path).suffix.lower().lstrip('.')
+        if file_type == "dfm":
+            try:
+                form = parse_dfm(lines)
+            except DfmSyntaxError as e:
+                if reopen is None:
+                    raise
+                logger.warning(f"  Could not parse form ({e}), chunking it as text")
+                lines = reopen()
+            else:
+                yield from self.chunk_form_components(file_path, form)
+                return
+        chunk_type = "partial_form" if file_type == "dfm" else "section"
+        for i, chunk_data in enumerate(self.text_chunker.iter_section_chunks(lines)):
+            yield {
+                "content": chunk_data["content"],
+                "metadata": {
+                    "file_path": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "file_type": file_type,
+                    "chunk_type": chunk_type,
+                    "section_type": chunk_data["metadata"]["type"],
+                    "chunk_index": i,
+                    "token_count": chunk_data["token_count"]
+                }
+            }
     
-    def process_pas_file(self, file_path: str, content: str, size_category: str) -> List[Dict[str, Any]]:
-        """Process a Pascal source file"""
+    def commit_file(self, prepared: Dict[str, Any], dry_run: bool = False) -> int:
+        """
+        Deduplicate and upload prepared chunks, then mark the file processed
+        
+        Chunks are handled in batches of STREAM_BATCH_CHUNKS. When a file needs several
+        batches, each accepted batch is acknowledged in the progress file, so a run that
+        stops halfway through resumes after the last accepted chunk. Returns the number
+        of chunks uploaded (in a dry run: that would be uploaded).
+        
+        Raises:
+            UploadError: LightRAG did not accept a batch; the file is not marked processed
+                and the batch's bodies are dropped from the dedup table
+        """
+        file_path = prepared["file_path"]
+        for key, value in prepared.get("stats_delta", {}).items():
+            self.stats[key] += value
+        self.metrics.merge(prepared.get("metrics_delta", {}))
+        if self.memory_profiler.enabled:
+            self.memory_profiler.current_file = file_path
+        if not dry_run:
+            self.index_symbols(prepared)
+        if self.chunk_store is not None and not dry_run:
+            return self.export_file(prepared)
+        prepared.update(chunk_count=0, chunk_tokens=0, uploaded_count=0, uploaded_tokens=0, requests=0,
+                        resumed_count=0, doc_ids=[])
+        
+        # A file processed before is being replaced: its old occurrences no longer count for dedup
+        previous = None if dry_run else self.file_processor.file_entry(file_path)
+        partial = None if dry_run else self.file_processor.partial_entry(file_path)
+        replaced = (previous or {}).get("doc_ids", []) + (partial or {}).get("doc_ids", [])
+        retained = self.release_dedup_references(file_path) if previous or partial else set()
+        # Chunks an interrupted run already got accepted for the same content are not sent again
+        acknowledged = set()
+        if partial and partial.get("sha256") == prepared.get("content_hash"):
+            acknowledged = set(partial["doc_ids"])
+        
+        if prepared["auto_generated"]:
+            logger.warning(f"  Skipping auto-generated file: {file_path}")
+            self.stats["auto_generated_files"] += 1
+            if not dry_run:
+                self.file_processor.mark_file_processed(file_path, content_hash=prepared.get("content_hash"))
+                self.delete_replaced_documents(replaced, [], retained)
+            return 0
+        
+        chunks = prepared["chunks"]
+        # A file uploaded in a single request has nothing to resume from
+        acknowledge = not isinstance(chunks, list) or len(chunks) > STREAM_BATCH_CHUNKS
+        for batch in _batched(chunks, STREAM_BATCH_CHUNKS):
+            prepared["chunk_count"] += len(batch)
+            prepared["chunk_tokens"] += sum(chunk["metadata"].get("token_count", 0) for chunk in batch)
+            self.stats["total_chunks"] += len(batch)
+            
+            # Upload each normalized chunk body only once across the whole tree
+            if batch and self.deduplicator is not None:
+                with self.metrics.stage("dedup"):
+                    batch = self.deduplicate_chunks(batch)
+            
+            # Skip, summarize or annotate chunks that are almost identical to an earlier one
+            if batch and self.near_duplicate_detector is not None:
+                with self.metrics.stage("near_duplicate"):
+                    batch = self.filter_near_duplicates(batch)
+            
+            if batch and acknowledged:
+                batch = self.skip_acknowledged(batch, acknowledged, prepared)
+            
+            if not batch:
+                continue
+            prepared["uploaded_count"] += len(batch)
+            prepared["requests"] += 1
+            self.count_header_tokens(batch)
+            if dry_run:
+                prepared["uploaded_tokens"] += sum(
+                    self.text_chunker.count_tokens(self.build_document(c)) for c in batch)
+                continue
+            
+            # Insert chunks to LightRAG
+            if not self.insert_chunks_to_lightrag(batch):
+                # These bodies never reached LightRAG, so later copies must not be skipped for them
+                if self.deduplicator is not None:
+                    self.deduplicator.discard(batch)
+                    self.deduplicator.save_references()
+                if self.near_duplicate_detector is not None:
+                    self.near_duplicate_detector.discard([chunk_location(chunk["metadata"]) for chunk in batch])
+                # The file is left unprocessed, keeping the batches already acknowledged,
+                # so the next run sends the rest again
+                raise UploadError(f"LightRAG did not accept {len(batch)} chunks of {file_path}")
+            prepared["doc_ids"].extend(chunk["doc_id"] for chunk in batch)
+            if self.deduplicator is not None:
+                for chunk in batch:
+                    if "content_hash" in chunk:
+                        self.deduplicator.set_document(chunk["content_hash"], chunk["doc_id"])
+                self.deduplicator.save_references()
+            if acknowledge:
+                self.file_processor.acknowledge_chunks(file_path, [chunk["doc_id"] for chunk in batch],
+                                                       prepared.get("content_hash"))
+        
+        if dry_run:
+            return prepared["uploaded_count"]
+        
+        if self.deduplicator is not None:
+            # New bodies are saved as LightRAG accepts them; this adds the locations of skipped copies
+            self.deduplicator.save_references()
+        # Mark as processed, remembering which documents belong to the file
+        self.file_processor.mark_file_processed(file_path, doc_ids=prepared["doc_ids"],
+                                                content_hash=prepared.get("content_hash"),
+                                                tokens=prepared["chunk_tokens"],
+                                                depends_on=prepared.get("depends_on"))
+        self.delete_replaced_documents(replaced, prepared["doc_ids"], retained)
+        if prepared["resumed_count"]:
+            logger.info(f"  Resumed after {prepared['resumed_count']} chunks accepted by an earlier run")
+        logger.info(f"  Completed: {prepared['chunk_count']} chunks created, {prepared['uploaded_count']} uploaded")
+        return prepared["uploaded_count"]
+    
+    def index_symbols(self, prepared: Dict[str, Any]):
+        """Replace a unit's rows in the symbol index with the symbols found while preparing it"""
+        if self.symbol_index is None or "symbols" not in prepared:
+            return
+        with self.metrics.stage("symbol_index"):
+            # Without a hash the unit counts as changed, so it is analyzed again later
+            content_hash = None if prepared.get("symbols_pending") else prepared.get("content_hash")
+            if self.symbol_index.update_file(prepared["file_path"], prepared["symbols"], content_hash):
+                self.stats["indexed_files"] += 1
+    
+    def export_file(self, prepared: Dict[str, Any]) -> int:
+        """Append a prepared file's chunks to the chunk store instead of uploading them"""
+        file_path = prepared["file_path"]
+        if prepared["auto_generated"]:
+            logger.warning(f"  Skipping auto-generated file: {file_path}")
+            self.stats["auto_generated_files"] += 1
+        chunks = [] if prepared["auto_generated"] else prepared["chunks"]
+        with self.metrics.stage("export") as timer:
+            entry = self.chunk_store.write_file(file_path, chunks, content_hash=prepared.get("content_hash"),
+                                                bytes=prepared["bytes"], auto_generated=prepared["auto_generated"],
+                                                depends_on=prepared.get("depends_on", {}))
+            timer.bytes = entry["length"]
+        self.stats["total_chunks"] += entry["chunks"]
+        self.stats["exported_chunks"] += entry["chunks"]
+        # The exporting host tracks changes like an upload run; the loading host keeps its own manifest
+        self.file_processor.mark_file_processed(file_path, content_hash=prepared.get("content_hash"),
+                                                tokens=entry["tokens"], depends_on=prepared.get("depends_on"))
+        logger.info(f"  Exported {entry['chunks']} chunks ({entry['length']} bytes compressed)")
+        return entry["chunks"]
+    
+    def load_chunk_store(self, store_path: str, resume: bool = True):
+        """
+        Upload the chunks of a store written by an export run
+        
+        The index is replayed in the order it was written: changed files replace their
+        documents, removed files lose them and renamed files keep them, exactly as in the run
+        that exported it. Files whose content hash is already recorded are skipped, and the
+        number of replayed index entries is kept in the progress file, so a load can be
+        repeated after further exports. Neither the source tree nor the parser is needed.
+        """
+        reader = ChunkStoreReader(store_path)
+        summary = summarize_store(reader)
+        logger.info(f"Loading chunk store {store_path}: {summary['files']} files, {summary['chunks']} chunks, "
+                    f"{summary['tokens']} tokens")
+        loaded = self.file_processor.progress_data.setdefault("chunk_stores", {})
+        key = os.path.abspath(store_path)
+        start = loaded.get(key, 0) if resume else 0
+        failed = False
+        for position, entry in reader.entries(start):
+            file_path = entry["file_path"]
+            try:
+                if entry.get("removed"):
+                    known = self.file_processor.file_entry(file_path) or self.file_processor.partial_entry(file_path)
+                    if known is not None:
+                        self.delete_documents(self.remove_file(file_path))
+                elif entry.get("renamed_from"):
+                    self.rename_file(entry["renamed_from"], file_path)
+                else:
+                    self.stats["total_files"] += 1
+                    previous = self.file_processor.file_entry(file_path)
+                    # A form is loaded again when the unit its event handlers were paired from changed
+                    if (resume and previous is not None and previous.get("sha256") == entry.get("content_hash")
+                            and self.file_processor.dependencies(file_path) == entry.get("depends_on", {})):
+                        self.stats["skipped_files"] += 1
+                    else:
+                        logger.info(f"Loading: {file_path}")
+                        self.commit_file({
+                            "file_path": file_path,
+                            "bytes": entry.get("bytes", 0),
+                            "content_hash": entry.get("content_hash"),
+                            "auto_generated": entry.get("auto_generated", False),
+                            "depends_on": entry.get("depends_on", {}),
+                            "chunks": reader.read_chunks(entry)
+                        })
+                        self.stats["processed_files"] += 1
+            except Exception as e:
+                logger.error(f"Failed to load {file_path}: {e}")
+                self.stats["failed_files"] += 1
+                failed = True
+            # Saved together with the manifest of the next processed file; after a failure
+            # the next load replays from the failed entry (loaded files are skipped by hash)
+            if not failed:
+                loaded[key] = position + 1
+        if not failed:
+            loaded[key] = len(reader.log)
+        self.flush_stale_documents()
+        self.file_processor.save_progress()
+    
+    def delete_replaced_documents(self, previous_ids: List[str], doc_ids: List[str],
+                                  retained: Optional[set] = None):
+        """
+        Delete the documents of a file's previous version that its new version no longer has
+        
+        `previous_ids` also holds what an interrupted run uploaded for the file. Unchanged
+        chunks hash to the same document id, so they are neither re-embedded nor deleted.
+        Documents handed over to other files by the dedup table (`retained`) are kept.
+        """
+        if not previous_ids:
+            return
+        keep = set(doc_ids) | (retained or set())
+        self.delete_documents([doc_id for doc_id in dict.fromkeys(previous_ids) if doc_id not in keep])
+    
+    def skip_acknowledged(self, chunks: List[Dict[str, Any]], acknowledged: set,
+                          prepared: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Drop chunks an interrupted run already got accepted, keeping their documents for the file"""
+        remaining = []
+        for chunk in chunks:
+            # The same id insert_chunks_to_lightrag derives from the rendered document
+            doc_id = compute_doc_id(self.build_document(chunk))
+            if doc_id not in acknowledged:
+                remaining.append(chunk)
+                continue
+            chunk["doc_id"] = doc_id
+            prepared["doc_ids"].append(doc_id)
+            if self.deduplicator is not None and "content_hash" in chunk:
+                self.deduplicator.set_document(chunk["content_hash"], doc_id)
+        prepared["resumed_count"] += len(chunks) - len(remaining)
+        self.stats["resumed_chunks"] += len(chunks) - len(remaining)
+        return remaining
+    
+    def record_dry_run(self, root: str, prepared: Dict[str, Any]):
+        """Add one committed (dry-run) file to the per-directory totals"""
+        directory = os.path.relpath(os.path.dirname(prepared["file_path"]) or ".", root)
+        totals = self.dry_run_totals.setdefault(directory, {
+            "files": 0, "bytes": 0, "chunks": 0, "documents": 0, "requests": 0, "tokens": 0
+        })
+        totals["files"] += 1
+        totals["bytes"] += prepared["bytes"]
+        totals["chunks"] += prepared["chunk_count"]
+        totals["documents"] += prepared["uploaded_count"]
+        totals["requests"] += prepared["requests"]
+        totals["tokens"] += prepared["uploaded_tokens"]
+    
+    def dry_run_report(self) -> Dict[str, Any]:
+        """Summarize the dry run with an upload time estimate based on the configured rates"""
+        total = {"files": 0, "bytes": 0, "chunks": 0, "documents": 0, "requests": 0, "tokens": 0}
+        for totals in self.dry_run_totals.values():
+            for key in total:
+                total[key] += totals[key]
+        
+        minutes = total["documents"] / self.docs_per_minute if self.docs_per_minute else 0.0
+        if self.tokens_per_minute:
+            minutes = max(minutes, total["tokens"] / self.tokens_per_minute)
+        return {
+            "directories": dict(sorted(self.dry_run_totals.items())),
+            "total": total,
+            "docs_per_minute": self.docs_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "estimated_upload_seconds": round(minutes * 60, 1),
+            "schedule": self.schedule,
+            "document_style": self.document_formatter.style,
+            "header_tokens_saved": self.stats["header_tokens_saved"],
+            "prepare_makespan": makespan_report(self.prepare_spans, self.workers)
+        }
+    
+    def print_dry_run_report(self):
+        """Print per-directory totals and the estimated upload time"""
+        report = self.dry_run_report()
+        logger.info("\n=== Dry Run Estimate ===")
+        logger.info(f"{'directory':<40} {'files':>7} {'chunks':>8} {'docs':>8} {'tokens':>10} {'bytes':>12}")
+        for directory, totals in report["directories"].items():
+            logger.info(f"{directory:<40} {totals['files']:>7} {totals['chunks']:>8} "
+                        f"{totals['documents']:>8} {totals['tokens']:>10} {totals['bytes']:>12}")
+        total = report["total"]
+        logger.info(f"{'TOTAL':<40} {total['files']:>7} {total['chunks']:>8} "
+                    f"{total['documents']:>8} {total['tokens']:>10} {total['bytes']:>12}")
+        logger.info(f"Insert requests: {total['requests']}")
+        logger.info(f"Estimated upload time: {timedelta(seconds=int(report['estimated_upload_seconds']))} "
+                    f"at {self.docs_per_minute} docs/min"
+                    + (f", {self.tokens_per_minute} tokens/min" if self.tokens_per_minute else ""))
+    
+    def process_pas_file(self, file_path: str, content: str, size_category: str,
+                         prepared: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Process a Pascal source file
+        
+        With `prepared`, the unit's classes and routines are kept there for the symbol index
+        (just the unit itself if the analysis fails).
+        """
         chunks = []
+        if prepared is not None:
+            prepared["symbols"] = symbols_from_analysis({}, content)
         
         try:
-            # Perform AST analysis
-            logger.info("  Performing AST analysis...")
-            functions = self.ast_analyzer.extract_functions(content)
-            classes = self.ast_analyzer.extract_classes(content)
-            ast_info = {
-                "functions": functions,
-                "classes": classes
-            }
+            # Perform AST analysis (or reuse a cached result for identical content)
+            ast_info = self.analyze_pas_content(content)
+            functions = ast_info["functions"]
+            classes = ast_info["classes"]
             logger.info(f"  Found {len(functions)} functions and {len(classes)} classes")
+            if prepared is not None:
+                prepared["symbols"] = symbols_from_analysis(ast_info, content)
             
-            # Use intelligent chunking for large files
-            if size_category in ["large", "very_large"]:
-                logger.info("  Using intelligent chunking for large file...")
-                raw_chunks = self.text_chunker.chunk_code_intelligently(content, ast_info)
-            else:
-                # For smaller files, use simple function/class-based chunking
-                raw_chunks = self.create_simple_chunks(file_path, content, ast_info)
-            
-            # Format chunks for LightRAG
-            for chunk_data in raw_chunks:
-                formatted_chunk = {
-                    "content": chunk_data["content"],
-                    "metadata": {
-                        "file_path": file_path,
-                        "file_name": os.path.basename(file_path),
-                        "file_type": "pas",
-                        **chunk_data.get("metadata", {}),
-                        "token_count": chunk_data.get("token_count", 0)
-                    }
-                }
-                chunks.append(formatted_chunk)
+            chunks = self.chunk_pas_content(file_path, content, size_category, ast_info)
                 
         except Exception as e:
             logger.error(f"  AST analysis failed: {e}")
@@ -191,8 +1247,169 @@ class EnhancedDelphiProcessor:
         
         return chunks
     
-    def process_dfm_file(self, file_path: str, content: str) -> List[Dict[str, Any]]:
-        """Process a Delphi Form file"""
+    def chunk_pas_content(self, file_path: str, content: str, size_category: str,
+                          ast_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Chunk an analyzed Pascal source file and attach the LightRAG metadata"""
+        with self.metrics.stage("chunking", bytes=len(content)):
+            # Use intelligent chunking for large files
+            if size_category in ["large", "very_large"]:
+                logger.info("  Using intelligent chunking for large file...")
+                raw_chunks = self.text_chunker.chunk_code_intelligently(content, ast_info)
+            else:
+                # For smaller files, use simple function/class-based chunking
+                raw_chunks = self.create_simple_chunks(file_path, content, ast_info)
+        
+        # Format chunks for LightRAG
+        chunks = []
+        for chunk_data in raw_chunks:
+            chunks.append({
+                "content": chunk_data["content"],
+                "metadata": {
+                    "file_path": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "file_type": "pas",
+                    **chunk_data.get("metadata", {}),
+                    # Simple chunks carry no count; the throttle and the estimates need one
+                    "token_count": (chunk_data.get("token_count")
+                                    or self.text_chunker.count_tokens(chunk_data["content"]))
+                }
+            })
+        return chunks
+    
+    def analyze_pas_content(self, content: str) -> Dict[str, Any]:
+        """Run the AST analysis, consulting recent analyses and the on-disk analysis cache first"""
+        memo_key = hashlib.sha256(content.encode("utf-8", errors="surrogatepass")).hexdigest()
+        if memo_key in self.recent_analyses:
+            self.recent_analyses.move_to_end(memo_key)
+            return self.recent_analyses[memo_key]
+        ast_info = self._analyze_pas_content(content)
+        self.recent_analyses[memo_key] = ast_info
+        if len(self.recent_analyses) > ANALYSIS_MEMO_ENTRIES:
+            self.recent_analyses.popitem(last=False)
+        return ast_info
+    
+    def _analyze_pas_content(self, content: str) -> Dict[str, Any]:
+        if self.analysis_cache is None:
+            logger.info("  Performing AST analysis...")
+            return self.extract_ast_info(content)
+        
+        with self.metrics.stage("analysis_cache_lookup"):
+            key = self.analysis_cache.make_key(content)
+            cached = self.analysis_cache.get(key)
+        if cached is not None:
+            logger.info("  Reusing cached AST analysis")
+            self.stats["analysis_cache_hits"] += 1
+            return cached
+        
+        logger.info("  Performing AST analysis...")
+        self.stats["analysis_cache_misses"] += 1
+        ast_info = self.extract_ast_info(content)
+        self.analysis_cache.put(key, ast_info)
+        return ast_info
+    
+    def extract_ast_info(self, content: str) -> Dict[str, Any]:
+        """Parse and extract functions/classes, timing the two steps separately"""
+        with self.metrics.stage("parse", bytes=len(content)):
+            tree = self.ast_analyzer.parse_code(content)
+        with self.metrics.stage("extraction", bytes=len(content)):
+            return self.ast_analyzer.ast_info_from_tree(tree)
+    
+    def process_dfm_file(self, file_path: str, content: str,
+                         prepared: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Process a Delphi Form file, one chunk per top-level component subtree
+        
+        With `prepared`, event handlers are also paired with the form's unit (see
+        pair_event_handlers).
+        """
+        try:
+            with self.metrics.stage("parse", bytes=len(content)):
+                form = parse_dfm(content.splitlines())
+        except DfmSyntaxError as e:
+            logger.warning(f"  Could not parse form ({e}), chunking it as text")
+            with self.metrics.stage("chunking", bytes=len(content)):
+                return self._chunk_dfm_content(file_path, content)
+        return self.chunk_form_components(file_path, form, prepared)
+    
+    def chunk_form_components(self, file_path: str, form: DfmComponent,
+                              prepared: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Chunk a parsed form: the form's own properties, then its components
+        
+        Small top-level components are packed together up to dfm_chunk_tokens; a component
+        over the token limit is split into its own properties and its children. Only a
+        component whose own properties are still too large is cut as plain text. With
+        `prepared`, one more chunk per event handler joins the bound components with the
+        handler's implementation.
+        """
+        with self.metrics.stage("chunking"):
+            parts = chunk_form(form, self.text_chunker.count_tokens, self.text_chunker.max_tokens,
+                               self.dfm_chunk_tokens, self.dfm_binary)
+        if prepared is not None:
+            parts.extend(self.pair_event_handlers(file_path, form, prepared))
+        chunks = []
+        for part in parts:
+            texts = [part["content"]]
+            if part["token_count"] > self.text_chunker.max_tokens:
+                texts = self.text_chunker.chunk_text(part["content"])
+            for i, text in enumerate(texts):
+                metadata = {
+                    "file_path": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "file_type": "dfm",
+                    "chunk_type": part["chunk_type"],
+                    "form_name": form.name,
+                    "form_class": form.class_name,
+                    "components": part["components"],
+                    "component_classes": part["component_classes"],
+                    "parent": part["parent"],
+                    "chunk_index": len(chunks),
+                    "token_count": part["token_count"] if len(texts) == 1 else self.text_chunker.count_tokens(text)
+                }
+                # A binary form has no lines
+                if part["line_start"]:
+                    metadata.update(line_start=part["line_start"], line_end=part["line_end"])
+                metadata.update(part.get("metadata", {}))
+                if len(texts) > 1:
+                    metadata.update(part=i + 1, total_parts=len(texts))
+                chunks.append({"content": text, "metadata": metadata})
+        self.stats["dfm_binary_bytes"] += binary_bytes(form)
+        return chunks
+    
+    def pair_event_handlers(self, file_path: str, form: DfmComponent,
+                            prepared: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Join the form's event bindings (OnClick = Button1Click) with the handlers in its unit
+        
+        The unit (same name, .pas) goes through analyze_pas_content, so its analysis is shared
+        with the unit's own processing through the in-memory memo and the analysis cache
+        instead of being parsed twice. The unit is recorded as a dependency of the form, so
+        a changed unit makes the next run pair the form again.
+        """
+        bindings = [event for component in form.walk() for event in component.events()]
+        unit_path = find_form_unit(file_path) if bindings else None
+        # Very large units are streamed without AST analysis, so there is nothing to pair with
+        if unit_path is None or self.should_stream(unit_path):
+            return []
+        with open(unit_path, 'rb') as f:
+            data = f.read()
+        content, _ = self.file_processor.decode_bytes(data, unit_path)
+        try:
+            ast_info = self.analyze_pas_content(content)
+        except Exception as e:
+            logger.warning(f"  Could not analyze {unit_path} to pair event handlers: {e}")
+            return []
+        prepared["depends_on"] = {unit_path: hashlib.sha256(data).hexdigest()}
+        with self.metrics.stage("pairing", bytes=len(content)):
+            parts, unresolved = pair_handlers(form, ast_info, content, os.path.basename(unit_path),
+                                              self.text_chunker.count_tokens, self.dfm_binary)
+        logger.info(f"  Paired {len(parts)} event handlers from {os.path.basename(unit_path)}"
+                    + (f" ({unresolved} bindings without a handler there)" if unresolved else ""))
+        self.stats["paired_handlers"] += len(parts)
+        self.stats["unpaired_events"] += unresolved
+        return parts
+    
+    def _chunk_dfm_content(self, file_path: str, content: str) -> List[Dict[str, Any]]:
         # DFM files are usually small, create a single chunk
         token_count = self.text_chunker.count_tokens(content)
         
@@ -226,6 +1443,47 @@ class EnhancedDelphiProcessor:
                 }
             }]
     
+    def deduplicate_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop chunks whose normalized body was already uploaded, recording their locations"""
+        unique_chunks = []
+        for chunk in chunks:
+            if self.deduplicator.register(chunk):
+                unique_chunks.append(chunk)
+                continue
+            tokens = chunk["metadata"].get("token_count") or self.text_chunker.count_tokens(chunk["content"])
+            self.stats["duplicate_chunks"] += 1
+            self.stats["dedup_tokens_saved"] += tokens
+        
+        duplicates = len(chunks) - len(unique_chunks)
+        if duplicates:
+            logger.info(f"  Skipped {duplicates} duplicate chunks already uploaded elsewhere")
+        if not unique_chunks:
+            # The whole file is a copy, so no insert request is sent at all
+            self.stats["dedup_requests_saved"] += 1
+        return unique_chunks
+    
+    def filter_near_duplicates(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply the near-duplicate policy to chunks similar to an already uploaded one"""
+        for chunk in chunks:
+            if not chunk["metadata"].get("token_count"):
+                chunk["metadata"]["token_count"] = self.text_chunker.count_tokens(chunk["content"])
+        results = self.near_duplicate_detector.process_chunks(chunks)
+        
+        near_duplicates = [chunk for chunk in chunks if "near_duplicate" in chunk]
+        self.stats["near_duplicate_chunks"] += len(near_duplicates)
+        if self.near_duplicate_detector.policy == "skip":
+            self.stats["near_dup_tokens_saved"] += sum(c["metadata"]["token_count"] for c in near_duplicates)
+        for chunk in results:
+            if chunk["metadata"].get("chunk_type") == "near_duplicate_summary":
+                chunk["metadata"]["token_count"] = self.text_chunker.count_tokens(chunk["content"])
+                self.stats["near_dup_tokens_saved"] += max(
+                    0, chunk["metadata"]["original_token_count"] - chunk["metadata"]["token_count"])
+        
+        if near_duplicates:
+            logger.info(f"  Found {len(near_duplicates)} near-duplicate chunks "
+                        f"(policy: {self.near_duplicate_detector.policy})")
+        return results
+    
     def create_simple_chunks(self, file_path: str, content: str, ast_info: Dict) -> List[Dict[str, Any]]:
         """Create simple chunks based on functions and classes"""
         chunks = []
@@ -266,36 +1524,132 @@ class EnhancedDelphiProcessor:
         
         return chunks
     
+    def build_document(self, chunk: Dict[str, Any]) -> str:
+        """Render a chunk as the document text sent to LightRAG"""
+        return self.document_formatter.render(chunk)
+    
+    def count_header_tokens(self, chunks: List[Dict[str, Any]]):
+        """Count the tokens the document headers cost, and save against the JSON metadata block"""
+        if self.document_formatter.is_default:
+            return
+        for chunk in chunks:
+            tokens = self.text_chunker.count_tokens(self.document_formatter.envelope(chunk))
+            self.stats["header_tokens"] += tokens
+            self.stats["header_tokens_saved"] += (
+                self.text_chunker.count_tokens(LEGACY_FORMATTER.envelope(chunk)) - tokens)
+    
     def insert_chunks_to_lightrag(self, chunks: List[Dict[str, Any]]) -> bool:
-        """Insert chunks into LightRAG using REST API"""
+        """
+        Insert chunks into LightRAG using REST API
+        
+        Uploads wait for the throttle, which is charged with the chunker's token counts.
+        Overload responses (429/503, timeouts) slow the throttle down and the batch is
+        retried up to THROTTLE_RETRIES times.
+        """
         try:
             # Prepare documents for insertion
-            documents = []
-            for chunk in chunks:
-                doc_content = chunk["content"]
-                # Add metadata as context
-                metadata_str = json.dumps(chunk["metadata"], ensure_ascii=False, indent=2)
-                full_content = f"{doc_content}\n\n[Metadata]\n{metadata_str}"
-                documents.append(full_content)
-            
-            # Call LightRAG API to insert documents
-            response = requests.post(
-                f"{LIGHTRAG_API_URL}/documents/texts",
-                json={"texts": documents},
-                headers={"Content-Type": "application/json"}
-            )
+            with self.metrics.stage("serialization") as timer:
+                documents = [self.build_document(chunk) for chunk in chunks]
+                # The source path lets the reconcile command tell this tool's documents apart
+                file_sources = [chunk["metadata"].get("file_path", "unknown_source") for chunk in chunks]
+                payload = json.dumps({"texts": documents, "file_sources": file_sources}).encode("utf-8")
+                timer.bytes = len(payload)
+            self.metrics.gauge("upload_batch_documents", len(documents))
+            # Chunks read back by `load` may predate the token counts
+            tokens = sum(chunk["metadata"].get("token_count") or self.text_chunker.count_tokens(chunk["content"])
+                         for chunk in chunks)
             
-            if response.status_code == 200:
-                logger.info(f"  Inserted {len(documents)} chunks to LightRAG")
-                return True
-            else:
+            for attempt in range(THROTTLE_RETRIES + 1):
+                with self.metrics.stage("backpressure"):
+                    self.stats["backpressure_wait_seconds"] += self.pipeline_monitor.wait_for_capacity()
+                with self.metrics.stage("throttle"):
+                    self.stats["throttle_wait_seconds"] += self.throttle.acquire(len(documents), tokens)
+                
+                # Call LightRAG API to insert documents
+                try:
+                    with self.metrics.stage("upload", bytes=len(payload)):
+                        response = requests.post(
+                            f"{LIGHTRAG_API_URL}/documents/texts",
+                            data=payload,
+                            headers={"Content-Type": "application/json"},
+                            timeout=self.upload_timeout
+                        )
+                except requests.Timeout as e:
+                    logger.warning(f"  Upload timed out (attempt {attempt + 1}): {e}")
+                    self.stats["throttled_requests"] += 1
+                    self.throttle.throttled()
+                    continue
+                
+                if response.status_code in THROTTLE_STATUSES:
+                    logger.warning(f"  LightRAG is overloaded ({response.status_code}, attempt {attempt + 1})")
+                    self.stats["throttled_requests"] += 1
+                    self.throttle.throttled(parse_retry_after(response.headers.get("Retry-After")))
+                    continue
+                if response.status_code == 200:
+                    self.throttle.succeeded()
+                    logger.info(f"  Inserted {len(documents)} chunks to LightRAG")
+                    for chunk, document in zip(chunks, documents):
+                        chunk["doc_id"] = compute_doc_id(document)
+                    self.pipeline_monitor.track(chunk["doc_id"] for chunk in chunks)
+                    return True
                 logger.error(f"  Failed to insert chunks: {response.status_code} - {response.text}")
                 return False
+            
+            logger.error(f"  Failed to insert chunks: still overloaded after {THROTTLE_RETRIES} retries")
+            return False
                 
         except Exception as e:
             logger.error(f"  Error inserting to LightRAG: {e}")
             return False
     
+    def reconcile(self, directory: str, dry_run: bool = False, include_unknown_source: bool = False,
+                  requeue_missing: bool = False) -> Dict[str, Any]:
+        """
+        Compare LightRAG's documents with the progress manifest
+        
+        Orphans are documents from files under `directory` (by their source path) that no
+        recorded file owns, e.g. left behind by a failed delete or an older version of this
+        tool; they are deleted. Documents inserted without a source path are only
+        considered with `include_unknown_source`. Files whose documents are missing from
+        LightRAG are reported and, with `requeue_missing`, forgotten so the next run
+        ingests them again.
+        """
+        known = set()
+        for entry in self.file_processor.progress_data["files"].values():
+            known.update(entry.get("doc_ids", []))
+        if self.deduplicator is not None:
+            known.update(entry["doc_id"] for entry in self.deduplicator.references.values() if entry.get("doc_id"))
+        
+        documents = self.lightrag.list_documents()
+        server_ids = {document["id"] for document in documents}
+        prefix = os.path.join(directory, "")
+        orphans = []
+        for document in documents:
+            if document["id"] in known:
+                continue
+            source = document.get("file_path") or "unknown_source"
+            if source.startswith(prefix) or (include_unknown_source and source == "unknown_source"):
+                orphans.append(document["id"])
+        
+        missing = [path for path in self.file_processor.manifest_files(directory)
+                   if any(doc_id not in server_ids for doc_id in self.file_processor.file_entry(path).get("doc_ids", []))]
+        
+        logger.info(f"LightRAG documents: {len(documents)}, owned by recorded files: {len(server_ids & known)}")
+        logger.info(f"Orphaned documents: {len(orphans)}" + (" (dry run, not deleted)" if dry_run else ""))
+        logger.info(f"Files with missing documents: {len(missing)}")
+        for path in missing:
+            logger.info(f"  {path}")
+        
+        self.delete_documents(orphans, dry_run)
+        self.flush_stale_documents()
+        if requeue_missing and not dry_run and missing:
+            for path in missing:
+                self.file_processor.forget_file(path)
+                self.release_dedup_references(path)
+            self.file_processor.save_progress()
+            logger.info(f"{len(missing)} files will be ingested again on the next run")
+        return {"documents": len(documents), "orphans": orphans, "missing_files": missing}
+    
     def print_statistics(self):
         """Print processing statistics"""
         logger.info("\n=== Processing Statistics ===")
@@ -304,41 +1658,531 @@ class EnhancedDelphiProcessor:
         logger.info(f"Files skipped (already processed): {self.stats['skipped_files']}")
         logger.info(f"Files failed: {self.stats['failed_files']}")
         logger.info(f"Auto-generated files skipped: {self.stats['auto_generated_files']}")
+        if self.skip_reasons:
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.skip_reasons.items()))
+            logger.info(f"Files skipped by rules before reading: {sum(self.skip_reasons.values())} ({reasons})")
+        if self.stats["deleted_files"] or self.stats["renamed_files"] or self.stats["deleted_documents"]:
+            logger.info(f"Files deleted/renamed: {self.stats['deleted_files']}/{self.stats['renamed_files']}, "
+                        f"stale documents deleted: {self.stats['deleted_documents']}")
+        if self.stats["exported_chunks"]:
+            logger.info(f"Chunks exported to {self.chunk_store.path}: {self.stats['exported_chunks']}")
+        if self.stats["resumed_chunks"]:
+            logger.info(f"Chunks not sent again (accepted before an interruption): {self.stats['resumed_chunks']}")
+        if self.stats["paired_handlers"] or self.stats["unpaired_events"]:
+            logger.info(f"Form event handlers paired with their unit: {self.stats['paired_handlers']} "
+                        f"({self.stats['unpaired_events']} bindings without a handler in the unit)")
+        if self.stats["binary_forms"]:
+            logger.info(f"Binary (TPF0) forms decoded: {self.stats['binary_forms']}")
+        if self.stats["dfm_binary_bytes"]:
+            action = "left out" if self.dfm_binary == "drop" else "summarized"
+            logger.info(f"Binary form data {action}: {self.stats['dfm_binary_bytes']} bytes")
+        if self.stats["header_tokens"]:
+            logger.info(f"Document headers: {self.stats['header_tokens']} tokens, "
+                        f"{self.stats['header_tokens_saved']} saved against the JSON metadata block")
+        if self.stats["throttled_requests"] or self.stats["throttle_wait_seconds"]:
+            logger.info(f"Upload throttling: waited {self.stats['throttle_wait_seconds']:.1f}s, "
+                        f"{self.stats['throttled_requests']} overloaded responses")
+        if self.pipeline_monitor.enabled:
+            self.pipeline_monitor.poll(list_documents=True)
+            pipeline = self.pipeline_monitor.summary()
+            logger.info(f"LightRAG queue: {pipeline['queue_depth']} waiting now, max {pipeline['max_queue_depth']}, "
+                        f"paused {pipeline['pauses']} times for {self.stats['backpressure_wait_seconds']:.0f}s")
+            if pipeline["indexed_documents"]:
+                logger.info(f"Indexed latency: p50 {pipeline['indexed_latency_p50']}s, "
+                            f"p95 {pipeline['indexed_latency_p95']}s over {pipeline['indexed_documents']} documents "
+                            f"({pipeline['still_indexing']} still indexing)")
+        if self.stats["handed_off_files"]:
+            logger.info(f"Files handed off to other shards: {self.stats['handed_off_files']}")
         logger.info(f"Total chunks created: {self.stats['total_chunks']}")
+        if self.prepare_spans:
+            report = makespan_report(self.prepare_spans, self.workers)
+            logger.info(f"Prepare makespan ({self.schedule}, {self.workers} workers): {report['makespan']:.2f}s, "
+                        f"ideal {report['ideal']:.2f}s (+{report['overhead_pct']}%), "
+                        f"longest file {report['longest']:.2f}s")
+        if self.analysis_cache is not None:
+            logger.info(f"Analysis cache hits/misses: {self.stats['analysis_cache_hits']}"
+                        f"/{self.stats['analysis_cache_misses']}")
+        if self.symbol_index is not None:
+            summary = self.symbol_index.summary()
+            logger.info(f"Symbol index: {self.stats['indexed_files']} units updated, "
+                        f"{summary['symbols']} symbols in {summary['files']} files")
+        
+        if self.deduplicator is not None:
+            logger.info(f"Duplicate chunks not uploaded: {self.stats['duplicate_chunks']} "
+                        f"(~{self.stats['dedup_tokens_saved']} tokens, "
+                        f"{self.stats['duplicate_chunks']} LightRAG documents, "
+                        f"{self.stats['dedup_requests_saved']} insert requests saved)")
+        
+        if self.near_duplicate_detector is not None:
+            logger.info(f"Near-duplicate chunks ({self.near_duplicate_detector.policy}): "
+                        f"{self.stats['near_duplicate_chunks']} "
+                        f"(~{self.stats['near_dup_tokens_saved']} tokens saved)")
         
         if self.stats['processed_files'] > 0:
             avg_chunks = self.stats['total_chunks'] / self.stats['processed_files']
             logger.info(f"Average chunks per file: {avg_chunks:.2f}")
+        
+        if self.metrics.enabled:
+            logger.info("\n=== Stage Timings ===")
+            self.metrics.log_summary()
+        
+        if self.memory_profiler.enabled:
+            logger.info("\n=== Memory Profile ===")
+            self.memory_profiler.log_report()
+    
+    def write_memory_report(self, path: str):
+        """Write the memory profile (stage peaks, worst files, allocation sites) as JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.memory_profiler.report(), f, ensure_ascii=False, indent=2)
+        logger.info(f"Memory profile written to {path}")
+    
+    def write_metrics(self, json_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """Export the stage metrics (and the run counters) as JSON and/or a Prometheus textfile"""
+        if json_path:
+            extra = {"counters": self.stats}
+            if self.pipeline_monitor.enabled:
+                extra["lightrag_pipeline"] = self.pipeline_monitor.summary()
+            self.metrics.write_json(json_path, extra=extra)
+            logger.info(f"Metrics written to {json_path}")
+        if prometheus_path:
+            self.metrics.write_prometheus(prometheus_path, counters=self.stats)
+            logger.info(f"Prometheus metrics written to {prometheus_path}")
+
+
+def _batched(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# Per-process processor used by the worker pool in EnhancedDelphiProcessor.prepare_files
+_worker_processor: Optional[EnhancedDelphiProcessor] = None
+
+
+def _exhaust_within(chunks: Iterator[Dict[str, Any]], scope: contextlib.ExitStack) -> Iterator[Dict[str, Any]]:
+    """Yield the chunks, leaving `scope` once they are used up (or the generator is closed)"""
+    with scope:
+        yield from chunks
+
+
+def _init_worker(config: Dict[str, Any]):
+    global _worker_processor
+    _worker_processor = EnhancedDelphiProcessor(**config, dedup=False)
+
+
+def _prepare_in_worker(file_path: str, data: Optional[bytes] = None) -> Dict[str, Any]:
+    before = dict(_worker_processor.stats)
+    started = time.time()
+    prepared = _worker_processor.prepare_file(file_path, data)
+    prepared["prepare_span"] = (started, time.time())
+    # Counters bumped while preparing (e.g. analysis cache hits) are merged by the parent
+    prepared["stats_delta"] = {
+        key: value - before[key] for key, value in _worker_processor.stats.items() if value != before[key]
+    }
+    if _worker_processor.metrics.enabled:
+        prepared["metrics_delta"] = _worker_processor.metrics.export(reset=True)
+    return prepared
+
+
+def check_lightrag_service() -> bool:
+    """Check that the LightRAG API answers"""
+    try:
+        response = requests.get(f"{LIGHTRAG_API_URL}/docs")
+        if response.status_code != 200:
+            logger.error("LightRAG service is not running properly")
+            return False
+    except:
+        logger.error("LightRAG service is not running. Please run: docker-compose up -d")
+        return False
+    return True
+
+
+def reconcile_main(argv: List[str]):
+    """`reconcile` command: delete orphaned documents and report files whose documents are missing"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="process_delphi_code_enhanced.py reconcile",
+                                     description="Remove LightRAG documents no processed file owns")
+    parser.add_argument("directory", help="Directory the documents were ingested from")
+    parser.add_argument("--progress-file", default=".lightrag_progress.json", help="Progress file path")
+    parser.add_argument("--chunk-refs-file", default=".lightrag_chunk_refs.json",
+                        help="Duplicate chunk reference table path")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+    parser.add_argument("--include-unknown-source", action="store_true",
+                        help="Also treat unowned documents inserted without a source path as orphans")
+    parser.add_argument("--requeue-missing", action="store_true",
+                        help="Forget files whose documents are missing so the next run ingests them again")
+    args = parser.parse_args(argv)
+    
+    if not check_lightrag_service():
+        sys.exit(1)
+    processor = EnhancedDelphiProcessor(args.progress_file, analysis_cache_file=None,
+                                        chunk_refs_file=args.chunk_refs_file)
+    processor.reconcile(args.directory, dry_run=args.dry_run,
+                        include_unknown_source=args.include_unknown_source,
+                        requeue_missing=args.requeue_missing)
+
+
+def merge_manifests_main(argv: List[str]):
+    """`merge-manifests` command: combine the progress and reference files written by --shard runs"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="process_delphi_code_enhanced.py merge-manifests",
+                                     description="Merge the per-shard progress, statistics and chunk references")
+    parser.add_argument("--shards", type=int, required=True, help="Number of shards (N in --shard i/N)")
+    parser.add_argument("--progress-file", default=".lightrag_progress.json",
+                        help="Progress file path the shards were run with; the merge is written here")
+    parser.add_argument("--chunk-refs-file", default=".lightrag_chunk_refs.json",
+                        help="Chunk reference table path the shards were run with; the merge is written here")
+    args = parser.parse_args(argv)
+    
+    def load_shards(path: str) -> List[Dict[str, Any]]:
+        loaded = []
+        for index in range(1, args.shards + 1):
+            shard_path = shard_file(path, index, args.shards)
+            if not os.path.exists(shard_path):
+                logger.warning(f"Missing shard file {shard_path}")
+                continue
+            with open(shard_path, 'r', encoding='utf-8') as f:
+                loaded.append(json.load(f))
+        return loaded
+    
+    progress = load_shards(args.progress_file)
+    if not progress:
+        logger.error("No shard progress files found")
+        sys.exit(1)
+    merged = merge_progress(progress)
+    with open(args.progress_file, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False, indent=2)
+    logger.info(f"Merged {len(progress)} of {args.shards} shards into {args.progress_file} "
+                f"({len(merged['files'])} files)")
+    for key, value in merged["stats"].items():
+        logger.info(f"  {key}: {value}")
+    
+    references = merge_references(load_shards(args.chunk_refs_file))
+    if references is not None:
+        with open(args.chunk_refs_file, 'w', encoding='utf-8') as f:
+            json.dump(references, f, ensure_ascii=False, indent=2)
+        logger.info(f"Merged chunk references into {args.chunk_refs_file} ({len(references['chunks'])} bodies)")
+
+
+def load_main(argv: List[str]):
+    """`load` command: upload chunk stores written with --export, without the source tree"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="process_delphi_code_enhanced.py load",
+                                     description="Upload the chunks of stores written by --export runs")
+    parser.add_argument("stores", nargs="+", metavar="STORE", help="Chunk store directories, loaded in order")
+    parser.add_argument("--reset", action="store_true", help="Reset progress and load everything again")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Replay the whole store, re-uploading files already loaded")
+    parser.add_argument("--progress-file", default=".lightrag_progress.json", help="Progress file path")
+    parser.add_argument("--metrics-json", help="Record per-stage timings and write them as JSON to this path")
+    parser.add_argument("--metrics-prom",
+                        help="Record per-stage timings and write a Prometheus textfile (node exporter) to this path")
+    add_upload_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if not check_lightrag_service():
+        sys.exit(1)
+    processor = EnhancedDelphiProcessor(args.progress_file, analysis_cache_file=None,
+                                        collect_metrics=bool(args.metrics_json or args.metrics_prom),
+                                        **upload_options(parser, args))
+    if args.reset:
+        logger.info("Resetting progress...")
+        processor.file_processor.reset_progress()
+        if processor.deduplicator is not None:
+            processor.deduplicator.reset()
+    for store in args.stores:
+        try:
+            processor.load_chunk_store(store, resume=not (args.no_resume or args.reset))
+        except (OSError, ValueError) as e:
+            logger.error(f"Can't load chunk store {store}: {e}")
+            sys.exit(1)
+    processor.print_statistics()
+    processor.write_metrics(args.metrics_json, args.metrics_prom)
+
+
+def index_main(argv: List[str]):
+    """`index` command: build or refresh the symbol index of a tree without contacting LightRAG"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="process_delphi_code_enhanced.py index",
+                                     description="Analyze changed units and update the symbol index")
+    parser.add_argument("directory", help="Directory containing Delphi units")
+    parser.add_argument("--index-file", default=".lightrag_symbols.sqlite", help="Symbol index file path")
+    parser.add_argument("--analysis-cache", default=".lightrag_analysis_cache.sqlite",
+                        help="AST analysis cache file path")
+    parser.add_argument("--no-analysis-cache", action="store_true", help="Disable the AST analysis cache")
+    parser.add_argument("--ignore-file", default=IGNORE_FILE_NAME,
+                        help="Name of the gitignore-style file read in each directory (default: %(default)s)")
+    parser.add_argument("--no-ignore-file", action="store_true", help="Don't read ignore files")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    processor = EnhancedDelphiProcessor(
+        analysis_cache_file=None if args.no_analysis_cache else args.analysis_cache,
+        dedup=False, ignore_file=None if args.no_ignore_file else args.ignore_file,
+        symbol_index_file=args.index_file)
+    processor.index_directory(args.directory)
+
+
+def lookup_main(argv: List[str]):
+    """`lookup` command: find classes and routines in the symbol index, without contacting LightRAG"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="process_delphi_code_enhanced.py lookup",
+                                     description="Look up where classes and routines are declared and implemented")
+    parser.add_argument("names", nargs="+", metavar="NAME",
+                        help="Name to look up, case-insensitive: Method, Class.Method or Unit.Class.Method")
+    parser.add_argument("--prefix", action="store_true", help="Match names starting with NAME")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum matches per name")
+    parser.add_argument("--index-file", default=".lightrag_symbols.sqlite", help="Symbol index file path")
+    parser.add_argument("--json", action="store_true", help="Print the matches as JSON")
+    args = parser.parse_args(argv)
+    
+    if not os.path.exists(args.index_file):
+        parser.error(f"no symbol index at {args.index_file}; run a directory ingest or the index command first")
+    index = SymbolIndex(args.index_file)
+    results = {}
+    for name in args.names:
+        started = time.perf_counter()
+        results[name] = index.lookup(name, prefix=args.prefix, limit=args.limit)
+        logger.info(f"{name}: {len(results[name])} matches in {(time.perf_counter() - started) * 1000:.3f} ms")
+    index.close()
+    if args.json:
+        print(json.dumps({name: [dict(symbol._asdict(), full_name=symbol.full_name) for symbol in symbols]
+                          for name, symbols in results.items()}, ensure_ascii=False, indent=2))
+        return
+    for symbols in results.values():
+        for symbol in symbols:
+            role = "implementation" if symbol.implementation else "declaration"
+            print(f"{symbol.file_path}:{symbol.line_start}-{symbol.line_end}\t{symbol.kind}\t"
+                  f"{symbol.full_name}" + ("" if symbol.kind == "unit" else f"\t{role}"))
+    if not any(results.values()):
+        sys.exit(1)
+
+
+def add_upload_arguments(parser):
+    """Options of the upload stage, shared by directory runs and the `load` command"""
+    parser.add_argument("--no-dedup", action="store_true", help="Upload duplicate chunks instead of skipping them")
+    parser.add_argument("--chunk-refs-file", default=".lightrag_chunk_refs.json",
+                        help="Reference table listing every location of each deduplicated chunk")
+    parser.add_argument("--dedup-strip-comments", action="store_true",
+                        help="Ignore comments when comparing chunk bodies")
+    parser.add_argument("--near-dup-policy", choices=NEAR_DUPLICATE_POLICIES,
+                        help="Enable MinHash/LSH near-duplicate detection: skip them, upload a diff "
+                             "summary against the representative, or annotate them (chunks are only "
+                             "compared with chunks uploaded in the same run)")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.9,
+                        help="Estimated Jaccard similarity above which chunks count as near-duplicates")
+    parser.add_argument("--docs-per-minute", type=float, default=float(os.getenv("LIGHTRAG_DOCS_PER_MINUTE", "60")),
+                        help="Documents LightRAG can ingest per minute (used for the upload time estimate "
+                             "and, with --throttle, as the upload limit)")
+    parser.add_argument("--tokens-per-minute", type=float, default=float(os.getenv("LIGHTRAG_TOKENS_PER_MINUTE", "0")),
+                        help="Tokens LightRAG can ingest per minute (0: no token limit)")
+    parser.add_argument("--max-pending", type=int, default=0, metavar="DOCS",
+                        help="Pause uploads while LightRAG has this many documents pending or processing "
+                             "(0 = don't poll)")
+    parser.add_argument("--resume-pending", type=int, metavar="DOCS",
+                        help="Resume uploads once the pending documents drop to this many (default: half of --max-pending)")
+    parser.add_argument("--pipeline-poll", type=float, default=DEFAULT_POLL_SECONDS, metavar="SECONDS",
+                        help="How often LightRAG's document statuses are polled with --max-pending")
+    parser.add_argument("--throttle", action="store_true",
+                        help="Limit uploads to --docs-per-minute and --tokens-per-minute, slowing down "
+                             "further while LightRAG answers 429/503")
+    parser.add_argument("--upload-timeout", type=float, default=UPLOAD_TIMEOUT_SECONDS, metavar="SECONDS",
+                        help="Seconds to wait for LightRAG to accept a batch before slowing down and retrying it")
+    parser.add_argument("--doc-style", choices=DOCUMENT_STYLES, default="json",
+                        help="Document text: chunk followed by the pretty-printed JSON metadata, or a "
+                             "compact one-line header (changing it re-uploads files as they are processed)")
+    parser.add_argument("--doc-field", action="append", metavar="KEY",
+                        help="Metadata key written into the document text (repeatable; default: all "
+                             "for json, the location fields for compact). The file path is always sent "
+                             "as the document's file source")
+    parser.add_argument("--doc-template", metavar="TEMPLATE",
+                        help="Document text template with {content}, {header} and metadata keys, "
+                             "e.g. '{header}\\n{content}'")
+
+
+def upload_options(parser, args) -> Dict[str, Any]:
+    """EnhancedDelphiProcessor arguments for the options added by add_upload_arguments"""
+    if args.doc_template:
+        args.doc_template = args.doc_template.replace("\\n", "\n")
+        try:
+            DocumentFormatter(args.doc_style, template=args.doc_template)
+        except ValueError as e:
+            parser.error(str(e))
+    return {
+        "dedup": not args.no_dedup,
+        "chunk_refs_file": args.chunk_refs_file,
+        "dedup_strip_comments": args.dedup_strip_comments,
+        "near_dup_policy": args.near_dup_policy,
+        "near_dup_threshold": args.near_dup_threshold,
+        "docs_per_minute": args.docs_per_minute,
+        "tokens_per_minute": args.tokens_per_minute,
+        "throttle_uploads": args.throttle,
+        "upload_timeout": args.upload_timeout,
+        "max_pending_docs": args.max_pending,
+        "resume_pending_docs": args.resume_pending,
+        "pipeline_poll_seconds": args.pipeline_poll,
+        "document_style": args.doc_style,
+        "document_fields": args.doc_field,
+        "document_template": args.doc_template
+    }
+
+
+# Subcommands; anything else is the directory to process
+COMMANDS = {
+    "reconcile": reconcile_main,
+    "merge-manifests": merge_manifests_main,
+    "load": load_main,
+    "index": index_main,
+    "lookup": lookup_main,
+}
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+    
     import argparse
     
-    parser = argparse.ArgumentParser(description="Enhanced Delphi code processor for LightRAG")
-    parser.add_argument("directory", help="Directory containing Delphi files")
+    parser = argparse.ArgumentParser(description="Enhanced Delphi code processor for LightRAG",
+                                     epilog="Commands: " + ", ".join(COMMANDS))
+    parser.add_argument("directory", help="Directory containing Delphi files, or a zip/tar archive of one")
     parser.add_argument("--reset", action="store_true", help="Reset progress and start fresh")
     parser.add_argument("--no-resume", action="store_true", help="Don't resume from previous progress")
     parser.add_argument("--progress-file", default=".lightrag_progress.json", help="Progress file path")
+    parser.add_argument("--analysis-cache", default=".lightrag_analysis_cache.sqlite",
+                        help="AST analysis cache file path")
+    parser.add_argument("--analysis-cache-size", type=int, default=256,
+                        help="Maximum analysis cache size in MB (least recently used entries are evicted)")
+    parser.add_argument("--no-analysis-cache", action="store_true", help="Disable the AST analysis cache")
+    parser.add_argument("--symbol-index", default=".lightrag_symbols.sqlite",
+                        help="Symbol index updated with the classes and routines of each processed unit "
+                             "(queried by the lookup command)")
+    parser.add_argument("--no-symbol-index", action="store_true", help="Don't update the symbol index")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes for reading, analysis and chunking "
+                             "(default: 1, or the CPU count with --dry-run or --export)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Analyze and chunk everything without uploading, then report "
+                             "per-directory totals and the estimated upload time")
+    parser.add_argument("--dry-run-report", help="Write the dry-run estimate as JSON to this path")
+    parser.add_argument("--export", metavar="STORE",
+                        help="Write the chunks to this chunk store directory instead of uploading them; "
+                             "upload them later with the load command")
+    add_upload_arguments(parser)
+    parser.add_argument("--metrics-json", help="Record per-stage timings and write them as JSON to this path")
+    parser.add_argument("--metrics-prom",
+                        help="Record per-stage timings and write a Prometheus textfile (node exporter) to this path")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Track tracemalloc peaks per stage and peak RSS per file, then report the "
+                             "top allocation sites and the ten worst files (slow)")
+    parser.add_argument("--memory-report", help="Write the memory profile as JSON to this path")
+    parser.add_argument("--git", action="store_true",
+                        help="Only process files changed since the last ingested commit of the git checkout")
+    parser.add_argument("--since", metavar="COMMIT",
+                        help="With --git, diff against this commit instead of the recorded one")
+    parser.add_argument("--discovery-threads", type=int, default=DEFAULT_DISCOVERY_THREADS,
+                        help="Directories listed in parallel while discovering files (1 = walk in order)")
+    parser.add_argument("--ignore-file", default=IGNORE_FILE_NAME,
+                        help="Name of the gitignore-style file read in each directory (default: %(default)s)")
+    parser.add_argument("--no-ignore-file", action="store_true", help="Don't read ignore files")
+    parser.add_argument("--max-file-size", type=float, default=0,
+                        help="Skip files larger than this many MB without reading them (0 = no limit)")
+    parser.add_argument("--only-ext", action="append", metavar="EXT",
+                        help="Only process files with this extension, e.g. .pas (repeatable)")
+    parser.add_argument("--skip-pattern", action="append", metavar="GLOB",
+                        help="Treat file names matching this glob as generated and skip them (repeatable)")
+    parser.add_argument("--schedule", choices=SCHEDULES, default="discovery",
+                        help="Order files are handed to the workers: as discovered (starts at once), "
+                             "lpt (largest estimate first, shortest total run) or small-first "
+                             "(many files searchable early)")
+    parser.add_argument("--dfm-binary", choices=BINARY_POLICIES, default="summarize",
+                        help="Binary form properties (Picture.Data, Bitmap, ...): summarize as size and "
+                             "graphic class, or drop them from the chunks")
+    parser.add_argument("--dfm-chunk-tokens", type=int, default=DFM_CHUNK_TOKENS, metavar="TOKENS",
+                        help="Pack small form components into chunks of up to this many tokens")
+    parser.add_argument("--archive-name", metavar="NAME",
+                        help="Record archive members under NAME/ instead of the archive's file name, so "
+                             "successive drops of the same tree replace each other's documents")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Only process shard I of N (files split by path hash, balanced by size); "
+                             "progress and chunk references go to per-shard files for merge-manifests")
     
     args = parser.parse_args()
     
-    # Check if services are running
-    try:
-        response = requests.get(f"{LIGHTRAG_API_URL}/docs")
-        if response.status_code != 200:
-            logger.error("LightRAG service is not running properly")
-            sys.exit(1)
-    except:
-        logger.error("LightRAG service is not running. Please run: docker-compose up -d")
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.git:
+            parser.error("--shard can't be combined with --git")
+        args.progress_file = shard_file(args.progress_file, *shard)
+        args.chunk_refs_file = shard_file(args.chunk_refs_file, *shard)
+        if args.export:
+            args.export = shard_file(args.export, *shard)
+    if args.export and args.dry_run:
+        parser.error("--export can't be combined with --dry-run")
+    
+    # Check if services are running (dry runs and exports never talk to LightRAG)
+    if not args.dry_run and not args.export and not check_lightrag_service():
         sys.exit(1)
     
     # Process directory
-    processor = EnhancedDelphiProcessor(args.progress_file)
-    processor.process_directory(
-        args.directory,
-        resume=not args.no_resume,
-        reset=args.reset
+    processor = EnhancedDelphiProcessor(
+        args.progress_file,
+        analysis_cache_file=None if args.no_analysis_cache else args.analysis_cache,
+        analysis_cache_max_mb=args.analysis_cache_size,
+        workers=args.workers or ((os.cpu_count() or 1) if args.dry_run or args.export else 1),
+        collect_metrics=bool(args.metrics_json or args.metrics_prom),
+        profile_memory=args.profile_memory or bool(args.memory_report),
+        ignore_file=None if args.no_ignore_file else args.ignore_file,
+        max_file_mb=args.max_file_size,
+        only_extensions=args.only_ext,
+        skip_patterns=args.skip_pattern,
+        discovery_threads=args.discovery_threads,
+        shard=shard,
+        schedule=args.schedule,
+        archive_name=args.archive_name,
+        export_store=args.export,
+        dfm_binary=args.dfm_binary,
+        dfm_chunk_tokens=args.dfm_chunk_tokens,
+        # Dry runs leave the index as it is
+        symbol_index_file=None if args.no_symbol_index or args.dry_run else args.symbol_index,
+        **upload_options(parser, args)
     )
+    if args.git:
+        try:
+            processor.process_git_changes(args.directory, since=args.since, reset=args.reset,
+                                          dry_run=args.dry_run)
+        except GitError as e:
+            logger.error(f"Git incremental mode failed: {e}")
+            sys.exit(1)
+    else:
+        processor.process_directory(
+            args.directory,
+            resume=not args.no_resume,
+            reset=args.reset,
+            dry_run=args.dry_run
+        )
+    processor.write_metrics(args.metrics_json, args.metrics_prom)
+    if args.memory_report:
+        processor.write_memory_report(args.memory_report)
+    
+    if args.dry_run and args.dry_run_report:
+        with open(args.dry_run_report, 'w', encoding='utf-8') as f:
+            json.dump(processor.dry_run_report(), f, ensure_ascii=False, indent=2)
+        logger.info(f"Dry-run report written to {args.dry_run_report}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""
+AST解析結果の永続キャッシュ
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """ファイル内容のハッシュと解析器バージョンをキーにした解析結果キャッシュ（SQLite, LRU）"""
+
+    def __init__(self, cache_file: str = ".lightrag_analysis_cache.sqlite",
+                 max_bytes: int = 256 * 1024 * 1024, version: str = ""):
+        """
+        Args:
+            cache_file: キャッシュファイルのパス
+            max_bytes: キャッシュ全体の上限サイズ（超えたら最終アクセスの古い順に削除）
+            version: 解析器・文法のバージョン（異なるバージョンのエントリは破棄する）
+        """
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_access ON analysis(last_access)")
+        # 解析器のバージョンが変わったエントリは二度と使われないので起動時に捨てる
+        self._conn.execute("DELETE FROM analysis WHERE version != ?", (version,))
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM analysis").fetchone()[0]
+
+    def make_key(self, content: str) -> str:
+        """内容と解析器バージョンからキャッシュキーを作る"""
+        digest = hashlib.sha256()
+        digest.update(self.version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content.encode("utf-8", errors="surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """キャッシュから解析結果を取得（なければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE analysis SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return json.loads(row[0])
+        except ValueError as e:
+            logger.warning(f"解析キャッシュの破損エントリを無視: {e}")
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """解析結果をキャッシュに保存"""
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._total_bytes -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, version, value, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, self.version, data, size, time.time()))
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """上限サイズを超えた分を最終アクセスの古い順に削除"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM analysis ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def clear(self):
+        """キャッシュを空にする"""
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
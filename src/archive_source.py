@@ -0,0 +1,161 @@
+"""
+zip / tar アーカイブを展開せずにメンバーを順に読むためのソース
+"""
+import logging
+import mmap
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import Iterator, NamedTuple, Optional, Tuple, Union
+
+from src.discovery import EXCLUDED_DIRS
+
+logger = logging.getLogger(__name__)
+
+# 一時ファイルへ書き出すときに一度に読む大きさ
+SPOOL_BLOCK_BYTES = 1024 * 1024
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path: str) -> bool:
+    """処理対象としてアーカイブが指定されたか"""
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+class ArchiveMember(NamedTuple):
+    """アーカイブ内のファイル（path はアーカイブのルートからの相対パス）"""
+    path: str
+    size: int
+    mtime_ns: int
+
+
+class MemberReader:
+    """
+    メンバーの内容を読むオブジェクト
+
+    先頭だけを読んだあとで全体を読んでも、先頭を読み直さない（tarのストリームは巻き戻せないため）。
+    全体を読んだ内容は保持し、2回目以降の read はそれを返す。巨大なメンバーは spool で
+    一時ファイルに書き出し、メモリに載せずにmmapとして返す。全体を読んだらメンバーのファイルは閉じる
+    """
+
+    def __init__(self, opener):
+        self._opener = opener
+        self._file = None
+        self._head = b""
+        self._data: Optional[Union[bytes, mmap.mmap]] = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = self._opener()
+        return self._file
+
+    def head(self, size: int) -> bytes:
+        if self._data is not None:
+            return self._data[:size]
+        if len(self._head) < size:
+            self._head += self._open().read(size - len(self._head))
+        return self._head[:size]
+
+    def read(self) -> Union[bytes, mmap.mmap]:
+        if self._data is None:
+            try:
+                self._data = self._head + self._open().read()
+            finally:
+                self.close()
+            self._head = b""
+        return self._data
+
+    def spool(self) -> Union[bytes, mmap.mmap]:
+        """内容を一時ファイルに書き出してmmapで返す（空ならb""）"""
+        if self._data is None:
+            with tempfile.TemporaryFile() as spooled:
+                try:
+                    spooled.write(self._head)
+                    shutil.copyfileobj(self._open(), spooled, SPOOL_BLOCK_BYTES)
+                finally:
+                    self.close()
+                spooled.flush()
+                # mmapはファイルを閉じても使え、一時ファイルはmmapが閉じられたときに消える
+                self._data = mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ) if spooled.tell() else b""
+            self._head = b""
+        return self._data
+
+    def close(self):
+        """メンバーのファイルを閉じる（読んだ内容は残す）"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def normalize_member_path(name: str) -> Optional[str]:
+    """メンバー名をアーカイブ相対のパスにする（ルートの外を指すものはNone）"""
+    path = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+    if path in ("", ".") or path == ".." or path.startswith("../"):
+        return None
+    return path
+
+
+def _excluded(path: str) -> bool:
+    """ディレクトリの探索と同じく、隠しディレクトリや依存ライブラリのディレクトリ配下は除外"""
+    for part in path.split("/")[:-1]:
+        if part.startswith('.') or part in EXCLUDED_DIRS:
+            return True
+    return False
+
+
+class ArchiveSource:
+    """
+    zip / tar（gzip・bzip2・xz 圧縮を含む）のメンバーを展開せずに読む
+
+    tar はストリームとして先頭から1回だけ読むので、各メンバーの内容は次のメンバーへ
+    進む前に読む必要がある。zip は first_names に指定した名前のファイルを先に返す
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Tuple[ArchiveMember, MemberReader]]:
+        return self.iter_members()
+
+    def iter_members(self, first_names: Tuple[str, ...] = ()) -> Iterator[Tuple[ArchiveMember, MemberReader]]:
+        if zipfile.is_zipfile(self.path):
+            yield from self._iter_zip(first_names)
+        else:
+            yield from self._iter_tar()
+
+    def _iter_zip(self, first_names: Tuple[str, ...]) -> Iterator[Tuple[ArchiveMember, MemberReader]]:
+        with zipfile.ZipFile(self.path) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+            infos.sort(key=lambda info: posixpath.basename(info.filename) not in first_names)
+            for info in infos:
+                path = normalize_member_path(info.filename)
+                if path is None or _excluded(path):
+                    continue
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                member = ArchiveMember(path, info.file_size, int(mtime * 1e9))
+                reader = MemberReader(lambda info=info: archive.open(info))
+                try:
+                    yield member, reader
+                finally:
+                    # 先頭だけ読んで飛ばしたメンバーも、次へ進む前に閉じる
+                    reader.close()
+
+    def _iter_tar(self) -> Iterator[Tuple[ArchiveMember, MemberReader]]:
+        # "r|*" はシークせずに先頭から読むストリームモード（圧縮形式は自動判定）
+        with tarfile.open(self.path, "r|*") as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                path = normalize_member_path(info.name)
+                if path is None or _excluded(path):
+                    continue
+                member = ArchiveMember(path, info.size, int(info.mtime * 1e9))
+                reader = MemberReader(lambda info=info: archive.extractfile(info))
+                try:
+                    yield member, reader
+                finally:
+                    reader.close()
@@ -0,0 +1,181 @@
+"""
+LightRAGの処理待ちドキュメント数を見て登録を止める（バックプレッシャー）と、登録から索引完了までの時間の計測
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from src.lightrag_client import LightRAGClient
+from src.metrics import MetricsRecorder, NULL_METRICS
+
+logger = logging.getLogger(__name__)
+
+# 処理待ちとして数える状態
+WAITING_STATUSES = ("pending", "processing")
+# 索引の処理が終わった状態
+FINISHED_STATUSES = ("processed", "failed")
+DEFAULT_POLL_SECONDS = 10.0
+# 索引完了までの時間を計るためにドキュメントの一覧（GET /documents）を取得する最短の間隔
+DEFAULT_LIST_SECONDS = 60.0
+# 続けてこの回数だけ状態を取得できなければ、処理待ちの数を忘れて登録を止めない
+MAX_POLL_FAILURES = 3
+
+
+def pipeline_depth(status: Dict[str, Any]) -> int:
+    """/documents/pipeline_status の応答から処理待ちの数を読む（件数の内訳がなければ処理中の件数）"""
+    if any(key in status for key in WAITING_STATUSES):
+        return sum(int(status.get(key) or 0) for key in WAITING_STATUSES)
+    return int(status.get("docs") or 0) if status.get("busy") else 0
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PipelineMonitor:
+    """
+    LightRAGのドキュメントの状態を定期的に取得し、処理待ちが多すぎる間は登録を待たせる
+
+    処理待ち（pending + processing）が high_water 以上になったら止め、low_water 以下に
+    なるまで poll_seconds ごとに確認する。取得の間に登録したドキュメントは処理待ちに
+    加えて数えるので、取得の間隔の間に登録しすぎることはない。処理待ちの数は件数だけの
+    /documents/pipeline_status から取得し、全ドキュメントの一覧は list_seconds ごとにだけ
+    取得して、登録したドキュメントが processed / failed になるまでの時間を計測する。
+    max_poll_failures 回続けて取得できなければ処理待ちの数を忘れ、止めずに登録する。
+    high_water が0なら何もしない
+    """
+
+    def __init__(self, client: LightRAGClient, high_water: int = 0, low_water: Optional[int] = None,
+                 poll_seconds: float = DEFAULT_POLL_SECONDS, metrics: Optional[MetricsRecorder] = None,
+                 list_seconds: float = DEFAULT_LIST_SECONDS, max_poll_failures: int = MAX_POLL_FAILURES,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.high_water = high_water
+        self.low_water = high_water // 2 if low_water is None else min(low_water, high_water)
+        self.poll_seconds = poll_seconds
+        self.list_seconds = max(poll_seconds, list_seconds)
+        self.max_poll_failures = max(1, max_poll_failures)
+        self.metrics = metrics or NULL_METRICS
+        self.clock = clock
+        self.sleep = sleep
+        self.depth: Optional[int] = None
+        self.max_depth = 0
+        self.polled_at: Optional[float] = None
+        self.listed_at: Optional[float] = None
+        self.poll_failures = 0
+        # 古いLightRAGには /documents/pipeline_status がないので、一覧から数える
+        self.count_endpoint = True
+        self.pauses = 0
+        # 登録したがまだ索引が終わっていないドキュメント → 登録した時刻
+        self.submitted: Dict[str, float] = {}
+        self.latencies: List[float] = []
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.high_water > 0
+
+    def track(self, doc_ids: Iterable[str]):
+        """登録を受け付けられたドキュメント"""
+        if not self.enabled:
+            return
+        now = self.clock()
+        added = 0
+        for doc_id in doc_ids:
+            if doc_id not in self.submitted:
+                self.submitted[doc_id] = now
+                added += 1
+        if self.depth is not None:
+            self.depth += added
+
+    def poll(self, list_documents: bool = False) -> Optional[int]:
+        """
+        状態を取得して処理待ちの数を返す
+
+        取得できなければ前回の値を返し、max_poll_failures 回続けて失敗したら None（止めない）にする
+
+        Args:
+            list_documents: 間隔に関係なくドキュメントの一覧も取得するか（最後の集計用）
+        """
+        now = self.clock()
+        self.polled_at = now
+        try:
+            depth = self._queue_depth(now, list_documents)
+        except requests.RequestException as e:
+            self.poll_failures += 1
+            if self.poll_failures < self.max_poll_failures:
+                logger.warning(f"LightRAGのドキュメントの状態を取得できません: {e}")
+            else:
+                logger.warning(f"LightRAGのドキュメントの状態を {self.poll_failures} 回続けて取得できないため、"
+                               f"処理待ちを確認せずに登録します: {e}")
+                self.depth = None
+            return self.depth
+        self.poll_failures = 0
+        self.depth = depth
+        self.max_depth = max(self.max_depth, self.depth)
+        self.metrics.gauge("lightrag_queue_depth", self.depth)
+        return self.depth
+
+    def _queue_depth(self, now: float, list_documents: bool) -> int:
+        """処理待ちの数。一覧を取得する時期なら、一覧から数えて索引完了までの時間も記録する"""
+        if not list_documents and self.count_endpoint and not (
+                self.submitted and (self.listed_at is None or now - self.listed_at >= self.list_seconds)):
+            try:
+                return pipeline_depth(self.client.pipeline_status())
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                logger.warning("LightRAGに /documents/pipeline_status がないため、ドキュメントの一覧から数えます")
+                self.count_endpoint = False
+        statuses = self.client.document_statuses()
+        self.listed_at = now
+        for status in FINISHED_STATUSES:
+            for document in statuses.get(status, []):
+                submitted = self.submitted.pop(document.get("id"), None)
+                if submitted is None:
+                    continue
+                self.latencies.append(now - submitted)
+                self.metrics.observe("indexed_latency", now - submitted)
+                if status == "failed":
+                    self.failed += 1
+        return sum(len(statuses.get(status, [])) for status in WAITING_STATUSES)
+
+    def wait_for_capacity(self) -> float:
+        """処理待ちが high_water 未満なら待たずに戻る。止めた場合は low_water 以下まで待ち、待った秒数を返す"""
+        if not self.enabled:
+            return 0.0
+        if self.polled_at is None or self.clock() - self.polled_at >= self.poll_seconds:
+            self.poll()
+        if self.depth is None or self.depth < self.high_water:
+            return 0.0
+        self.pauses += 1
+        started = self.clock()
+        logger.info(f"LightRAGの処理待ちが {self.depth} 件あるため、{self.low_water} 件以下になるまで登録を止めます")
+        while self.depth is not None and self.depth > self.low_water:
+            self.sleep(self.poll_seconds)
+            self.poll()
+        waited = self.clock() - started
+        logger.info(f"処理待ちが {self.depth} 件になったので登録を再開します（{waited:.0f}秒待機）")
+        return waited
+
+    def summary(self) -> Dict[str, Any]:
+        """処理待ちの数と、登録から索引完了までの時間（秒）の集計"""
+        result: Dict[str, Any] = {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "pauses": self.pauses,
+            "indexed_documents": len(self.latencies),
+            "failed_documents": self.failed,
+            "still_indexing": len(self.submitted)
+        }
+        if self.latencies:
+            result.update(
+                indexed_latency_p50=round(_percentile(self.latencies, 0.5), 2),
+                indexed_latency_p95=round(_percentile(self.latencies, 0.95), 2),
+                indexed_latency_max=round(max(self.latencies), 2)
+            )
+        return result
@@ -0,0 +1,194 @@
+"""
+チャンク本文の正規化ハッシュによる重複除去
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 文字列リテラルを残しつつPascalのコメントを取り除くためのパターン
+_PASCAL_TOKEN_PATTERN = re.compile(
+    r"'(?:[^']|'')*'"      # 文字列リテラル
+    r"|\{\$[^}]*\}"        # コンパイラ指令 {$...}
+    r"|\{[^}]*\}"          # { } コメント
+    r"|\(\*.*?\*\)"        # (* *) コメント
+    r"|//[^\n]*",          # 行コメント
+    re.DOTALL
+)
+# create_simple_chunks がチャンク先頭に付ける行番号ヘッダ（同じ本文でも位置で変わるので除外）
+_LINE_HEADER_PATTERN = re.compile(r"^Line: \d+$", re.MULTILINE)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# 参照表に残す位置情報のキー
+_LOCATION_KEYS = [
+    "file_path", "chunk_type", "function_name", "class_name", "name",
+    "line_number", "line_start", "line_end", "chunk_index"
+]
+
+
+def chunk_location(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """チャンクのメタデータから参照表に残す位置情報だけを取り出す"""
+    return {key: metadata[key] for key in _LOCATION_KEYS if key in metadata}
+
+
+def _strip_pascal_comment(match: re.Match) -> str:
+    token = match.group(0)
+    if token.startswith("'") or token.startswith("{$"):
+        return token
+    return " "
+
+
+class ChunkDeduplicator:
+    """同一本文のチャンクを1回だけアップロードし、全出現箇所を参照表に記録するクラス"""
+
+    def __init__(self, reference_file: Optional[str] = ".lightrag_chunk_refs.json",
+                 strip_comments: bool = False):
+        """
+        Args:
+            reference_file: 参照表（ハッシュ→出現箇所）の保存先。Noneならメモリ上のみ
+            strip_comments: 正規化時にコメントも取り除くか
+        """
+        self.reference_file = reference_file
+        self.strip_comments = strip_comments
+        self.references = self.load_references()
+        self._dirty = False
+
+    def load_references(self) -> Dict[str, Dict[str, Any]]:
+        """参照表を読み込む"""
+        if self.reference_file and os.path.exists(self.reference_file):
+            try:
+                with open(self.reference_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("strip_comments", False) == self.strip_comments:
+                    return data.get("chunks", {})
+                logger.warning("正規化設定が変わったため参照表を作り直します")
+            except Exception as e:
+                logger.warning(f"参照表の読み込みに失敗: {e}")
+        return {}
+
+    def save_references(self):
+        """参照表を保存（変更があった場合のみ）"""
+        if not self.reference_file or not self._dirty:
+            return
+        try:
+            with open(self.reference_file, 'w', encoding='utf-8') as f:
+                json.dump({"strip_comments": self.strip_comments, "chunks": self.references},
+                          f, ensure_ascii=False, indent=2)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"参照表の保存に失敗: {e}")
+
+    def reset(self):
+        """参照表をリセット"""
+        self.references = {}
+        self._dirty = True
+        self.save_references()
+
+    def normalize(self, text: str) -> str:
+        """空白（と必要ならコメント）の違いを吸収した比較用テキストを作る"""
+        text = _LINE_HEADER_PATTERN.sub("", text)
+        if self.strip_comments:
+            text = _PASCAL_TOKEN_PATTERN.sub(_strip_pascal_comment, text)
+        return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+    def chunk_hash(self, text: str) -> str:
+        """正規化後の本文のハッシュ"""
+        return hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+
+    def register(self, chunk: Dict[str, Any]) -> bool:
+        """
+        チャンクを参照表に登録する
+
+        Returns:
+            初出の本文ならTrue（アップロードが必要）、既出ならFalse
+        """
+        metadata = chunk.get("metadata", {})
+        location = chunk_location(metadata)
+        digest = self.chunk_hash(chunk["content"])
+        chunk["content_hash"] = digest
+
+        entry = self.references.get(digest)
+        if entry is None:
+            self.references[digest] = {
+                "token_count": metadata.get("token_count", 0),
+                "locations": [location]
+            }
+            self._dirty = True
+            return True
+
+        # 再処理時に同じ位置が重複登録されないようにする
+        if location in entry["locations"]:
+            return entry["locations"][0] == location
+        entry["locations"].append(location)
+        self._dirty = True
+        return False
+
+    def filter_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """初出のチャンクだけを返す（既出のものは参照表に位置だけ記録）"""
+        return [chunk for chunk in chunks if self.register(chunk)]
+
+    def discard(self, chunks: List[Dict[str, Any]]):
+        """
+        アップロードできなかったチャンクの登録を取り消す
+
+        代表としてアップロードするはずだった本文（まだドキュメントIDがない）は参照表から消し、
+        同じ本文を持つ次のファイルが既出として飛ばさずにアップロードするようにする
+        """
+        for chunk in chunks:
+            digest = chunk.get("content_hash")
+            entry = self.references.get(digest)
+            if entry is None or entry.get("doc_id"):
+                continue
+            if entry["locations"][0].get("file_path") == chunk.get("metadata", {}).get("file_path"):
+                del self.references[digest]
+                self._dirty = True
+
+    def set_document(self, digest: str, doc_id: str):
+        """本文ハッシュに、代表としてアップロードしたLightRAGのドキュメントIDを記録する"""
+        entry = self.references.get(digest)
+        if entry is not None and entry.get("doc_id") != doc_id:
+            entry["doc_id"] = doc_id
+            self._dirty = True
+
+    def forget_file(self, file_path: str) -> Dict[str, str]:
+        """
+        ファイルの出現箇所を参照表から外す（出現箇所がなくなった本文は参照表から消える）
+
+        このファイルが代表としてアップロードした本文を他のファイルがまだ使っている場合、
+        そのドキュメントは消さずに残った先頭の出現箇所のファイルへ引き継ぐ
+
+        Returns:
+            引き継ぐドキュメントID → 引き継ぎ先のファイル
+        """
+        retained: Dict[str, str] = {}
+        for digest in list(self.references):
+            entry = self.references[digest]
+            locations = entry["locations"]
+            kept = [location for location in locations if location.get("file_path") != file_path]
+            if len(kept) == len(locations):
+                continue
+            self._dirty = True
+            if not kept:
+                del self.references[digest]
+                continue
+            if locations[0].get("file_path") == file_path and entry.get("doc_id"):
+                retained[entry["doc_id"]] = kept[0].get("file_path")
+            entry["locations"] = kept
+        return retained
+
+    def rename_file(self, old_path: str, new_path: str):
+        """ファイルの名前変更を参照表の出現箇所に反映する"""
+        for entry in self.references.values():
+            for location in entry["locations"]:
+                if location.get("file_path") == old_path:
+                    location["file_path"] = new_path
+                    self._dirty = True
+
+    def locations(self, digest: str) -> List[Dict[str, Any]]:
+        """本文ハッシュの全出現箇所（先頭がアップロードされた代表）"""
+        entry = self.references.get(digest)
+        return entry["locations"] if entry else []
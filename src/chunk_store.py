@@ -0,0 +1,182 @@
+"""
+チャンクストア: 解析・チャンク分割したチャンクをファイルに書き出し、別のホストから登録するための保存形式
+
+ストアはディレクトリで、gzip圧縮したNDJSONのセグメント（chunks-00000.ndjson.gz ...）と
+索引（index.ndjson）からなる。1ファイル分のチャンクを1つのgzipメンバーとしてセグメントに追記し、
+索引にはそのセグメント・位置・長さを1行追記する。同じファイルを書き直すと後の行が有効になる。
+ファイルの削除・名前変更も索引に1行ずつ記録し、登録時に書かれた順に反映する。
+どちらも追記だけなので、書き出しが途中で止まっても書き終えたファイルは読める
+"""
+import gzip
+import json
+import logging
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+INDEX_FILE = "index.ndjson"
+SEGMENT_NAME = "chunks-{:05d}.ndjson.gz"
+# セグメントがこの大きさを超えたら次のセグメントに書く
+SEGMENT_BYTES = 64 * 1024 * 1024
+# 読み込み時に一度に展開する圧縮データのバイト数
+READ_BYTES = 256 * 1024
+
+_SEGMENT_PATTERN = re.compile(r"^chunks-(\d{5})\.ndjson\.gz$")
+
+
+class ChunkStoreWriter:
+    """ファイルごとのチャンクをストアに追記する"""
+
+    def __init__(self, path: str, segment_bytes: int = SEGMENT_BYTES):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(_SEGMENT_PATTERN.match, os.listdir(path)) if match]
+        self.segment = max(numbers, default=0)
+        # 索引の最後の行が書きかけで止まっていたら、次の行とつながらないように改行する
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path) and os.path.getsize(index_path):
+            with open(index_path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def _segment_for_write(self) -> str:
+        name = SEGMENT_NAME.format(self.segment)
+        segment_path = os.path.join(self.path, name)
+        if os.path.exists(segment_path) and os.path.getsize(segment_path) >= self.segment_bytes:
+            self.segment += 1
+            name = SEGMENT_NAME.format(self.segment)
+        return name
+
+    def write_file(self, file_path: str, chunks: Iterable[Dict[str, Any]], **info) -> Dict[str, Any]:
+        """
+        1ファイル分のチャンクを書き出して索引に記録する（chunks はイテレータでもよい）
+
+        Args:
+            info: 索引に一緒に記録する情報（content_hash, bytes, auto_generated など）
+
+        Returns:
+            索引に書いたエントリ
+        """
+        name = self._segment_for_write()
+        count = tokens = 0
+        with open(os.path.join(self.path, name), "ab") as raw:
+            offset = raw.tell()
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed:
+                for chunk in chunks:
+                    record = {"content": chunk["content"], "metadata": chunk["metadata"]}
+                    compressed.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                    count += 1
+                    tokens += chunk["metadata"].get("token_count", 0)
+            length = raw.tell() - offset
+        entry = {"file_path": file_path, **info, "segment": name, "offset": offset, "length": length,
+                 "chunks": count, "tokens": tokens}
+        self._append_index(entry)
+        return entry
+
+    def remove_file(self, file_path: str):
+        """ファイルが削除されたことを記録する（登録時にそのファイルのドキュメントを消す）"""
+        self._append_index({"file_path": file_path, "removed": True})
+
+    def rename_file(self, old_path: str, new_path: str):
+        """ファイルの名前変更を記録する（登録時にドキュメントを新しい名前に引き継ぐ）"""
+        self._append_index({"file_path": new_path, "renamed_from": old_path})
+
+    def _append_index(self, entry: Dict[str, Any]):
+        entry = {"version": STORE_VERSION, **entry, "written_at": datetime.now().isoformat()}
+        with open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class ChunkStoreReader:
+    """ストアの索引を読み、書かれた順にファイルのチャンク・削除・名前変更を取り出す"""
+
+    def __init__(self, path: str):
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"チャンクストアの索引がありません: {index_path}")
+        self.log: List[Dict[str, Any]] = []
+        # 間に削除・名前変更を挟まずに同じファイルが書き直された、古いチャンクのエントリ（log の位置）
+        self.superseded: Set[int] = set()
+        # ファイルごとの、まだ書き直されていない最後のチャンクのエントリ
+        last_write: Dict[str, int] = {}
+        with open(index_path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き出しの途中で止まった最後の行
+                    logger.warning(f"索引の{number}行目を読めないため無視します: {index_path}")
+                    continue
+                if entry.get("version", STORE_VERSION) > STORE_VERSION:
+                    raise ValueError(f"新しい形式のチャンクストアです（version {entry['version']}）: {path}")
+                if "segment" in entry:
+                    if entry["file_path"] in last_write:
+                        self.superseded.add(last_write[entry["file_path"]])
+                    last_write[entry["file_path"]] = len(self.log)
+                else:
+                    # 削除・名前変更の前のチャンクは、その操作で必要になるので飛ばさない
+                    last_write.pop(entry["file_path"], None)
+                    last_write.pop(entry.get("renamed_from"), None)
+                self.log.append(entry)
+
+    def entries(self, start: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        索引の start 行目（0から）以降の (位置, エントリ) を書かれた順に返す
+
+        後で書き直されたファイルの古いチャンクのエントリは、間にそのファイルの削除・名前変更が
+        なければ飛ばす（A を書く → A を B に名前変更 → A を書く、では最初の A も B の内容として読む）
+        """
+        for position in range(start, len(self.log)):
+            if position not in self.superseded:
+                yield position, self.log[position]
+
+    def read_chunks(self, entry: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """エントリのチャンクを、gzipメンバーを少しずつ展開しながら返す"""
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        pending = b""
+        with open(os.path.join(self.path, entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            remaining = entry["length"]
+            while remaining:
+                block = f.read(min(READ_BYTES, remaining))
+                if not block:
+                    raise ValueError(f"セグメントが途中で切れています: {entry['segment']}")
+                remaining -= len(block)
+                *lines, pending = (pending + decompressor.decompress(block)).split(b"\n")
+                for line in lines:
+                    yield json.loads(line)
+        pending += decompressor.flush()
+        if pending.strip():
+            yield json.loads(pending)
+
+
+def summarize_store(reader: ChunkStoreReader) -> Dict[str, Any]:
+    """ストアの最新の状態（削除・名前変更を反映したあと）のファイル数・チャンク数・トークン数"""
+    current: Dict[str, Dict[str, Any]] = {}
+    removed = 0
+    for entry in reader.log:
+        if entry.get("removed"):
+            removed += 1
+            current.pop(entry["file_path"], None)
+        elif entry.get("renamed_from"):
+            moved = current.pop(entry["renamed_from"], None)
+            if moved is not None:
+                current[entry["file_path"]] = moved
+        else:
+            current[entry["file_path"]] = entry
+    return {
+        "files": len(current),
+        "chunks": sum(entry["chunks"] for entry in current.values()),
+        "tokens": sum(entry["tokens"] for entry in current.values()),
+        "removed_files": removed
+    }
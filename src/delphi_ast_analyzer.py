@@ -1,12 +1,23 @@
 import tree_sitter
 import tree_sitter_pascal
 from typing import Dict, List, Any, Optional
+from importlib import metadata
 import json
 
+# 抽出結果の形式を変えたら上げる（解析キャッシュの無効化に使う）
+ANALYZER_VERSION = 3
+
 
 class DelphiASTAnalyzer:
     def __init__(self):
         self.parser = tree_sitter.Parser(tree_sitter.Language(tree_sitter_pascal.language()))
+
+    def version_key(self) -> str:
+        try:
+            grammar_version = metadata.version("tree-sitter-pascal")
+        except metadata.PackageNotFoundError:
+            grammar_version = "unknown"
+        return f"analyzer-{ANALYZER_VERSION}/tree-sitter-pascal-{grammar_version}"
         
     def parse_code(self, code: str) -> tree_sitter.Tree:
         return self.parser.parse(bytes(code, "utf8"))
@@ -32,15 +43,34 @@ class DelphiASTAnalyzer:
             results.extend(self.find_nodes_by_type(child, node_type))
         return results
     
+    def extract_ast_info(self, code: str) -> Dict[str, Any]:
+        return self.ast_info_from_tree(self.parse_code(code))
+    
+    def ast_info_from_tree(self, tree: tree_sitter.Tree) -> Dict[str, Any]:
+        return {
+            "functions": self._functions_from_tree(tree),
+            "classes": self._classes_from_tree(tree)
+        }
+    
     def extract_functions(self, code: str) -> List[Dict[str, Any]]:
-        tree = self.parse_code(code)
-        function_nodes = self.find_nodes_by_type(tree.root_node, "declProc")
-        function_defs = self.find_nodes_by_type(tree.root_node, "defProc")
-        
+        return self._functions_from_tree(self.parse_code(code))
+    
+    def _functions_from_tree(self, tree: tree_sitter.Tree) -> List[Dict[str, Any]]:
+        """
+        関数・メソッドの宣言と実装
+
+        実装（defProc）は見出しの declProc を子に持つので、declProc だけを集めて親が defProc なら
+        本体を含む defProc の範囲を使う。name はルーチン名だけ（ButtonAddClick）、qualified_name は
+        クラス名付きの名前（TFormMain.ButtonAddClick）。line_start / line_end は1から始まる行番号、
+        start_byte / end_byte はUTF-8にした内容でのバイト位置
+        """
         functions = []
-        for node in function_nodes + function_defs:
+        for node in self.find_nodes_by_type(tree.root_node, "declProc"):
+            implementation = node.parent is not None and node.parent.type == "defProc"
+            span = node.parent if implementation else node
             func_type = "unknown"
             name = "unknown"
+            class_name = None
             
             for child in node.children:
                 if child.type in ["kFunction", "kProcedure", "kConstructor", "kDestructor"]:
@@ -48,23 +78,49 @@ class DelphiASTAnalyzer:
                 elif child.type == "identifier":
                     name = child.text.decode("utf8")
                 elif child.type == "genericDot":
-                    # For implementation section: ClassName.MethodName
-                    for subchild in child.children:
-                        if subchild.type == "identifier" and subchild.next_sibling and subchild.next_sibling.type != ".":
-                            name = subchild.text.decode("utf8")
+                    # 実装部の ClassName.MethodName（入れ子のクラスなら Outer.Inner.MethodName）
+                    parts = [sub.text.decode("utf8") for sub in child.children if sub.type == "identifier"]
+                    if parts:
+                        name = parts[-1]
+                        class_name = ".".join(parts[:-1]) or None
+            if class_name is None and not implementation:
+                class_name = self._enclosing_class(node)
             
             if name != "unknown":
                 functions.append({
                     "type": func_type,
                     "name": name,
-                    "line": node.start_point[0] + 1,
-                    "full_text": node.text.decode("utf8")[:100] + "..."
+                    "qualified_name": f"{class_name}.{name}" if class_name else name,
+                    "class_name": class_name,
+                    "implementation": implementation,
+                    "line": span.start_point[0] + 1,
+                    "line_start": span.start_point[0] + 1,
+                    "line_end": span.end_point[0] + 1,
+                    "start_byte": span.start_byte,
+                    "end_byte": span.end_byte,
+                    "full_text": span.text.decode("utf8")[:100] + "..."
                 })
         
         return functions
     
+    def _enclosing_class(self, node: tree_sitter.Node) -> Optional[str]:
+        """クラスの中で宣言されたメソッドのクラス名"""
+        parent = node.parent
+        while parent is not None and parent.type != "declClass":
+            if parent.type == "defProc":
+                return None
+            parent = parent.parent
+        if parent is None or parent.parent is None or parent.parent.type != "declType":
+            return None
+        for child in parent.parent.children:
+            if child.type == "identifier":
+                return child.text.decode("utf8")
+        return None
+    
     def extract_classes(self, code: str) -> List[Dict[str, Any]]:
-        tree = self.parse_code(code)
+        return self._classes_from_tree(self.parse_code(code))
+    
+    def _classes_from_tree(self, tree: tree_sitter.Tree) -> List[Dict[str, Any]]:
         type_nodes = self.find_nodes_by_type(tree.root_node, "declType")
         
         classes = []
@@ -82,6 +138,10 @@ class DelphiASTAnalyzer:
                 classes.append({
                     "name": name,
                     "line": node.start_point[0] + 1,
+                    "line_start": node.start_point[0] + 1,
+                    "line_end": node.end_point[0] + 1,
+                    "start_byte": node.start_byte,
+                    "end_byte": node.end_byte,
                     "full_text": node.text.decode("utf8")[:200] + "..."
                 })
         
@@ -0,0 +1,188 @@
+"""
+バイナリ形式のDFM（TPF0）の読み込み
+
+Delphiの TReader と同じ順にストリームから少しずつ読み、テキスト形式のDFMと同じ
+コンポーネントの木（src/dfm_parser.py）を組み立てる。バイナリデータ（Picture.Data など）は
+先頭の数バイトだけを読み、残りは読み飛ばす
+"""
+import math
+import struct
+from typing import Any, BinaryIO, Optional
+
+from src.dfm_parser import (
+    BINARY_HEAD_BYTES, BinaryData, Collection, CollectionItem, DfmComponent, DfmList, DfmProperty, DfmSet,
+    DfmSyntaxError, Identifier
+)
+
+BINARY_DFM_SIGNATURE = b"TPF0"
+# 古いフォームのANSI文字列（vaString / vaLString）の文字コード
+ANSI_ENCODING = "shift_jis"
+
+# TValueType（Classes.pas）
+VA_NULL, VA_LIST, VA_INT8, VA_INT16, VA_INT32, VA_EXTENDED, VA_STRING, VA_IDENT = range(8)
+VA_FALSE, VA_TRUE, VA_BINARY, VA_SET, VA_LSTRING, VA_NIL, VA_COLLECTION, VA_SINGLE = range(8, 16)
+VA_CURRENCY, VA_DATE, VA_WSTRING, VA_INT64, VA_UTF8STRING, VA_DOUBLE = range(16, 22)
+
+# TFilerFlags（コンポーネントの前に付く 0xF? のバイトの下位4ビット）
+FF_INHERITED = 1
+FF_CHILD_POS = 2
+FF_INLINE = 4
+
+_INTEGER_FORMATS = {VA_INT8: "<b", VA_INT16: "<h", VA_INT32: "<i", VA_INT64: "<q"}
+_SKIP_BYTES = 64 * 1024
+
+
+def is_binary_dfm(head: bytes) -> bool:
+    """先頭のバイト列がバイナリ形式のDFMか"""
+    return head.startswith(BINARY_DFM_SIGNATURE)
+
+
+def _extended(raw: bytes) -> float:
+    """80ビットの拡張倍精度浮動小数点数"""
+    mantissa, exponent = struct.unpack("<QH", raw)
+    sign = -1.0 if exponent & 0x8000 else 1.0
+    exponent &= 0x7FFF
+    if exponent == 0x7FFF:
+        return sign * math.inf if mantissa << 1 == 0 else math.nan
+    try:
+        return sign * math.ldexp(mantissa, exponent - 16383 - 63)
+    except OverflowError:
+        return sign * math.inf
+
+
+class _Reader:
+    def __init__(self, stream: BinaryIO, ansi_encoding: str):
+        self.stream = stream
+        self.ansi_encoding = ansi_encoding
+        self.pending: Optional[int] = None
+
+    def read(self, size: int) -> bytes:
+        if size < 0:
+            raise DfmSyntaxError(f"バイナリ形式のフォームの長さが負です: {size}")
+        data = b""
+        if self.pending is not None and size:
+            data = bytes([self.pending])
+            self.pending = None
+        data += self.stream.read(size - len(data))
+        if len(data) < size:
+            raise DfmSyntaxError("バイナリ形式のフォームが途中で終わっています")
+        return data
+
+    def byte(self) -> int:
+        return self.read(1)[0]
+
+    def peek(self) -> int:
+        if self.pending is None:
+            self.pending = self.byte()
+        return self.pending
+
+    def skip(self, size: int):
+        while size:
+            size -= len(self.read(min(size, _SKIP_BYTES)))
+
+    def unpack(self, fmt: str) -> Any:
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def end_of_list(self) -> bool:
+        if self.peek() == VA_NULL:
+            self.pending = None
+            return True
+        return False
+
+    def short_string(self) -> str:
+        return self.read(self.byte()).decode(self.ansi_encoding, errors="replace")
+
+    def component(self) -> DfmComponent:
+        kind = "object"
+        index = None
+        if self.peek() & 0xF0 == 0xF0:
+            flags = self.byte() & 0x0F
+            if flags & FF_INLINE:
+                kind = "inline"
+            elif flags & FF_INHERITED:
+                kind = "inherited"
+            if flags & FF_CHILD_POS:
+                index = self.value()
+        class_name = self.short_string()
+        component = DfmComponent(kind, self.short_string(), class_name, index)
+        while not self.end_of_list():
+            component.properties.append(self.property())
+        while not self.end_of_list():
+            component.children.append(self.component())
+        return component
+
+    def property(self) -> DfmProperty:
+        return DfmProperty(self.short_string(), self.value(), 0)
+
+    def value(self) -> Any:
+        value_type = self.byte()
+        if value_type in _INTEGER_FORMATS:
+            return self.unpack(_INTEGER_FORMATS[value_type])
+        if value_type in (VA_STRING, VA_IDENT):
+            text = self.short_string()
+            return Identifier(text) if value_type == VA_IDENT else text
+        if value_type == VA_LSTRING:
+            return self.read(self.unpack("<i")).decode(self.ansi_encoding, errors="replace")
+        if value_type == VA_WSTRING:
+            return self.read(self.unpack("<i") * 2).decode("utf-16-le", errors="replace")
+        if value_type == VA_UTF8STRING:
+            return self.read(self.unpack("<i")).decode("utf-8", errors="replace")
+        if value_type == VA_EXTENDED:
+            return _extended(self.read(10))
+        if value_type == VA_SINGLE:
+            return self.unpack("<f")
+        if value_type in (VA_DOUBLE, VA_DATE):
+            return self.unpack("<d")
+        if value_type == VA_CURRENCY:
+            return self.unpack("<q") / 10000
+        if value_type in (VA_FALSE, VA_TRUE, VA_NIL, VA_NULL):
+            return Identifier({VA_FALSE: "False", VA_TRUE: "True", VA_NIL: "nil", VA_NULL: "Null"}[value_type])
+        if value_type == VA_BINARY:
+            size = self.unpack("<i")
+            head = self.read(min(size, BINARY_HEAD_BYTES))
+            self.skip(size - len(head))
+            return BinaryData(size, head)
+        if value_type == VA_SET:
+            items = DfmSet()
+            while True:
+                name = self.short_string()
+                if not name:
+                    return items
+                items.append(Identifier(name))
+        if value_type == VA_LIST:
+            items = DfmList()
+            while not self.end_of_list():
+                items.append(self.value())
+            return items
+        if value_type == VA_COLLECTION:
+            return self.collection()
+        raise DfmSyntaxError(f"バイナリ形式のフォームに不明な値の型があります: {value_type}")
+
+    def collection(self) -> Collection:
+        items = Collection()
+        while not self.end_of_list():
+            index = None
+            if self.peek() in _INTEGER_FORMATS:
+                index = self.value()
+            if self.byte() != VA_LIST:
+                raise DfmSyntaxError("コレクションの項目の始まりがありません")
+            properties = []
+            while not self.end_of_list():
+                properties.append(self.property())
+            items.append(CollectionItem(properties, index))
+        return items
+
+
+def read_binary_dfm(stream: BinaryIO, ansi_encoding: str = ANSI_ENCODING) -> DfmComponent:
+    """
+    バイナリ形式のDFMを読んでフォームのコンポーネントを返す
+
+    ストリームは先頭から順に読むだけで、全体をメモリに読み込まない。
+    バイナリ形式には行がないので、コンポーネントとプロパティの行番号は0になる
+
+    Raises:
+        DfmSyntaxError: TPF0で始まらない、または途中で壊れている場合
+    """
+    if not is_binary_dfm(stream.read(len(BINARY_DFM_SIGNATURE))):
+        raise DfmSyntaxError("バイナリ形式のフォーム（TPF0）ではありません")
+    return _Reader(stream, ansi_encoding).component()
@@ -0,0 +1,498 @@
+"""
+DFM（フォーム定義）のコンポーネントの木と、コンポーネント単位のチャンク分割
+
+テキスト形式のDFMを行ごとに読み、object / inherited / inline のコンポーネントの木と、
+プロパティ（文字列・数値・識別子・集合・リスト・コレクション・バイナリデータ）を組み立てる。
+バイナリデータは中身を持たず、大きさと先頭の数バイトだけを残す
+"""
+import logging
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OBJECT_KEYWORDS = ("object", "inherited", "inline")
+# summarize: バイナリプロパティを大きさとクラス名だけの1行にする / drop: 本文に含めない
+BINARY_POLICIES = ("summarize", "drop")
+# 小さなコンポーネントはこのトークン数まで1つのチャンクにまとめる
+DFM_CHUNK_TOKENS = 1000
+# バイナリデータのうち残す先頭のバイト数（グラフィックのクラス名の判定用）
+BINARY_HEAD_BYTES = 64
+
+_TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*')
+  | (?P<char>\#(?:\$[0-9A-Fa-f]+|\d+))
+  | (?P<number>-?(?:\$[0-9A-Fa-f]+|\d+(?:\.\d+)?(?:[eE][-+]?\d+)?))
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<symbol>[=:\[\](),<>.+{])
+)""", re.VERBOSE)
+_CLASS_NAME_PATTERN = re.compile(rb"[A-Za-z_][A-Za-z0-9_]*")
+# イベントのプロパティ名（OnClick）と、ハンドラ名ではない識別子の値
+_EVENT_NAME_PATTERN = re.compile(r"On[A-Z]")
+_NON_HANDLER_VALUES = ("true", "false", "nil")
+
+
+class DfmSyntaxError(ValueError):
+    """DFMとして読めない"""
+
+
+class Identifier(str):
+    """引用符のない識別子の値（True、clBtnFace、イベントハンドラ名など）"""
+
+
+class DfmSet(list):
+    """[akLeft, akTop] のような集合"""
+
+
+class DfmList(list):
+    """( 'a' 'b' ) のような値の並び（TStrings など）"""
+
+
+class Collection(list):
+    """< item ... end > のコレクションの項目（CollectionItem）の並び"""
+
+
+class BinaryData(NamedTuple):
+    """{ ... } のバイナリデータ（大きさと先頭のバイトだけ）"""
+    size: int
+    head: bytes
+
+    @property
+    def class_name(self) -> Optional[str]:
+        """Picture.Data などの先頭に書かれているグラフィックのクラス名"""
+        if not self.head:
+            return None
+        name = self.head[1:1 + self.head[0]]
+        if len(name) == self.head[0] and _CLASS_NAME_PATTERN.fullmatch(name):
+            return name.decode("ascii")
+        return None
+
+
+class DfmProperty(NamedTuple):
+    name: str
+    value: Any
+    line: int
+
+
+class CollectionItem(NamedTuple):
+    properties: List[DfmProperty]
+    index: Optional[int]
+
+
+class DfmComponent:
+    """DFMのコンポーネント（フォーム自身も含む）"""
+
+    def __init__(self, kind: str, name: str, class_name: str, index: Optional[int] = None, line_start: int = 0):
+        self.kind = kind
+        self.name = name
+        self.class_name = class_name
+        self.index = index
+        self.properties: List[DfmProperty] = []
+        self.children: List["DfmComponent"] = []
+        self.line_start = line_start
+        self.line_end = line_start
+
+    def __repr__(self) -> str:
+        return f"<{self.kind} {self.name}: {self.class_name}>"
+
+    def property(self, name: str, default: Any = None) -> Any:
+        for prop in self.properties:
+            if prop.name == name:
+                return prop.value
+        return default
+
+    def events(self) -> List[Tuple[str, str]]:
+        """
+        イベントとハンドラの組（OnClick = Button1Click など）
+
+        On の次が大文字のプロパティだけをイベントとし（OnlyNumbers は除く）、True / False / nil の値は
+        ハンドラとみなさない
+        """
+        return [(prop.name, str(prop.value)) for prop in self.properties
+                if _EVENT_NAME_PATTERN.match(prop.name.split(".")[-1]) and isinstance(prop.value, Identifier)
+                and prop.value.lower() not in _NON_HANDLER_VALUES]
+
+    def shallow(self) -> "DfmComponent":
+        """子コンポーネントを除いた写し（自身のプロパティだけを描くため）"""
+        copy = DfmComponent(self.kind, self.name, self.class_name, self.index, self.line_start)
+        copy.properties = self.properties
+        copy.line_end = self.line_end
+        return copy
+
+    def walk(self) -> Iterator["DfmComponent"]:
+        """このコンポーネントと子孫（親が先）"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class _BinaryReader:
+    def __init__(self, line: int):
+        self.line = line
+        self.digits = 0
+        self.head: List[str] = []
+        self.head_digits = 0
+
+    def add(self, text: str):
+        hex_digits = "".join(text.split())
+        self.digits += len(hex_digits)
+        if self.head_digits < BINARY_HEAD_BYTES * 2:
+            self.head.append(hex_digits[:BINARY_HEAD_BYTES * 2 - self.head_digits])
+            self.head_digits += len(self.head[-1])
+
+    def result(self) -> BinaryData:
+        head = "".join(self.head)
+        try:
+            head_bytes = bytes.fromhex(head[:len(head) // 2 * 2])
+        except ValueError:
+            raise DfmSyntaxError(f"{self.line}行目: バイナリデータが16進数ではありません") from None
+        return BinaryData(self.digits // 2, head_bytes)
+
+
+def _tokenize(lines: Iterable[str]) -> Iterator[Tuple[str, Any, int]]:
+    """(種類, 値, 行番号) を返す。バイナリデータは1つの binary トークンになる"""
+    binary: Optional[_BinaryReader] = None
+    number = 0
+    for number, line in enumerate(lines, 1):
+        position = 0
+        if binary is not None:
+            end = line.find("}")
+            binary.add(line if end < 0 else line[:end])
+            if end < 0:
+                continue
+            yield "binary", binary.result(), binary.line
+            binary = None
+            position = end + 1
+        while True:
+            match = _TOKEN_PATTERN.match(line, position)
+            if match is None:
+                rest = line[position:].strip()
+                if rest:
+                    raise DfmSyntaxError(f"{number}行目: 読めない文字があります: {rest[:20]!r}")
+                break
+            position = match.end()
+            kind = match.lastgroup
+            text = match.group(kind)
+            if text == "{":
+                binary = _BinaryReader(number)
+                end = line.find("}", position)
+                binary.add(line[position:] if end < 0 else line[position:end])
+                if end < 0:
+                    break
+                yield "binary", binary.result(), number
+                binary = None
+                position = end + 1
+                continue
+            yield kind, text, number
+    if binary is not None:
+        raise DfmSyntaxError(f"{binary.line}行目: バイナリデータが閉じていません")
+
+
+def _decode_string(kind: str, text: str) -> str:
+    if kind == "string":
+        return text[1:-1].replace("''", "'")
+    code = text[1:]
+    return chr(int(code[1:], 16) if code.startswith("$") else int(code))
+
+
+def _parse_number(text: str):
+    sign = -1 if text.startswith("-") else 1
+    digits = text.lstrip("-")
+    if digits.startswith("$"):
+        return sign * int(digits[1:], 16)
+    if "." in digits or "e" in digits.lower():
+        return sign * float(digits)
+    return sign * int(digits)
+
+
+class _Parser:
+    def __init__(self, tokens: Iterator[Tuple[str, Any, int]]):
+        self.tokens = tokens
+        self.current = next(tokens, None)
+        self.line = self.current[2] if self.current else 0
+
+    def advance(self) -> Tuple[str, Any, int]:
+        token = self.current
+        if token is None:
+            raise DfmSyntaxError(f"{self.line}行目のあとでファイルが終わっています")
+        self.line = token[2]
+        self.current = next(self.tokens, None)
+        return token
+
+    def at(self, kind: str, text: Optional[str] = None) -> bool:
+        if self.current is None or self.current[0] != kind:
+            return False
+        return text is None or str(self.current[1]).lower() == text
+
+    def expect(self, kind: str, text: Optional[str] = None) -> Tuple[str, Any, int]:
+        if not self.at(kind, text):
+            found = "ファイルの終わり" if self.current is None else repr(self.current[1])
+            raise DfmSyntaxError(f"{self.line}行目: {text or kind} がありません（{found}）")
+        return self.advance()
+
+    def at_object(self) -> bool:
+        return self.at("ident") and self.current[1].lower() in OBJECT_KEYWORDS
+
+    def parse_component(self) -> DfmComponent:
+        if not self.at_object():
+            self.expect("ident", "object")
+        _, kind, line = self.advance()
+        _, name, _ = self.expect("ident")
+        class_name = name
+        if self.at("symbol", ":"):
+            self.advance()
+            class_name = self.expect("ident")[1]
+        else:
+            name = ""
+        index = None
+        if self.at("symbol", "["):
+            self.advance()
+            index = _parse_number(self.expect("number")[1])
+            self.expect("symbol", "]")
+        component = DfmComponent(kind.lower(), name, class_name, index, line)
+        while not self.at("ident", "end"):
+            if self.at_object():
+                component.children.append(self.parse_component())
+            else:
+                component.properties.append(self.parse_property())
+        component.line_end = self.advance()[2]
+        return component
+
+    def parse_property(self) -> DfmProperty:
+        _, name, line = self.expect("ident")
+        while self.at("symbol", "."):
+            self.advance()
+            name += "." + self.expect("ident")[1]
+        self.expect("symbol", "=")
+        return DfmProperty(name, self.parse_value(), line)
+
+    def parse_value(self) -> Any:
+        if self.current is None:
+            self.expect("value")
+        kind, text, _ = self.current
+        if kind in ("string", "char"):
+            return self.parse_string()
+        if kind == "number":
+            self.advance()
+            return _parse_number(text)
+        if kind == "binary":
+            self.advance()
+            return text
+        if kind == "ident":
+            self.advance()
+            while self.at("symbol", "."):
+                self.advance()
+                text += "." + self.expect("ident")[1]
+            return Identifier(text)
+        if text == "[":
+            self.advance()
+            items = DfmSet()
+            while not self.at("symbol", "]"):
+                if self.at("symbol", ","):
+                    self.advance()
+                    continue
+                items.append(self.parse_value())
+            self.advance()
+            return items
+        if text == "(":
+            self.advance()
+            items = DfmList()
+            while not self.at("symbol", ")"):
+                items.append(self.parse_value())
+            self.advance()
+            return items
+        if text == "<":
+            self.advance()
+            return self.parse_collection()
+        raise DfmSyntaxError(f"{self.line}行目: 値がありません（{text!r}）")
+
+    def parse_string(self) -> str:
+        """'abc'#13#10'def' のように続けた文字列と、+ で次の行へ続けた文字列をつなげる"""
+        parts = []
+        kind, text, line = self.advance()
+        parts.append(_decode_string(kind, text))
+        while True:
+            if (self.at("string") or self.at("char")) and self.current[2] == line:
+                kind, text, line = self.advance()
+                parts.append(_decode_string(kind, text))
+            elif self.at("symbol", "+"):
+                self.advance()
+                if not (self.at("string") or self.at("char")):
+                    self.expect("string")
+                kind, text, line = self.advance()
+                parts.append(_decode_string(kind, text))
+            else:
+                return "".join(parts)
+
+    def parse_collection(self) -> Collection:
+        items = Collection()
+        while not self.at("symbol", ">"):
+            self.expect("ident", "item")
+            index = None
+            if self.at("symbol", "["):
+                self.advance()
+                index = _parse_number(self.expect("number")[1])
+                self.expect("symbol", "]")
+            properties = []
+            while not self.at("ident", "end"):
+                properties.append(self.parse_property())
+            self.advance()
+            items.append(CollectionItem(properties, index))
+        self.advance()
+        return items
+
+
+def parse_dfm(lines: Iterable[str]) -> DfmComponent:
+    """
+    テキスト形式のDFMを読んでフォームのコンポーネントを返す
+
+    lines は1行ずつ読むので、巨大なフォームも行のイテレータから読める
+
+    Raises:
+        DfmSyntaxError: DFMとして読めない場合
+    """
+    parser = _Parser(_tokenize(lines))
+    root = parser.parse_component()
+    if parser.current is not None:
+        raise DfmSyntaxError(f"{parser.current[2]}行目: フォームの end のあとに続きがあります")
+    return root
+
+
+def format_string(text: str) -> str:
+    """Pascalの文字列リテラルにする（制御文字は #n）"""
+    parts = []
+    quoted = []
+    for char in text:
+        if ord(char) < 32:
+            if quoted:
+                parts.append("'" + "".join(quoted) + "'")
+                quoted = []
+            parts.append(f"#{ord(char)}")
+        else:
+            quoted.append("''" if char == "'" else char)
+    if quoted or not parts:
+        parts.append("'" + "".join(quoted) + "'")
+    return "".join(parts)
+
+
+def format_value(value: Any, indent: str = "", binary_policy: str = "summarize") -> str:
+    """プロパティの値をDFMの書き方にする（バイナリデータは要約する）"""
+    if isinstance(value, BinaryData):
+        kind = f", {value.class_name}" if value.class_name else ""
+        return f"{{binary data: {value.size} bytes{kind}}}"
+    if isinstance(value, Identifier):
+        return str(value)
+    if isinstance(value, str):
+        return format_string(value)
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    if isinstance(value, DfmSet):
+        return "[" + ", ".join(format_value(item) for item in value) + "]"
+    if isinstance(value, DfmList):
+        if not value:
+            return "()"
+        return "(" + "".join(f"\n{indent}  {format_value(item, indent + '  ', binary_policy)}"
+                             for item in value) + ")"
+    if isinstance(value, Collection):
+        lines = ["<"]
+        for item in value:
+            lines.append(f"{indent}  item" + (f"[{item.index}]" if item.index is not None else ""))
+            lines.extend(_format_properties(item.properties, indent + "    ", binary_policy))
+            lines.append(f"{indent}  end")
+        return "\n".join(lines) + ">" if value else "<>"
+    return str(value)
+
+
+def _format_properties(properties: List[DfmProperty], indent: str, binary_policy: str) -> List[str]:
+    return [f"{indent}{prop.name} = {format_value(prop.value, indent, binary_policy)}"
+            for prop in properties
+            if not (binary_policy == "drop" and isinstance(prop.value, BinaryData))]
+
+
+def component_header(component: DfmComponent) -> str:
+    name = f"{component.name}: {component.class_name}" if component.name else component.class_name
+    index = f" [{component.index}]" if component.index is not None else ""
+    return f"{component.kind} {name}{index}"
+
+
+def render_component(component: DfmComponent, indent: str = "", binary_policy: str = "summarize",
+                     with_children: bool = True) -> str:
+    """
+    コンポーネント（と子孫）をDFMのテキストにする
+
+    with_children が False なら、子コンポーネントは1行の見出しだけにする
+    """
+    lines = [indent + component_header(component)]
+    lines.extend(_format_properties(component.properties, indent + "  ", binary_policy))
+    for child in component.children:
+        if with_children:
+            lines.append(render_component(child, indent + "  ", binary_policy))
+        else:
+            lines.append(f"{indent}  {component_header(child)} ... end")
+    lines.append(indent + "end")
+    return "\n".join(lines)
+
+
+def binary_bytes(component: DfmComponent) -> int:
+    """コンポーネントと子孫のバイナリデータの合計バイト数"""
+    return sum(prop.value.size for part in component.walk() for prop in part.properties
+               if isinstance(prop.value, BinaryData))
+
+
+def chunk_form(root: DfmComponent, count_tokens: Callable[[str], int], max_tokens: int,
+               target_tokens: int = DFM_CHUNK_TOKENS, binary_policy: str = "summarize") -> List[Dict[str, Any]]:
+    """
+    フォームを、フォーム自身のプロパティのチャンクと、直下のコンポーネントの木ごとのチャンクに分ける
+
+    小さなコンポーネントは続けて target_tokens まで1つのチャンクにまとめ、max_tokens を
+    超えるコンポーネントはそのコンポーネント自身のプロパティと子ごとのチャンクに分ける。
+    各チャンクの本文の先頭には、フォームと（フォーム直下でなければ）親コンポーネントを書く
+
+    Returns:
+        content, chunk_type（form / component）, components, component_classes, parent,
+        line_start, line_end, token_count を持つ辞書のリスト
+    """
+    chunks: List[Dict[str, Any]] = []
+    form_line = f"Form: {root.name or root.class_name} ({root.class_name})"
+
+    def emit(chunk_type: str, parts: List[DfmComponent], texts: List[str], parents: List[DfmComponent]):
+        header = [form_line] + [f"Parent: {parent.name} ({parent.class_name})" for parent in parents]
+        content = "\n".join(header) + "\n\n" + "\n".join(texts)
+        chunks.append({
+            "content": content,
+            "chunk_type": chunk_type,
+            "components": [part.name or part.class_name for part in parts],
+            "component_classes": sorted({part.class_name for part in parts}),
+            "parent": ".".join(part.name for part in [root] + parents) if parts[0] is not root else "",
+            "line_start": min(part.line_start for part in parts),
+            "line_end": max(part.line_end for part in parts),
+            "token_count": count_tokens(content)
+        })
+
+    def split(children: List[DfmComponent], parents: List[DfmComponent]):
+        pack: List[DfmComponent] = []
+        texts: List[str] = []
+        pack_tokens = 0
+        for child in children:
+            text = render_component(child, binary_policy=binary_policy)
+            tokens = count_tokens(text)
+            if tokens > max_tokens and child.children:
+                if pack:
+                    emit("component", pack, texts, parents)
+                    pack, texts, pack_tokens = [], [], 0
+                emit("component", [child],
+                     [render_component(child, binary_policy=binary_policy, with_children=False)], parents)
+                split(child.children, parents + [child])
+                continue
+            if pack and pack_tokens + tokens > target_tokens:
+                emit("component", pack, texts, parents)
+                pack, texts, pack_tokens = [], [], 0
+            pack.append(child)
+            texts.append(text)
+            pack_tokens += tokens
+        if pack:
+            emit("component", pack, texts, parents)
+
+    emit("form", [root], [render_component(root, binary_policy=binary_policy, with_children=False)], [])
+    split(root.children, [])
+    return chunks
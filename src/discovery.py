@@ -0,0 +1,110 @@
+"""
+os.scandir とスレッドプールによるDelphiファイルの探索（見つけた順に返す）
+"""
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.metrics import MetricsRecorder, NULL_METRICS
+from src.skip_rules import SkipRules
+
+logger = logging.getLogger(__name__)
+
+DELPHI_EXTENSIONS = ('.pas', '.dfm')
+# 降りないディレクトリ（"." で始まるものも除外）
+EXCLUDED_DIRS = frozenset(['__pycache__', 'venv', 'node_modules'])
+# NFSなどでは1ディレクトリの列挙の待ち時間が長いので、CPU数より多めに並列化する
+DEFAULT_DISCOVERY_THREADS = 8
+
+
+class FileEntry(NamedTuple):
+    """探索で見つけたファイル（stat は scandir の結果を使い回す）"""
+    path: str
+    size: int
+    mtime_ns: int
+
+
+def _scan_directory(path: str, suffixes: frozenset, skip_rules: Optional[SkipRules],
+                    prune_dirs: bool = True) -> Tuple[List[FileEntry], List[str], float]:
+    """1つのディレクトリを列挙し、(対象ファイル, 降りるサブディレクトリ, 所要秒数) を返す"""
+    start = time.perf_counter()
+    files: List[FileEntry] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    # os.walk と同じく、ディレクトリへのシンボリックリンクはたどらない
+                    if entry.is_dir():
+                        name = entry.name
+                        if entry.is_symlink():
+                            continue
+                        if prune_dirs and (name.startswith('.') or name in EXCLUDED_DIRS):
+                            continue
+                        if skip_rules is not None and skip_rules.is_ignored(entry.path, is_dir=True):
+                            continue
+                        subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in suffixes:
+                        stat = entry.stat()
+                        files.append(FileEntry(entry.path, stat.st_size, stat.st_mtime_ns))
+                except OSError as e:
+                    logger.warning(f"ファイル情報の取得に失敗 {entry.path}: {e}")
+    except OSError as e:
+        logger.warning(f"ディレクトリの列挙に失敗 {path}: {e}")
+    files.sort()
+    subdirs.sort()
+    return files, subdirs, time.perf_counter() - start
+
+
+def iter_delphi_files(directory: str, extensions: Iterable[str] = DELPHI_EXTENSIONS,
+                      skip_rules: Optional[SkipRules] = None,
+                      threads: int = DEFAULT_DISCOVERY_THREADS,
+                      metrics: Optional[MetricsRecorder] = None,
+                      prune_dirs: bool = True) -> Iterator[FileEntry]:
+    """
+    ディレクトリ配下のDelphiファイルを見つけた順に返す
+
+    サブディレクトリの列挙はスレッドプールで並列に行う。返す順序はディレクトリの列挙が
+    終わった順なので、決まった順序が必要なら呼び出し側でソートする
+
+    Args:
+        directory: 探索するディレクトリ
+        extensions: 対象の拡張子
+        skip_rules: 指定すると .lightragignore で除外されたディレクトリには降りない
+        threads: 並列に列挙するディレクトリ数（1なら呼び出し元のスレッドで順に列挙）
+        metrics: ディレクトリごとの列挙時間を "discovery" ステージとして記録する
+        prune_dirs: "." で始まるディレクトリと EXCLUDED_DIRS には降りない
+    """
+    metrics = metrics or NULL_METRICS
+    suffixes = frozenset(ext.lower() for ext in extensions)
+
+    if threads <= 1:
+        stack = [directory]
+        while stack:
+            files, subdirs, seconds = _scan_directory(stack.pop(), suffixes, skip_rules, prune_dirs)
+            metrics.observe("discovery", seconds)
+            stack.extend(reversed(subdirs))
+            yield from files
+        return
+
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="discovery")
+    pending = set()
+    try:
+        pending.add(executor.submit(_scan_directory, directory, suffixes, skip_rules, prune_dirs))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs, seconds = future.result()
+                # メトリクスは呼び出し元のスレッドだけで記録する
+                metrics.observe("discovery", seconds)
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_directory, subdir, suffixes, skip_rules, prune_dirs))
+                yield from files
+            metrics.gauge("discovery_in_flight", len(pending))
+    finally:
+        # 途中で打ち切られたら残りの列挙は捨てる（cancel_futures は Python 3.9 以降なので自分で取り消す）
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
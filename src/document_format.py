@@ -0,0 +1,91 @@
+"""
+LightRAGへ送るドキュメント本文の組み立て（チャンク本文とメタデータのヘッダー）
+"""
+import json
+import string
+from typing import Any, Dict, Iterable, Optional
+
+# json: 本文のあとに [Metadata] と整形したJSONを付ける（以前からの形式）
+# compact: 本文の前に1行のヘッダーを付ける
+DOCUMENT_STYLES = ("json", "compact")
+
+# compact のヘッダーに入れる既定のメタデータ（この順に並べる）。file_path は
+# file_sources としてLightRAGに別に渡すので本文には入れない
+COMPACT_FIELDS = (
+    "file_name", "chunk_type", "section_type", "class_name", "function_name", "function_type", "name",
+    "form_name", "parent", "components", "events",
+    "line_number", "line_start", "line_end", "part", "total_parts", "near_duplicate_of", "similarity"
+)
+DEFAULT_TEMPLATES = {
+    "json": "{content}\n\n[Metadata]\n{header}",
+    "compact": "{header}\n{content}"
+}
+
+
+class _TemplateFields(dict):
+    """テンプレートに書かれたメタデータがチャンクになければ空文字にする"""
+
+    def __missing__(self, key):
+        return ""
+
+
+class DocumentFormatter:
+    """
+    チャンクをLightRAGに登録するドキュメントの本文にする
+
+    fields を指定すると本文に入れるメタデータをそれだけに絞る（json では省略時は全部）。
+    template には {content}（チャンク本文）と {header}（ヘッダー）、メタデータのキーを書ける。
+    本文が変わるとドキュメントIDも変わるので、形式を変えると次に処理したファイルから
+    ドキュメントが置き換わる
+    """
+
+    def __init__(self, style: str = "json", fields: Optional[Iterable[str]] = None,
+                 template: Optional[str] = None):
+        if style not in DOCUMENT_STYLES:
+            raise ValueError(f"不明なドキュメント形式です: {style}（{', '.join(DOCUMENT_STYLES)}）")
+        self.style = style
+        self.fields = list(fields) if fields else (list(COMPACT_FIELDS) if style == "compact" else None)
+        self.template = template or DEFAULT_TEMPLATES[style]
+        names = {name for _, name, _, _ in string.Formatter().parse(self.template) if name is not None}
+        if "content" not in names:
+            raise ValueError("ドキュメントのテンプレートに {content} がありません")
+
+    @property
+    def is_default(self) -> bool:
+        """以前からの形式そのままか（節約したトークン数を数える必要がない）"""
+        return self.style == "json" and self.fields is None and self.template == DEFAULT_TEMPLATES["json"]
+
+    def text_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """本文に入れるメタデータ"""
+        if self.fields is None:
+            return metadata
+        return {key: metadata[key] for key in self.fields if metadata.get(key) not in (None, "", [])}
+
+    def header(self, metadata: Dict[str, Any]) -> str:
+        selected = self.text_metadata(metadata)
+        if self.style == "json":
+            return json.dumps(selected, ensure_ascii=False, indent=2)
+        return "[" + "; ".join(f"{key}={_compact_value(value)}" for key, value in selected.items()) + "]"
+
+    def render(self, chunk: Dict[str, Any], content: Optional[str] = None) -> str:
+        """ドキュメントの本文（content を渡すとチャンク本文の代わりに使う）"""
+        metadata = chunk["metadata"]
+        fields = _TemplateFields(metadata)
+        fields.update(header=self.header(metadata), content=chunk["content"] if content is None else content)
+        return self.template.format_map(fields)
+
+    def envelope(self, chunk: Dict[str, Any]) -> str:
+        """本文からチャンク本文を除いた部分（ヘッダーのトークン数を数える用）"""
+        return self.render(chunk, content="")
+
+
+# 節約したトークン数を比べる基準（以前からの形式）
+LEGACY_FORMATTER = DocumentFormatter()
+
+
+def _compact_value(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value).replace(";", ",").replace("\n", " ")
@@ -2,22 +2,44 @@
 ファイル処理関連のユーティリティ
 """
 import os
+import codecs
+import hashlib
+import fnmatch
+import mmap
 import chardet
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 import logging
 import json
 from datetime import datetime
+from src.discovery import DEFAULT_DISCOVERY_THREADS, DELPHI_EXTENSIONS, iter_delphi_files
+from src.metrics import MetricsRecorder, NULL_METRICS
+from src.skip_rules import (GENERATED_HEADER_LINES, GENERATED_HEADER_PATTERNS,
+                            GENERATED_NAME_PATTERNS, SkipRules)
 
 logger = logging.getLogger(__name__)
 
+# 巨大ファイルを読むときに一度にデコードするバイト数
+STREAM_WINDOW_BYTES = 256 * 1024
+# 巨大ファイルの文字コード判定に使う先頭のバイト数
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
 
 class FileProcessor:
     """ファイル処理と進捗管理を行うクラス"""
     
-    def __init__(self, progress_file: str = ".lightrag_progress.json"):
+    def __init__(self, progress_file: str = ".lightrag_progress.json",
+                 metrics: Optional[MetricsRecorder] = None):
         self.progress_file = progress_file
+        self.metrics = metrics or NULL_METRICS
         self.progress_data = self.load_progress()
+        self.progress_data.setdefault("files", {})
+        # 途中まで登録したファイル → 内容のハッシュと受け付けられたドキュメント
+        self.progress_data.setdefault("partial_files", {})
+        # 処理済み判定はファイル数が多いとリストの線形探索では遅いので集合で持つ
+        self.processed_set = set(self.progress_data["processed_files"])
+        # 探索時に scandir で得た (サイズ, 更新時刻ns)。サイズ判定とマニフェストに使う
+        self.stat_cache: Dict[str, Tuple[int, int]] = {}
         
     def load_progress(self) -> dict:
         """進捗情報を読み込む"""
@@ -31,7 +53,9 @@ class FileProcessor:
             "processed_files": [],
             "last_processed": None,
             "total_files": 0,
-            "completed_files": 0
+            "completed_files": 0,
+            "files": {},
+            "partial_files": {}
         }
     
     def save_progress(self):
@@ -42,17 +66,190 @@ class FileProcessor:
         except Exception as e:
             logger.error(f"進捗ファイルの保存に失敗: {e}")
     
-    def mark_file_processed(self, file_path: str):
-        """ファイルを処理済みとしてマーク"""
-        self.progress_data["processed_files"].append(file_path)
+    def mark_file_processed(self, file_path: str, doc_ids: Optional[List[str]] = None,
+                            content_hash: Optional[str] = None, tokens: Optional[int] = None,
+                            depends_on: Optional[Dict[str, str]] = None):
+        """
+        ファイルを処理済みとしてマーク
+
+        Args:
+            file_path: 処理したファイル
+            doc_ids: このファイルが登録したLightRAGのドキュメントID（変更・削除時に消すもの）
+            content_hash: 処理した内容のハッシュ（更新時刻だけが変わった場合の判定用）
+            tokens: 作成したチャンクのトークン数の合計（次回の処理時間の見積もり用）
+            depends_on: 一緒に読んだファイル → 内容のハッシュ（フォームに対応するユニットなど。
+                どれかが変わればこのファイルも処理し直す）
+        """
+        if file_path not in self.processed_set:
+            self.progress_data["processed_files"].append(file_path)
+            self.processed_set.add(file_path)
+        stat = self.stat_cache.get(file_path)
+        if stat is None and os.path.exists(file_path):
+            st = os.stat(file_path)
+            stat = (st.st_size, st.st_mtime_ns)
+        # 処理した時点のサイズ・更新時刻と登録したドキュメント（次回以降の変更検出用のマニフェスト）
+        entry = {"doc_ids": list(doc_ids or [])}
+        if content_hash:
+            entry["sha256"] = content_hash
+        if tokens:
+            entry["tokens"] = tokens
+        if stat is not None:
+            entry.update(size=stat[0], mtime_ns=stat[1])
+        if depends_on:
+            entry["depends_on"] = {}
+            for path, sha256 in depends_on.items():
+                entry["depends_on"][path] = {"sha256": sha256}
+                if os.path.exists(path):
+                    st = os.stat(path)
+                    entry["depends_on"][path].update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+        self.progress_data["files"][file_path] = entry
+        self.progress_data["partial_files"].pop(file_path, None)
         self.progress_data["last_processed"] = file_path
         self.progress_data["completed_files"] += 1
         self.progress_data["last_update"] = datetime.now().isoformat()
         self.save_progress()
     
+    def acknowledge_chunks(self, file_path: str, doc_ids: List[str], content_hash: Optional[str] = None):
+        """
+        ファイルの途中までのチャンクがLightRAGに受け付けられたことを記録する
+
+        処理が途中で止まっても、次回は同じ内容ならこのドキュメントを送らずに続きから登録する。
+        ファイルを処理済みにすると消える
+        """
+        entry = self.progress_data["partial_files"].get(file_path)
+        if entry is None or entry.get("sha256") != content_hash:
+            entry = self.progress_data["partial_files"][file_path] = {"sha256": content_hash, "doc_ids": []}
+        entry["doc_ids"].extend(doc_id for doc_id in doc_ids if doc_id not in entry["doc_ids"])
+        self.save_progress()
+
+    def partial_entry(self, file_path: str) -> Optional[Dict]:
+        """途中まで登録したファイルの記録（なければNone）"""
+        return self.progress_data["partial_files"].get(file_path)
+
+    def file_entry(self, file_path: str) -> Optional[Dict]:
+        """マニフェストに記録したファイルの情報（未処理ならNone）"""
+        return self.progress_data["files"].get(file_path)
+    
+    def file_hash(self, file_path: str) -> str:
+        """ファイル内容のSHA-256（巨大ファイルでも一定のメモリで計算）"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(STREAM_WINDOW_BYTES), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def file_changed(self, file_path: str, compute_hash: Optional[Callable[[], str]] = None) -> bool:
+        """
+        処理済みのファイルが前回の処理から変わったか
+
+        サイズと更新時刻が同じなら変わっていないとみなす。違っていても内容のハッシュが
+        同じなら、マニフェストの更新時刻を直して変わっていないとみなす。
+        マニフェストのない（以前の形式の）処理済みファイルは変わっていないとみなす
+
+        Args:
+            compute_hash: 内容のハッシュを返す関数（省略するとファイルを読んで計算する）
+        """
+        entry = self.progress_data["files"].get(file_path)
+        if entry is None:
+            return False
+        stat = self.stat_cache.get(file_path)
+        if stat is None:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return True
+            stat = (st.st_size, st.st_mtime_ns)
+        if entry.get("size") == stat[0] and entry.get("mtime_ns") == stat[1]:
+            return False
+        if compute_hash is None:
+            compute_hash = lambda: self.file_hash(file_path)
+        if entry.get("sha256") and entry.get("size") == stat[0] and entry["sha256"] == compute_hash():
+            entry.update(size=stat[0], mtime_ns=stat[1])
+            return False
+        return True
+    
+    def dependencies(self, file_path: str) -> Dict[str, str]:
+        """処理したときに一緒に読んだファイル → 内容のハッシュ"""
+        entry = self.progress_data["files"].get(file_path) or {}
+        return {path: recorded.get("sha256") for path, recorded in entry.get("depends_on", {}).items()}
+    
+    def dependencies_changed(self, file_path: str) -> bool:
+        """処理したときに一緒に読んだファイルが、その後変わったか（判定は file_changed と同じ）"""
+        entry = self.progress_data["files"].get(file_path) or {}
+        for path, recorded in entry.get("depends_on", {}).items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return True
+            if recorded.get("size") == st.st_size and recorded.get("mtime_ns") == st.st_mtime_ns:
+                continue
+            if recorded.get("size") != st.st_size or recorded.get("sha256") != self.file_hash(path):
+                return True
+            recorded.update(mtime_ns=st.st_mtime_ns)
+        return False
+    
+    def dependent_files(self, file_paths: Iterable[str]) -> List[str]:
+        """file_paths のどれかを一緒に読んで処理したファイル"""
+        paths = set(file_paths)
+        return [path for path, entry in self.progress_data["files"].items()
+                if paths.intersection(entry.get("depends_on", {}))]
+    
+    def adopt_documents(self, file_path: str, doc_ids: List[str]):
+        """他のファイルが登録したドキュメントをこのファイルのものとして記録する（保存は呼び出し側で行う）"""
+        entry = self.progress_data["files"].get(file_path)
+        if entry is None:
+            entry = self.progress_data["files"][file_path] = {"doc_ids": []}
+        entry.setdefault("doc_ids", []).extend(doc_id for doc_id in doc_ids if doc_id not in entry["doc_ids"])
+    
+    def manifest_files(self, directory: str) -> List[str]:
+        """マニフェストに記録した directory 配下のファイル"""
+        prefix = os.path.join(directory, "")
+        return [path for path in self.progress_data["files"] if path.startswith(prefix)]
+    
+    def forget_file(self, file_path: str) -> Optional[Dict]:
+        """
+        ファイルを未処理に戻し、マニフェストから外す（保存は呼び出し側で行う）
+
+        Returns:
+            外したマニフェストのエントリ（なければNone）
+        """
+        if file_path in self.processed_set:
+            self.processed_set.discard(file_path)
+            self.progress_data["processed_files"].remove(file_path)
+            self.progress_data["completed_files"] = max(0, self.progress_data["completed_files"] - 1)
+        self.progress_data["partial_files"].pop(file_path, None)
+        return self.progress_data["files"].pop(file_path, None)
+    
+    def rename_file(self, old_path: str, new_path: str) -> bool:
+        """
+        処理済みのファイルの名前変更を記録する（保存は呼び出し側で行う）
+
+        Returns:
+            変更前のファイルが処理済みだったか
+        """
+        if old_path not in self.processed_set:
+            return False
+        partial = self.progress_data["partial_files"].get(old_path)
+        entry = self.forget_file(old_path)
+        if entry is None or "doc_ids" not in entry:
+            # 以前の形式の記録には登録したドキュメントがないので、あとで消せない
+            logger.warning(f"{old_path} が登録したドキュメントは記録されていません。"
+                           f"reconcile コマンドで孤立したドキュメントとして削除してください")
+            entry = dict(entry or {}, doc_ids=[])
+        if partial is not None:
+            self.progress_data["partial_files"][new_path] = partial
+        self.processed_set.add(new_path)
+        self.progress_data["processed_files"].append(new_path)
+        self.progress_data["completed_files"] += 1
+        if os.path.exists(new_path):
+            st = os.stat(new_path)
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+        self.progress_data["files"][new_path] = entry
+        return True
+    
     def is_file_processed(self, file_path: str) -> bool:
         """ファイルが処理済みかチェック"""
-        return file_path in self.progress_data["processed_files"]
+        return file_path in self.processed_set
     
     def reset_progress(self):
         """進捗をリセット"""
@@ -60,43 +257,71 @@ class FileProcessor:
             "processed_files": [],
             "last_processed": None,
             "total_files": 0,
-            "completed_files": 0
+            "completed_files": 0,
+            "files": {},
+            "partial_files": {}
         }
+        self.processed_set = set()
         self.save_progress()
     
-    def detect_encoding(self, file_path: str) -> str:
-        """ファイルの文字コードを自動判定"""
+    def detect_encoding(self, file_path: str, sample_size: Optional[int] = None) -> str:
+        """
+        ファイルの文字コードを自動判定
+        
+        Args:
+            sample_size: 指定すると先頭のこのバイト数だけで判定する（巨大ファイル向け）
+        """
         try:
             with open(file_path, 'rb') as f:
-                raw_data = f.read()
+                raw_data = f.read() if sample_size is None else f.read(sample_size)
+        except Exception as e:
+            logger.warning(f"文字コード検出エラー {file_path}: {e}")
+            return 'utf-8'
+        complete = sample_size is None or len(raw_data) < sample_size
+        return self.detect_encoding_bytes(raw_data, complete, file_path)
+    
+    def detect_encoding_bytes(self, raw_data: bytes, complete: bool = True, name: str = "") -> str:
+        """
+        バイト列の文字コードを自動判定
+        
+        Args:
+            complete: raw_data がファイル全体か（Falseなら先頭だけのサンプルとして扱う）
+            name: ログに出すファイル名
+        """
+        try:
+            with self.metrics.stage("encoding_detection", bytes=len(raw_data)):
                 result = chardet.detect(raw_data)
-                encoding = result['encoding']
-                confidence = result['confidence']
-                
-                # 信頼度が低い場合やNoneの場合のフォールバック
-                if not encoding or confidence < 0.7:
-                    # Shift-JISの可能性をチェック
-                    try:
-                        raw_data.decode('shift_jis')
-                        return 'shift_jis'
-                    except:
-                        pass
-                    
-                    # UTF-8を試す
-                    try:
-                        raw_data.decode('utf-8')
-                        return 'utf-8'
-                    except:
-                        pass
-                
-                # Windows環境でcp932として検出されることがあるのでshift_jisに統一
-                if encoding.lower() in ['cp932', 'shift_jis', 'sjis']:
+            encoding = result['encoding']
+            confidence = result['confidence']
+            
+            # 信頼度が低い場合やNoneの場合のフォールバック
+            if not encoding or confidence < 0.7:
+                # Shift-JISの可能性をチェック
+                try:
+                    codecs.getincrementaldecoder('shift_jis')().decode(raw_data, final=complete)
                     return 'shift_jis'
+                except:
+                    pass
                 
-                return encoding or 'utf-8'
-                
+                # UTF-8を試す
+                try:
+                    codecs.getincrementaldecoder('utf-8')().decode(raw_data, final=complete)
+                    return 'utf-8'
+                except:
+                    pass
+            
+            # 先頭だけASCIIでも後ろに日本語が現れうるので、部分判定ではUTF-8として扱う
+            if not complete and encoding and encoding.lower() == 'ascii':
+                return 'utf-8'
+            
+            # Windows環境でcp932として検出されることがあるのでshift_jisに統一
+            if encoding.lower() in ['cp932', 'shift_jis', 'sjis']:
+                return 'shift_jis'
+            
+            return encoding or 'utf-8'
+            
         except Exception as e:
-            logger.warning(f"文字コード検出エラー {file_path}: {e}")
+            logger.warning(f"文字コード検出エラー {name}: {e}")
             return 'utf-8'
     
     def read_file_with_encoding(self, file_path: str) -> Tuple[str, str]:
@@ -104,8 +329,10 @@ class FileProcessor:
         encoding = self.detect_encoding(file_path)
         
         try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                content = f.read()
+            with self.metrics.stage("read") as timer:
+                with open(file_path, 'r', encoding=encoding) as f:
+                    content = f.read()
+                timer.bytes = len(content)
             return content, encoding
         except UnicodeDecodeError:
             # フォールバック: バイナリとして読んでエラーを無視
@@ -114,56 +341,93 @@ class FileProcessor:
                 content = f.read().decode(encoding, errors='ignore')
             return content, encoding
     
-    def find_delphi_files(self, directory: str, extensions: List[str] = ['.pas', '.dfm']) -> List[str]:
-        """ディレクトリ配下のDelphiファイルを検索"""
-        delphi_files = []
+    def decode_bytes(self, data: bytes, name: str = "") -> Tuple[str, str]:
+        """
+        文字コードを自動判定してバイト列をデコードする（アーカイブのメンバーなど）
         
-        for root, dirs, files in os.walk(directory):
-            # 除外するディレクトリ
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['__pycache__', 'venv', 'node_modules']]
-            
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in extensions):
-                    file_path = os.path.join(root, file)
-                    delphi_files.append(file_path)
+        改行はテキストモードでファイルを読んだ場合と同じく '\n' にそろえる
+        """
+        encoding = self.detect_encoding_bytes(data, True, name)
+        with self.metrics.stage("read", bytes=len(data)):
+            try:
+                content = data.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                logger.warning(f"文字コードエラー {name}, エラーを無視してデコード")
+                content = data.decode(encoding, errors='ignore')
+        return content.replace('\r\n', '\n').replace('\r', '\n'), encoding
+    
+    def iter_lines(self, file_path: str, encoding: str,
+                   window: int = STREAM_WINDOW_BYTES) -> Iterator[str]:
+        """
+        ファイルをmmapし、windowバイトずつデコードしながら行を順に返す
         
-        # 進捗情報を更新
+        ファイル全体を1つの文字列にしないので、巨大ファイルでもメモリは一定に収まる。
+        改行の扱いはテキストモードで読んで split('\\n') した場合と同じ
+        """
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield ""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self.iter_buffer_lines(mapped, encoding, window)
+    
+    def iter_buffer_lines(self, buffer, encoding: str,
+                          window: int = STREAM_WINDOW_BYTES) -> Iterator[str]:
+        """バイト列（bytes・mmap）を windowバイトずつデコードしながら行を順に返す"""
+        decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+        pending = ""
+        for offset in range(0, len(buffer), window):
+            text = pending + decoder.decode(buffer[offset:offset + window])
+            lines = text.split('\n')
+            # 最後の行は次のウィンドウに続く可能性がある
+            pending = lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith('\r') else line
+        pending += decoder.decode(b"", final=True)
+        yield pending
+    
+    def iter_delphi_files(self, directory: str, extensions: Iterable[str] = DELPHI_EXTENSIONS,
+                          skip_rules: Optional[SkipRules] = None,
+                          threads: int = DEFAULT_DISCOVERY_THREADS) -> Iterator[str]:
+        """
+        ディレクトリ配下のDelphiファイルを見つけた順に返す（stat の結果は stat_cache に残す）
+
+        skip_rules を渡すと .lightragignore で除外されたディレクトリには降りない
+        """
+        for entry in iter_delphi_files(directory, extensions, skip_rules, threads, self.metrics):
+            self.stat_cache[entry.path] = (entry.size, entry.mtime_ns)
+            yield entry.path
+    
+    def find_delphi_files(self, directory: str, extensions: List[str] = ['.pas', '.dfm'],
+                          skip_rules: Optional[SkipRules] = None,
+                          threads: int = DEFAULT_DISCOVERY_THREADS) -> List[str]:
+        """ディレクトリ配下のDelphiファイルを検索（パス順にソートした一覧）"""
+        delphi_files = sorted(self.iter_delphi_files(directory, extensions, skip_rules, threads))
+        # 進捗ファイルへは次に保存するときに書く
         self.progress_data["total_files"] = len(delphi_files)
-        self.save_progress()
-        
-        return sorted(delphi_files)
+        return delphi_files
     
     def is_auto_generated(self, file_path: str, content: str) -> bool:
         """自動生成ファイルかどうかを判定"""
         # ファイル名パターン
         file_name = os.path.basename(file_path).lower()
-        auto_gen_patterns = [
-            '.designer.pas', '.designer.dfm',
-            'generated', 'autogen', 'auto-gen',
-            '.g.pas', '.generated.pas'
-        ]
-        
-        if any(pattern in file_name for pattern in auto_gen_patterns):
+        if any(fnmatch.fnmatchcase(file_name, pattern) for pattern in GENERATED_NAME_PATTERNS):
             return True
         
-        # コンテンツパターン（最初の数行をチェック）
-        lines = content.split('\n')[:10]
-        content_patterns = [
-            'auto-generated', 'autogenerated', 'generated automatically',
-            'do not edit', 'do not modify', 'generated code',
-            'this file is automatically generated'
-        ]
-        
+        # コンテンツパターン（最初の数行をチェック。ファイル全体は分割しない）
+        lines = content.split('\n', GENERATED_HEADER_LINES)[:GENERATED_HEADER_LINES]
         for line in lines:
             line_lower = line.lower()
-            if any(pattern in line_lower for pattern in content_patterns):
+            if any(pattern in line_lower for pattern in GENERATED_HEADER_PATTERNS):
                 return True
         
         return False
     
-    def estimate_file_size_category(self, file_path: str) -> str:
-        """ファイルサイズに基づいてカテゴリを判定"""
-        file_size = os.path.getsize(file_path)
+    def estimate_file_size_category(self, file_path: str, file_size: Optional[int] = None) -> str:
+        """ファイルサイズに基づいてカテゴリを判定（file_size を渡せば stat しない）"""
+        if file_size is None:
+            stat = self.stat_cache.get(file_path)
+            file_size = stat[0] if stat is not None else os.path.getsize(file_path)
         
         # サイズカテゴリ（バイト単位）
         if file_size < 10 * 1024:  # 10KB未満
@@ -0,0 +1,115 @@
+"""
+フォーム（.dfm）のイベントの割り当てと、対応するユニット（.pas）のイベントハンドラの組み合わせ
+
+MainForm.dfm の OnClick = ButtonAddClick と MainForm.pas の TFormMain.ButtonAddClick の実装を
+1つのチャンクにまとめ、「ボタンを押すと何が起きるか」を1つのドキュメントで答えられるようにする
+"""
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.dfm_parser import DfmComponent, render_component
+
+UNIT_EXTENSIONS = (".pas", ".PAS", ".Pas")
+
+
+class EventBinding(NamedTuple):
+    component: DfmComponent
+    event: str
+    handler: str
+    # ハンドラを持つクラス（フォーム、または inline のフレームのクラス）
+    owner_class: str
+
+
+def find_form_unit(form_path: str) -> Optional[str]:
+    """フォームと同じ場所・同じ名前のユニット"""
+    stem = os.path.splitext(form_path)[0]
+    for extension in UNIT_EXTENSIONS:
+        if os.path.isfile(stem + extension):
+            return stem + extension
+    return None
+
+
+def form_bindings(form: DfmComponent) -> List[EventBinding]:
+    """フォームのイベントの割り当て（inline のフレームの中はフレームのクラスのハンドラ）"""
+    bindings = []
+
+    def visit(component: DfmComponent, owner_class: str):
+        if component.kind == "inline" and component is not form:
+            owner_class = component.class_name
+        bindings.extend(EventBinding(component, event, handler, owner_class)
+                        for event, handler in component.events())
+        for child in component.children:
+            visit(child, owner_class)
+
+    visit(form, form.class_name)
+    return bindings
+
+
+def handler_implementations(ast_info: Dict[str, Any]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """(クラス名, メソッド名)（小文字）→ 実装部のメソッド"""
+    implementations = {}
+    for func in ast_info.get("functions", []):
+        if func.get("implementation") and func.get("class_name") and "line_end" in func:
+            method = func["name"].rsplit(".", 1)[-1]
+            implementations[(func["class_name"].lower(), method.lower())] = func
+    return implementations
+
+
+def pair_handlers(form: DfmComponent, ast_info: Dict[str, Any], unit_content: str, unit_name: str,
+                  count_tokens: Callable[[str], int],
+                  binary_policy: str = "summarize") -> Tuple[List[Dict[str, Any]], int]:
+    """
+    イベントハンドラごとに、割り当てたコンポーネントとハンドラの実装をまとめたチャンクを作る
+
+    同じハンドラを複数のコンポーネントに割り当てていれば、ハンドラは1回だけ書く
+
+    Returns:
+        (チャンクのリスト, ユニットに実装が見つからなかった割り当ての数)。チャンクは
+        chunk_form と同じキーに加え、metadata（function_name, events, handler_file,
+        handler_line_start, handler_line_end）を持つ
+    """
+    implementations = handler_implementations(ast_info)
+    grouped: Dict[Tuple[str, str], List[EventBinding]] = {}
+    unresolved = 0
+    for binding in form_bindings(form):
+        key = (binding.owner_class.lower(), binding.handler.lower())
+        if key in implementations:
+            grouped.setdefault(key, []).append(binding)
+        else:
+            unresolved += 1
+
+    lines = unit_content.split("\n")
+    chunks = []
+    for key, bindings in grouped.items():
+        func = implementations[key]
+        qualified_name = func.get("qualified_name", func["name"])
+        components = list({id(binding.component): binding.component for binding in bindings}.values())
+        events = [f"{binding.component.name or binding.component.class_name}.{binding.event}"
+                  for binding in bindings]
+        header = [
+            f"Form: {form.name or form.class_name} ({form.class_name})",
+            f"Event handler: {qualified_name} ({unit_name}, lines {func['line_start']}-{func['line_end']})",
+            f"Bound to: {', '.join(events)}"
+        ]
+        body = "\n".join(render_component(component.shallow(), binary_policy=binary_policy)
+                         for component in components)
+        handler = "\n".join(lines[func["line_start"] - 1:func["line_end"]])
+        content = "\n".join(header) + "\n\n" + body + "\n\n" + handler
+        chunks.append({
+            "content": content,
+            "chunk_type": "event_handler",
+            "components": [component.name or component.class_name for component in components],
+            "component_classes": sorted({component.class_name for component in components}),
+            "parent": "",
+            "line_start": min(component.line_start for component in components),
+            "line_end": max(component.line_end for component in components),
+            "token_count": count_tokens(content),
+            "metadata": {
+                "function_name": qualified_name,
+                "events": events,
+                "handler_file": unit_name,
+                "handler_line_start": func["line_start"],
+                "handler_line_end": func["line_end"]
+            }
+        })
+    return chunks, unresolved
@@ -0,0 +1,92 @@
+"""
+ローカルのgitから、前回取り込んだコミット以降に変更されたファイルを取得
+"""
+import logging
+import os
+import subprocess
+from typing import Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GitError(RuntimeError):
+    """gitコマンドが失敗した（gitがない・リポジトリではない・コミットが存在しない）"""
+
+
+class GitChange(NamedTuple):
+    """
+    1ファイル分の変更
+
+    status は A（追加）/ M（変更）/ D（削除）/ R（名前変更）。
+    R のときは old_path に変更前のパス、similarity に内容の一致率（100なら内容は同じ）
+    """
+    status: str
+    path: str
+    old_path: Optional[str] = None
+    similarity: int = 100
+
+
+def run_git(directory: str, *args: str) -> str:
+    """directory をカレントにしてgitを実行し、標準出力を返す"""
+    try:
+        result = subprocess.run(["git", "-C", directory, *args], capture_output=True, check=True)
+    except FileNotFoundError as e:
+        raise GitError("gitが見つかりません") from e
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode("utf-8", errors="replace").strip()
+        raise GitError(f"git {' '.join(args)} が失敗: {message}") from e
+    return result.stdout.decode("utf-8", errors="surrogateescape")
+
+
+def head_commit(directory: str) -> str:
+    """HEAD のコミットID"""
+    return run_git(directory, "rev-parse", "--verify", "HEAD^{commit}").strip()
+
+
+def _matches(path: Optional[str], extensions: frozenset) -> bool:
+    return path is not None and os.path.splitext(path)[1].lower() in extensions
+
+
+def changed_files(directory: str, since: str, until: str = "HEAD",
+                  extensions: Iterable[str] = ('.pas', '.dfm', '.inc')) -> List[GitChange]:
+    """
+    since から until までに変更された対象ファイル
+
+    パスは directory からの相対パス（directory の外の変更は含まない）。
+    対象の拡張子から外れる名前変更は削除、対象の拡張子になる名前変更は追加として返す
+    """
+    suffixes = frozenset(ext.lower() for ext in extensions)
+    output = run_git(directory, "diff", "--name-status", "-z", "-M", "--relative",
+                     "--no-ext-diff", since, until, "--")
+    fields = output.split("\0")
+    changes: List[GitChange] = []
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        kind = status[:1]
+        if kind in ("R", "C"):
+            old_path, path = fields[i + 1], fields[i + 2]
+            i += 3
+        else:
+            old_path, path = None, fields[i + 1]
+            i += 2
+
+        if kind == "R":
+            old_match, new_match = _matches(old_path, suffixes), _matches(path, suffixes)
+            if old_match and new_match:
+                changes.append(GitChange("R", path, old_path, int(status[1:] or 100)))
+            elif old_match:
+                changes.append(GitChange("D", old_path))
+            elif new_match:
+                changes.append(GitChange("A", path))
+        elif not _matches(path, suffixes):
+            continue
+        elif kind in ("A", "C"):
+            changes.append(GitChange("A", path))
+        elif kind == "D":
+            changes.append(GitChange("D", path))
+        elif kind in ("M", "T"):
+            changes.append(GitChange("M", path))
+        else:
+            logger.warning(f"未対応の変更種別 {status}: {path}")
+    return changes
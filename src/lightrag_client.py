@@ -0,0 +1,75 @@
+"""
+LightRAGのドキュメントAPI（ドキュメントIDの計算・一覧・削除）
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 1回の削除リクエストに含めるドキュメント数
+DELETE_BATCH_SIZE = 100
+
+
+def compute_doc_id(text: str) -> str:
+    """LightRAGが登録時に付けるドキュメントID（前後の空白を除いた本文のMD5）"""
+    return "doc-" + hashlib.md5(text.strip().encode("utf-8")).hexdigest()
+
+
+class LightRAGClient:
+    """LightRAGのドキュメントを一覧・削除するクライアント"""
+
+    def __init__(self, base_url: str, timeout: float = 60.0, delete_batch_size: int = DELETE_BATCH_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.delete_batch_size = max(1, delete_batch_size)
+
+    def document_statuses(self) -> Dict[str, List[Dict[str, Any]]]:
+        """状態（pending / processing / processed / failed、小文字）ごとの登録済みドキュメント"""
+        response = requests.get(f"{self.base_url}/documents", timeout=self.timeout)
+        response.raise_for_status()
+        statuses: Dict[str, List[Dict[str, Any]]] = {}
+        for status, docs in response.json().get("statuses", {}).items():
+            statuses.setdefault(status.lower(), []).extend(docs)
+        return statuses
+
+    def pipeline_status(self) -> Dict[str, Any]:
+        """索引処理の状況（件数だけ。ドキュメントの一覧は返さない）"""
+        response = requests.get(f"{self.base_url}/documents/pipeline_status", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """登録されている全ドキュメント（状態に関係なく）"""
+        documents: List[Dict[str, Any]] = []
+        for docs in self.document_statuses().values():
+            documents.extend(docs)
+        return documents
+
+    def delete_documents(self, doc_ids: Iterable[str]) -> List[str]:
+        """
+        ドキュメントを delete_batch_size 件ずつ削除する
+
+        Returns:
+            削除を受け付けられたドキュメントID（失敗したバッチの分は含まない）
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        deleted: List[str] = []
+        for start in range(0, len(doc_ids), self.delete_batch_size):
+            batch = doc_ids[start:start + self.delete_batch_size]
+            try:
+                response = requests.delete(
+                    f"{self.base_url}/documents/delete_document",
+                    json={"doc_ids": batch, "delete_file": False},
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                logger.error(f"ドキュメントの削除に失敗: {e}")
+                continue
+            if response.status_code == 200:
+                deleted.extend(batch)
+            else:
+                logger.error(f"ドキュメントの削除に失敗: {response.status_code} - {response.text}")
+        return deleted
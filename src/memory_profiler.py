@@ -0,0 +1,285 @@
+"""
+メモリプロファイル（ステージごとのピーク・ファイルごとのピークRSS・主な確保箇所）
+"""
+import heapq
+import logging
+import sys
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _read_status_kb(field: str) -> Optional[int]:
+    """/proc/self/status の値（kB）をバイトで返す（Linux以外ではNone）"""
+    try:
+        with open(_PROC_STATUS, 'r') as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _max_rss() -> int:
+    """getrusage のピークRSS（resource モジュールのないWindowsでは0）"""
+    if sys.platform == "win32":
+        return 0
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss() -> int:
+    rss = _read_status_kb("VmRSS")
+    if rss is not None:
+        return rss
+    return _max_rss()
+
+
+def peak_rss() -> int:
+    peak = _read_status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    return _max_rss()
+
+
+def reset_peak_rss() -> bool:
+    """ピークRSS（VmHWM）を現在値に戻す。戻せない環境ではFalse"""
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class _NullTracker:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TRACKER = _NullTracker()
+
+
+class _FileTracker:
+    __slots__ = ("profiler", "file_path", "size", "rss_start", "resettable")
+
+    def __init__(self, profiler: "MemoryProfiler", file_path: str, size: int):
+        self.profiler = profiler
+        self.file_path = file_path
+        self.size = size
+
+    def __enter__(self):
+        self.profiler.current_file = self.file_path
+        self.resettable = reset_peak_rss()
+        self.rss_start = current_rss()
+        self.profiler.stage_enter()
+        return self
+
+    def __exit__(self, *exc):
+        traced_peak = self.profiler.stage_exit("file")
+        self.profiler.record_file(self.file_path, self.size, traced_peak,
+                                  peak_rss(), self.rss_start, self.resettable)
+        return False
+
+
+class MemoryProfiler:
+    """
+    tracemallocでステージごとのメモリピークを、/procでファイルごとのピークRSSを記録するクラス
+
+    ステージは入れ子にできる（内側で tracemalloc のピークをリセットしても外側のピークは引き継ぐ）。
+    主な確保箇所は、各ステージでピークが最大を更新したときのスナップショットから取る
+    （スナップショットはステージ終了時点で生きている確保だけを含む）
+    """
+
+    def __init__(self, enabled: bool = True, top_n: int = 10, traceback_limit: int = 1):
+        """
+        Args:
+            enabled: Falseなら何も記録しない
+            top_n: 報告するファイル数・確保箇所数
+            traceback_limit: 確保箇所として記録するスタックの深さ
+        """
+        self.enabled = enabled
+        self.top_n = top_n
+        self.traceback_limit = traceback_limit
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.files: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.file_count = 0
+        self.current_file = ""
+        self._stack: List[List[int]] = []
+        self._sequence = 0
+        # export(reset=True) 後も、これまでのピークを超えたときだけスナップショットを取る
+        self._snapshot_floor: Dict[str, int] = {}
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_limit)
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stage_enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # リセットで消える外側のピークを退避しておく
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            # Python 3.8には reset_peak がないので計測し直す。それまでの確保は数えなくなるので、
+            # 外側のステージの開始時点とピークをその分ずらす
+            tracemalloc.stop()
+            tracemalloc.start(self.traceback_limit)
+            for entry in self._stack:
+                entry[0] -= current
+                entry[1] -= current
+            current = 0
+        self._stack.append([current, current])
+
+    def stage_exit(self, name: str) -> int:
+        """ステージを抜けるときに呼ぶ。ステージ開始時点からのピーク増分を返す"""
+        _, peak = tracemalloc.get_traced_memory()
+        start, saved_peak = self._stack.pop()
+        peak = max(peak, saved_peak)
+        if self._stack:
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        delta = peak - start
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"count": 0, "peak_bytes": 0, "total_peak_bytes": 0,
+                                         "peak_context": "", "top_sites": []}
+        stage["count"] += 1
+        stage["total_peak_bytes"] += delta
+        if delta > stage["peak_bytes"]:
+            stage["peak_bytes"] = delta
+            stage["peak_context"] = self.current_file
+            if delta > self._snapshot_floor.get(name, 0):
+                stage["top_sites"] = self._top_sites()
+        return delta
+
+    def _top_sites(self) -> List[Dict[str, Any]]:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        sites = []
+        for stat in snapshot.statistics("lineno")[:self.top_n]:
+            frame = stat.traceback[0]
+            sites.append({"site": f"{frame.filename}:{frame.lineno}", "bytes": stat.size, "blocks": stat.count})
+        return sites
+
+    def track_file(self, file_path: str, size: int):
+        """with文で1ファイル分の処理を囲み、ファイルごとのピークを記録する"""
+        if not self.enabled or not tracemalloc.is_tracing():
+            return _NULL_TRACKER
+        return _FileTracker(self, file_path, size)
+
+    def record_file(self, file_path: str, size: int, traced_peak: int, rss_peak: int,
+                    rss_start: int, rss_resettable: bool):
+        self.file_count += 1
+        self._add_file({
+            "file_path": file_path,
+            "bytes": size,
+            "traced_peak_bytes": traced_peak,
+            "rss_peak_bytes": rss_peak,
+            "rss_growth_bytes": max(0, rss_peak - rss_start),
+            "rss_per_file": rss_resettable,
+        })
+
+    def _add_file(self, entry: Dict[str, Any]):
+        # ピークRSSがファイルごとに取れない環境では tracemalloc のピークで順位を付ける
+        key = entry["rss_peak_bytes"] if entry["rss_per_file"] else entry["traced_peak_bytes"]
+        self._sequence += 1
+        item = (key, -self._sequence, entry)
+        if len(self.files) < self.top_n:
+            heapq.heappush(self.files, item)
+        else:
+            heapq.heappushpop(self.files, item)
+
+    def worst_files(self) -> List[Dict[str, Any]]:
+        return [entry for _, _, entry in sorted(self.files, key=lambda item: item[:2], reverse=True)]
+
+    def export(self, reset: bool = False) -> Dict[str, Any]:
+        """別プロセスへ渡すための生データ（merge で取り込める）"""
+        data = {"stages": self.stages, "files": self.worst_files(), "file_count": self.file_count}
+        if reset:
+            for name, stage in self.stages.items():
+                self._snapshot_floor[name] = max(self._snapshot_floor.get(name, 0), stage["peak_bytes"])
+            self.stages, self.files, self.file_count = {}, [], 0
+        return data
+
+    def merge(self, data: Dict[str, Any]):
+        """ワーカープロセスで記録した生データを取り込む"""
+        if not self.enabled:
+            return
+        for name, other in data.get("stages", {}).items():
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = dict(other)
+                continue
+            stage["count"] += other["count"]
+            stage["total_peak_bytes"] += other["total_peak_bytes"]
+            if other["peak_bytes"] > stage["peak_bytes"]:
+                for key in ("peak_bytes", "peak_context", "top_sites"):
+                    stage[key] = other[key]
+        for entry in data.get("files", []):
+            self._add_file(entry)
+        self.file_count += data.get("file_count", 0)
+
+    def report(self) -> Dict[str, Any]:
+        """ステージごとのピーク・ワーストファイル・主な確保箇所と、ワーカーのメモリ上限の目安"""
+        worst = self.worst_files()
+        limit = None
+        if worst and all(entry["rss_per_file"] for entry in worst):
+            # 最悪のファイルのピークRSSに25%の余裕を持たせた値
+            limit = int(max(entry["rss_peak_bytes"] for entry in worst) * 1.25)
+        return {
+            "files_profiled": self.file_count,
+            "process_peak_rss_bytes": peak_rss(),
+            "suggested_worker_memory_limit_bytes": limit,
+            "stages": {
+                name: {
+                    "count": stage["count"],
+                    "peak_bytes": stage["peak_bytes"],
+                    "mean_peak_bytes": stage["total_peak_bytes"] // stage["count"] if stage["count"] else 0,
+                    "peak_context": stage["peak_context"],
+                    "top_sites": stage["top_sites"],
+                }
+                for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["peak_bytes"])
+            },
+            "worst_files": worst,
+        }
+
+    def log_report(self):
+        """プロファイル結果をログに出力"""
+        report = self.report()
+        mb = 1024 * 1024
+        logger.info(f"{'stage':<22} {'count':>8} {'peak MB':>9} {'mean MB':>9}  heaviest input")
+        for name, stage in report["stages"].items():
+            logger.info(f"{name:<22} {stage['count']:>8} {stage['peak_bytes'] / mb:>9.1f} "
+                        f"{stage['mean_peak_bytes'] / mb:>9.2f}  {stage['peak_context']}")
+        logger.info(f"Worst {len(report['worst_files'])} files:")
+        for entry in report["worst_files"]:
+            logger.info(f"  {entry['rss_peak_bytes'] / mb:>8.1f} MB RSS  "
+                        f"{entry['traced_peak_bytes'] / mb:>8.1f} MB traced  "
+                        f"{entry['bytes'] / mb:>7.2f} MB file  {entry['file_path']}")
+        for name, stage in list(report["stages"].items())[:3]:
+            logger.info(f"Top allocation sites in {name} (live at its heaviest call):")
+            for site in stage["top_sites"]:
+                logger.info(f"  {site['bytes'] / mb:>8.2f} MB  {site['blocks']:>8} blocks  {site['site']}")
+        if report["suggested_worker_memory_limit_bytes"]:
+            logger.info(f"Suggested worker memory limit: "
+                        f"{report['suggested_worker_memory_limit_bytes'] / mb:.0f} MB")
+
+
+# プロファイルしない場合に使う共有インスタンス
+NULL_PROFILER = MemoryProfiler(enabled=False)
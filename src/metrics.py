@@ -0,0 +1,262 @@
+"""
+処理ステージごとの計測（所要時間のヒストグラム・スループット・キュー長）
+"""
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from src.memory_profiler import MemoryProfiler
+
+logger = logging.getLogger(__name__)
+
+# Prometheusのヒストグラムのバケット境界（秒）
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+# パーセンタイル計算用に残すサンプル数の上限（超えたらリザーバサンプリング）
+SAMPLE_LIMIT = 10000
+
+
+def _new_stage() -> Dict[str, Any]:
+    return {"count": 0, "seconds": 0.0, "max": 0.0, "bytes": 0, "tokens": 0,
+            "buckets": [0] * (len(BUCKETS) + 1), "samples": []}
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))]
+
+
+class _NullStage:
+    """無効時の stage()。bytes / tokens を設定されても何もしない"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _StageTimer:
+    __slots__ = ("recorder", "name", "bytes", "tokens", "start")
+
+    def __init__(self, recorder: "MetricsRecorder", name: str, bytes: int, tokens: int):
+        self.recorder = recorder
+        self.name = name
+        self.bytes = bytes
+        self.tokens = tokens
+
+    def __enter__(self):
+        if self.recorder.memory is not None:
+            self.recorder.memory.stage_enter()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.observe(self.name, time.perf_counter() - self.start, self.bytes, self.tokens)
+        if self.recorder.memory is not None:
+            self.recorder.memory.stage_exit(self.name)
+        return False
+
+
+class MetricsRecorder:
+    """
+    ステージごとの所要時間・処理量とキュー長を記録するクラス
+
+    無効のときは stage() が共有の空コンテキストを返すだけなので、計測箇所を残したままでも
+    オーバーヘッドはほぼない。memory にメモリプロファイラを設定すると各ステージのメモリピークも記録する
+    """
+
+    def __init__(self, enabled: bool = True, memory: Optional["MemoryProfiler"] = None):
+        self.enabled = enabled
+        self.memory = memory
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.gauges: Dict[str, Dict[str, float]] = {}
+        self.started = time.time()
+        self._random = random.Random(0)
+
+    def stage(self, name: str, bytes: int = 0, tokens: int = 0):
+        """
+        with文でステージの所要時間を計測する
+
+        処理量が後から分かる場合は、返り値の bytes / tokens 属性に設定する
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name, bytes, tokens)
+
+    def observe(self, name: str, seconds: float, bytes: int = 0, tokens: int = 0):
+        """ステージの1回分の所要時間と処理量を記録"""
+        if not self.enabled:
+            return
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _new_stage()
+        stage["count"] += 1
+        stage["seconds"] += seconds
+        stage["bytes"] += bytes
+        stage["tokens"] += tokens
+        if seconds > stage["max"]:
+            stage["max"] = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stage["buckets"][i] += 1
+                break
+        else:
+            stage["buckets"][-1] += 1
+        self._sample(stage, seconds)
+
+    def _sample(self, stage: Dict[str, Any], seconds: float):
+        samples = stage["samples"]
+        if len(samples) < SAMPLE_LIMIT:
+            samples.append(seconds)
+        else:
+            slot = self._random.randrange(stage["count"])
+            if slot < SAMPLE_LIMIT:
+                samples[slot] = seconds
+
+    def gauge(self, name: str, value: float):
+        """キュー長などの現在値を記録（最大値も保持）"""
+        if not self.enabled:
+            return
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            self.gauges[name] = {"value": value, "max": value}
+        else:
+            gauge["value"] = value
+            if value > gauge["max"]:
+                gauge["max"] = value
+
+    def export(self, reset: bool = False) -> Dict[str, Any]:
+        """別プロセスへ渡すための生データ（merge で取り込める）"""
+        data = {"stages": self.stages, "gauges": self.gauges}
+        if self.memory is not None:
+            data["memory"] = self.memory.export(reset)
+        if reset:
+            self.stages, self.gauges = {}, {}
+        return data
+
+    def merge(self, data: Dict[str, Any]):
+        """ワーカープロセスなどで記録した生データを取り込む"""
+        if not self.enabled:
+            return
+        for name, other in data.get("stages", {}).items():
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = _new_stage()
+            for key in ("count", "seconds", "bytes", "tokens"):
+                stage[key] += other[key]
+            stage["max"] = max(stage["max"], other["max"])
+            stage["buckets"] = [a + b for a, b in zip(stage["buckets"], other["buckets"])]
+            stage["samples"].extend(other["samples"])
+            if len(stage["samples"]) > SAMPLE_LIMIT:
+                stage["samples"] = self._random.sample(stage["samples"], SAMPLE_LIMIT)
+        for name, other in data.get("gauges", {}).items():
+            gauge = self.gauges.setdefault(name, {"value": other["value"], "max": other["max"]})
+            gauge["max"] = max(gauge["max"], other["max"])
+        if self.memory is not None and "memory" in data:
+            self.memory.merge(data["memory"])
+
+    def summary(self) -> Dict[str, Any]:
+        """ステージごとの集計（p50/p95/最大・スループット）"""
+        stages = {}
+        for name, stage in sorted(self.stages.items()):
+            seconds = stage["seconds"]
+            stages[name] = {
+                "count": stage["count"],
+                "total_seconds": round(seconds, 6),
+                "mean_ms": round(seconds / stage["count"] * 1000, 3) if stage["count"] else 0.0,
+                "p50_ms": round(_percentile(stage["samples"], 0.5) * 1000, 3),
+                "p95_ms": round(_percentile(stage["samples"], 0.95) * 1000, 3),
+                "max_ms": round(stage["max"] * 1000, 3),
+                "bytes": stage["bytes"],
+                "tokens": stage["tokens"],
+                "bytes_per_second": round(stage["bytes"] / seconds, 1) if seconds else 0.0,
+                "tokens_per_second": round(stage["tokens"] / seconds, 1) if seconds else 0.0,
+            }
+        return {
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "gauges": {name: dict(gauge) for name, gauge in sorted(self.gauges.items())},
+        }
+
+    def write_json(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """集計をJSONで保存"""
+        data = self.summary()
+        if extra:
+            data.update(extra)
+        _atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def prometheus_text(self, prefix: str = "delphi_lightrag",
+                        counters: Optional[Dict[str, float]] = None) -> str:
+        """Prometheusのテキスト形式（node exporterのtextfile collector向け）"""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each pipeline stage",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, stage in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stage["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        for unit in ("bytes", "tokens"):
+            lines.append(f"# HELP {prefix}_stage_{unit}_total {unit.capitalize()} handled by each pipeline stage")
+            lines.append(f"# TYPE {prefix}_stage_{unit}_total counter")
+            for name, stage in sorted(self.stages.items()):
+                if stage[unit]:
+                    lines.append(f'{prefix}_stage_{unit}_total{{stage="{name}"}} {stage[unit]}')
+        if self.gauges:
+            lines.append(f"# HELP {prefix}_queue_depth Current depth of internal queues")
+            lines.append(f"# TYPE {prefix}_queue_depth gauge")
+            for name, gauge in sorted(self.gauges.items()):
+                lines.append(f'{prefix}_queue_depth{{queue="{name}"}} {gauge["value"]}')
+            lines.append(f"# HELP {prefix}_queue_depth_max Maximum observed depth of internal queues")
+            lines.append(f"# TYPE {prefix}_queue_depth_max gauge")
+            for name, gauge in sorted(self.gauges.items()):
+                lines.append(f'{prefix}_queue_depth_max{{queue="{name}"}} {gauge["max"]}')
+        for name, value in sorted((counters or {}).items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "delphi_lightrag",
+                         counters: Optional[Dict[str, float]] = None):
+        """Prometheusのtextfileとして保存（collectorが書きかけを読まないよう置き換えで書く）"""
+        _atomic_write(path, self.prometheus_text(prefix, counters))
+
+    def log_summary(self):
+        """ステージごとの集計をログに出力"""
+        summary = self.summary()
+        logger.info(f"{'stage':<22} {'count':>8} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+                    f"{'max ms':>9} {'MB/s':>8} {'tok/s':>10}")
+        for name, stage in summary["stages"].items():
+            logger.info(f"{name:<22} {stage['count']:>8} {stage['total_seconds']:>9.3f} "
+                        f"{stage['p50_ms']:>9.2f} {stage['p95_ms']:>9.2f} {stage['max_ms']:>9.2f} "
+                        f"{stage['bytes_per_second'] / 1e6:>8.2f} {stage['tokens_per_second']:>10.0f}")
+        for name, gauge in summary["gauges"].items():
+            logger.info(f"queue {name}: current {gauge['value']}, max {gauge['max']}")
+
+
+def _atomic_write(path: str, text: str):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+# 計測しない場合に使う共有インスタンス
+NULL_METRICS = MetricsRecorder(enabled=False)
@@ -0,0 +1,271 @@
+"""
+MinHash/LSHによるほぼ重複チャンクの検出
+"""
+import difflib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.chunk_dedup import chunk_location
+
+logger = logging.getLogger(__name__)
+
+_SHIFT = np.uint64(32)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+_BASE = np.uint64(257)
+_SPACE = 0x20
+
+NEAR_DUPLICATE_POLICIES = ["skip", "representative", "annotate"]
+
+
+def _optimal_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """しきい値付近で判定が切り替わるようにLSHのバンド数と行数を選ぶ"""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        # 候補になる確率が1/2になる類似度 ≒ (1/b)^(1/r)
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateDetector:
+    """
+    文字シングルのMinHash署名とLSHバンディングでほぼ重複したチャンクを検出するクラス
+
+    署名はOne Permutation Hashing（ハッシュ値の上位ビットで num_perm 個のビンに分け、
+    各ビンの最小値を取る）で作り、空のビンは右隣の値をずらして埋める（rotation densification）。
+    置換をnum_perm回適用するMinHashと同じくビンの一致率がJaccard類似度の推定になる。
+    索引はメモリ上だけにあり、比べるのは同じ実行で登録した代表とだけ
+    """
+
+    def __init__(self, threshold: float = 0.9, policy: str = "annotate",
+                 num_perm: int = 64, shingle_size: int = 8, seed: int = 1,
+                 max_diff_lines: int = 40):
+        """
+        Args:
+            threshold: ほぼ重複とみなすJaccard類似度
+            policy: skip（登録しない）/ representative（代表との差分要約に置換）/ annotate（注記して登録）
+            num_perm: 署名の長さ（2のべき乗）
+            shingle_size: シングルの文字数
+            seed: ハッシュのシード（同じなら署名は実行間で一致する）
+            max_diff_lines: representativeポリシーで差分要約に含める最大行数
+        """
+        if policy not in NEAR_DUPLICATE_POLICIES:
+            raise ValueError(f"不明なポリシー: {policy}")
+        if num_perm & (num_perm - 1) or not 1 <= num_perm <= 1024:
+            raise ValueError(f"num_permは1024以下の2のべき乗である必要があります: {num_perm}")
+        self.threshold = threshold
+        self.policy = policy
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_diff_lines = max_diff_lines
+        self.bands, self.rows = _optimal_bands(num_perm, threshold)
+
+        self._bin_shift = np.uint64(32 - num_perm.bit_length() + 1)
+        self._salt = np.uint64(np.random.RandomState(seed).randint(0, 1 << 63, dtype=np.uint64))
+
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint64)
+        self._count = 0
+        self._locations: List[Dict[str, Any]] = []
+        self._texts: List[str] = []
+        self._discarded: set = set()
+
+    def _shingle_hashes(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        複数テキストの文字シングルを32bitハッシュにする
+
+        全テキストを区切り文字で連結したバイト列の上で、空白の正規化・単語先頭の検出・
+        ハッシュ計算をまとめて行う。シングルは単語の先頭から始まるものだけを使う
+        （件数を数分の一に減らしつつ、編集箇所の局所性は保たれる）
+
+        Returns:
+            (テキストごとに重複を除いてハッシュ順に並べた値, 各値が属するテキスト番号)
+        """
+        k = self.shingle_size
+        # 末尾に固定の詰め物を付けて、短いテキストにも必ずシングルができるようにする
+        pad = "\x01" * k
+        raw = "\0".join(
+            (text if "\0" not in text else text.replace("\0", " ")).rstrip() + pad for text in texts
+        ).encode("utf-8", errors="surrogatepass")
+        buf = np.frombuffer(raw, dtype=np.uint8)
+
+        # 空白の連続と行頭の空白を詰める
+        is_sep = buf == 0
+        is_space = (buf == _SPACE) | ((buf >= 9) & (buf <= 13))
+        prev_blank = np.ones(len(buf), dtype=bool)
+        prev_blank[1:] = is_space[:-1] | is_sep[:-1]
+        keep = ~(is_space & prev_blank)
+        buf = np.where(is_space, np.uint8(_SPACE), buf)[keep]
+        is_sep = is_sep[keep]
+
+        # 単語の先頭を開始位置とし、テキストをまたぐ窓は除く
+        text_ends = np.append(np.flatnonzero(is_sep), len(buf))
+        is_start = np.ones(len(buf), dtype=bool)
+        is_start[1:] = (buf[:-1] == _SPACE) | is_sep[:-1]
+        positions = np.flatnonzero(is_start & ~is_sep)
+        owners = np.searchsorted(text_ends, positions)
+        within = positions + k <= text_ends[owners]
+        positions, owners = positions[within], owners[within]
+
+        hashes = np.zeros(len(positions), dtype=np.uint64)
+        for offset in range(k):
+            hashes *= _BASE
+            hashes += buf[positions + offset]
+        hashes ^= self._salt
+        hashes *= _MIX
+        hashes >>= _SHIFT
+        # テキスト番号を上位ビットに載せてまとめて並べ替えると、テキストごとの重複除去が一度で済む
+        keyed = np.sort((owners.astype(np.uint64) << _SHIFT) | hashes)
+        keyed = keyed[np.concatenate(([True], keyed[1:] != keyed[:-1]))]
+        return keyed & np.uint64(0xFFFFFFFF), (keyed >> _SHIFT).astype(np.int64)
+
+    def signatures(self, texts: List[str], batch_size: int = 4096) -> np.ndarray:
+        """
+        複数テキストのMinHash署名をまとめて計算する（メモリを抑えるためbatch_size件ずつ）
+
+        シングルはテキストごとにハッシュ値の昇順に並んでいるので、ビンの最小値は
+        (テキスト, ビン)が切り替わる位置の値になる。チャンクごとのPythonループは発生しない
+        """
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            result[start:start + len(batch)] = self._batch_signatures(batch)
+        return result
+
+    def _batch_signatures(self, texts: List[str]) -> np.ndarray:
+        flat, owners = self._shingle_hashes(texts)
+        cells = owners * self.num_perm + (flat >> self._bin_shift).astype(np.int64)
+        first = np.concatenate(([True], cells[1:] != cells[:-1]))
+
+        result = np.full((len(texts), self.num_perm), _EMPTY, dtype=np.uint64)
+        result.reshape(-1)[cells[first]] = flat[first]
+
+        # 空のビンは右方向（循環）で最初に埋まっているビンの値に距離分のずれを加えて埋める
+        width = 2 * self.num_perm
+        doubled = np.concatenate((result, result), axis=1)
+        columns = np.where(doubled != _EMPTY, np.arange(width), width)
+        nearest = np.minimum.accumulate(columns[:, ::-1], axis=1)[:, ::-1][:, :self.num_perm]
+        distance = (nearest - np.arange(self.num_perm)).astype(np.uint64)
+        filled = np.take_along_axis(doubled, np.minimum(nearest, width - 1), axis=1)
+        return np.where(distance > 0, filled + (distance << _SHIFT), result)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        """登録済みの代表のうち、しきい値以上で最も似ているもの（index, 推定類似度）を返す"""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        if not candidates:
+            return None
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[ids] == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        return int(ids[best]), float(similarity[best])
+
+    def add(self, signature: np.ndarray, location: Dict[str, Any], text: str = "") -> int:
+        """代表として索引に登録する"""
+        index = self._count
+        if index == len(self._signatures):
+            self._signatures = np.concatenate((self._signatures, np.empty_like(self._signatures)))
+        self._signatures[index] = signature
+        self._count += 1
+        self._locations.append(location)
+        # 差分要約を作るときだけ代表の本文を保持する
+        self._texts.append(text if self.policy == "representative" else "")
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(index)
+        return index
+
+    def discard(self, locations: List[Dict[str, Any]]):
+        """アップロードできなかった代表を索引から外し、後のチャンクがそのほぼ重複にならないようにする"""
+        keys = {tuple(sorted(location.items())) for location in locations}
+        for index in range(self._count):
+            if index in self._discarded or tuple(sorted(self._locations[index].items())) not in keys:
+                continue
+            for band, key in enumerate(self._band_keys(self._signatures[index])):
+                bucket = self._buckets[band][key]
+                bucket.remove(index)
+                if not bucket:
+                    del self._buckets[band][key]
+            self._texts[index] = ""
+            self._discarded.add(index)
+
+    def find_duplicates(self, texts: List[str]) -> List[Optional[Tuple[int, float]]]:
+        """
+        テキスト群を順に索引へ追加し、各テキストが先行するどれのほぼ重複かを返す
+
+        Returns:
+            テキストごとの (代表のindex, 推定類似度)。代表になったものはNone
+        """
+        results = []
+        for text, signature in zip(texts, self.signatures(texts)):
+            match = self.query(signature)
+            if match is None:
+                self.add(signature, {}, text)
+            results.append(match)
+        return results
+
+    def _diff_summary(self, representative: str, text: str) -> str:
+        diff = difflib.unified_diff(
+            representative.splitlines(), text.splitlines(),
+            fromfile="representative", tofile="this", lineterm="", n=0)
+        lines = [line for line in diff if not line.startswith("@@")]
+        if len(lines) > self.max_diff_lines:
+            lines = lines[:self.max_diff_lines] + [f"... ({len(lines) - self.max_diff_lines} more lines)"]
+        return "\n".join(lines)
+
+    def process_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        ポリシーに従ってほぼ重複チャンクを処理し、登録すべきチャンクを返す
+
+        ほぼ重複と判定したチャンクには near_duplicate（代表の位置と類似度）を付ける
+        """
+        results = []
+        for chunk, signature in zip(chunks, self.signatures([c["content"] for c in chunks])):
+            location = chunk_location(chunk.get("metadata", {}))
+            match = self.query(signature)
+            if match is None:
+                self.add(signature, location, chunk["content"])
+                results.append(chunk)
+                continue
+
+            index, similarity = match
+            chunk["near_duplicate"] = {"of": self._locations[index], "similarity": round(similarity, 3)}
+            if self.policy == "skip":
+                continue
+            if self.policy == "representative":
+                of = self._locations[index]
+                header = (f"Near-duplicate of {of.get('file_path', '?')} "
+                          f"({of.get('chunk_type', 'chunk')}, similarity {similarity:.2f})")
+                diff = self._diff_summary(self._texts[index], chunk["content"])
+                chunk = {
+                    **chunk,
+                    "content": f"{header}\n\nDifferences:\n{diff}" if diff else header,
+                    "metadata": {
+                        **chunk["metadata"],
+                        "chunk_type": "near_duplicate_summary",
+                        "original_token_count": chunk["metadata"].get("token_count", 0)
+                    }
+                }
+            chunk["metadata"] = {
+                **chunk["metadata"],
+                "near_duplicate_of": self._locations[index].get("file_path"),
+                "similarity": round(similarity, 3)
+            }
+            results.append(chunk)
+        return results
+
+    def __len__(self) -> int:
+        return self._count - len(self._discarded)
@@ -0,0 +1,126 @@
+"""
+LightRAGへの登録速度を、サーバー側の抽出処理が追いつく速さに合わせるトークンバケット
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# バケットに貯められる量（何秒分の登録をまとめて送れるか）
+BURST_SECONDS = 10.0
+# 429などで絞ったあと、成功した登録1回ごとに戻す割合
+RECOVERY_STEP = 0.05
+# 絞るときの下限（設定した速度に対する割合）
+MIN_RATE_FRACTION = 0.05
+# Retry-After がないときに止める秒数（続けて混んでいれば倍にしていく）
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class TokenBucket:
+    """
+    毎秒 rate ずつ補充されるバケット
+
+    容量より大きな量も受け付け、その分はマイナスになって次の取得を待たせる
+    （1回の登録がバースト量より大きくても止まらない）
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self, fraction: float = 1.0):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * fraction)
+        self.updated = now
+
+    def wait_time(self, fraction: float = 1.0) -> float:
+        """取得できるようになるまでの秒数（残量がマイナスでなければ0）"""
+        self.refill(fraction)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / (self.rate * fraction)
+
+
+class UploadThrottle:
+    """
+    1分あたりのドキュメント数・トークン数で登録を制限する
+
+    サーバーが429・503を返したりタイムアウトしたりしたら速度を半分にして Retry-After の間
+    （なければ指数的に延ばす待ち時間）止め、成功するたびに少しずつ設定した速度まで戻す。
+    どちらの速度も0なら速度は制限せず、Retry-After による停止だけを行う
+    """
+
+    def __init__(self, docs_per_minute: float = 0.0, tokens_per_minute: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.doc_bucket = TokenBucket(docs_per_minute, clock=clock) if docs_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute, clock=clock) if tokens_per_minute > 0 else None
+        self.clock = clock
+        self.sleep = sleep
+        self.fraction = 1.0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.doc_bucket is not None or self.token_bucket is not None
+
+    def acquire(self, documents: int, tokens: int) -> float:
+        """documents 件・tokens トークンを送れるまで待つ。待った秒数を返す"""
+        waited = 0.0
+        with self.lock:
+            while True:
+                wait = max(0.0, self.paused_until - self.clock())
+                for bucket in (self.doc_bucket, self.token_bucket):
+                    if bucket is not None:
+                        wait = max(wait, bucket.wait_time(self.fraction))
+                if wait <= 0:
+                    break
+                self.sleep(wait)
+                waited += wait
+            if self.doc_bucket is not None:
+                self.doc_bucket.level -= documents
+            if self.token_bucket is not None:
+                self.token_bucket.level -= tokens
+        return waited
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """サーバーが混んでいる: 速度を半分にし、しばらく送らない"""
+        with self.lock:
+            for bucket in (self.doc_bucket, self.token_bucket):
+                if bucket is not None:
+                    bucket.refill(self.fraction)
+            self.fraction = max(MIN_RATE_FRACTION, self.fraction / 2)
+            self.consecutive_throttles += 1
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (self.consecutive_throttles - 1))
+            self.paused_until = max(self.paused_until, self.clock() + retry_after)
+        logger.warning(f"LightRAGが混んでいるため登録速度を {self.fraction:.0%} に下げ、{retry_after:.0f}秒停止します")
+
+    def succeeded(self):
+        """登録が受け付けられた: 絞った速度を少し戻す"""
+        self.consecutive_throttles = 0
+        if self.fraction < 1.0:
+            with self.lock:
+                for bucket in (self.doc_bucket, self.token_bucket):
+                    if bucket is not None:
+                        bucket.refill(self.fraction)
+                self.fraction = min(1.0, self.fraction + RECOVERY_STEP)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After ヘッダーの秒数（HTTP日付形式や不正な値はNone）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
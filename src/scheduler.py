@@ -0,0 +1,74 @@
+"""
+ワーカーへ渡すファイルの順序（サイズとトークン数の見積もりによるスケジューリング）と、実際の処理時間の評価
+"""
+import heapq
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# discovery: 見つかった順（探索と並行して処理を始める）
+# lpt: 見積もりの大きいものから（全体の処理時間を短くする）
+# small-first: 見積もりの小さいものから（早く多くのファイルを検索できるようにする）
+SCHEDULES = ("discovery", "lpt", "small-first")
+
+# 前回の記録がないファイルのトークン数の見積もりに使う、1トークンあたりのバイト数
+BYTES_PER_TOKEN = 4
+
+
+def estimate_tokens(size: int, entry: Optional[Dict[str, Any]] = None) -> float:
+    """
+    ファイルのトークン数の見積もり
+
+    前回処理したときのトークン数が記録されていれば、サイズの比で補正して使う。
+    なければバイト数から見積もる
+    """
+    if entry and entry.get("tokens") and entry.get("size"):
+        return entry["tokens"] * size / entry["size"]
+    return size / BYTES_PER_TOKEN
+
+
+def order_by_cost(files: Iterable[Tuple[str, float]], schedule: str) -> List[str]:
+    """(パス, 見積もり) を schedule の順に並べたパス（同じ見積もりはパス順）"""
+    if schedule == "lpt":
+        return [path for path, _ in sorted(files, key=lambda item: (-item[1], item[0]))]
+    if schedule == "small-first":
+        return [path for path, _ in sorted(files, key=lambda item: (item[1], item[0]))]
+    return [path for path, _ in files]
+
+
+def list_schedule_makespan(costs: Iterable[float], workers: int) -> float:
+    """costs の順に空いたワーカーへ割り当てたときの完了時間（LPT順に渡せばLPTの見積もり）"""
+    loads = [0.0] * max(1, workers)
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def ideal_makespan(costs: List[float], workers: int) -> float:
+    """どんな順序でも下回れない完了時間（総量をワーカー数で割ったものと最大のタスクの大きい方）"""
+    if not costs:
+        return 0.0
+    return max(sum(costs) / max(1, workers), max(costs))
+
+
+def makespan_report(spans: List[Tuple[float, float]], workers: int) -> Dict[str, Any]:
+    """
+    ワーカーで処理したタスクの (開始時刻, 終了時刻) から、実際の完了時間と理想値を比べる
+
+    Returns:
+        tasks, makespan, ideal, total_work, longest（秒）と、理想値に対する超過率 overhead_pct
+    """
+    if not spans:
+        return {"tasks": 0, "makespan": 0.0, "ideal": 0.0, "total_work": 0.0, "longest": 0.0, "overhead_pct": 0.0}
+    durations = [end - start for start, end in spans]
+    makespan = max(end for _, end in spans) - min(start for start, _ in spans)
+    ideal = ideal_makespan(durations, workers)
+    return {
+        "tasks": len(spans),
+        "makespan": round(makespan, 3),
+        "ideal": round(ideal, 3),
+        "total_work": round(sum(durations), 3),
+        "longest": round(max(durations), 3),
+        "overhead_pct": round((makespan / ideal - 1) * 100, 1) if ideal else 0.0
+    }
@@ -0,0 +1,144 @@
+"""
+複数ホストで取り込みを分担するためのシャード割り当てと、シャードごとの処理状況のマージ
+"""
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    "i/N" 形式のシャード指定を (i, N) にする（i は 1 から N）
+
+    Raises:
+        ValueError: 形式が正しくない
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"シャードは i/N の形式で指定してください: {spec}") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"シャード番号は 1 から {count} の範囲で指定してください: {spec}")
+    return index, count
+
+
+def shard_file(path: str, index: int, count: int) -> str:
+    """シャードごとのファイル名（例: .lightrag_progress.json → .lightrag_progress.shard-1-of-4.json）"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{ext}"
+
+
+def shard_key(relative_path: str) -> int:
+    """ホストやマウント先によらず同じになるパスのハッシュ（Pythonの hash() は実行ごとに変わるので使わない）"""
+    normalized = relative_path.replace(os.sep, "/")
+    return int.from_bytes(hashlib.sha1(normalized.encode("utf-8")).digest()[:8], "big")
+
+
+def assign_shards(files: Iterable[Tuple[str, int]], count: int) -> Dict[str, int]:
+    """
+    ファイルをバイト数が均等になるようにシャードへ割り当てる
+
+    ファイルをパスのハッシュ順に並べ、先頭から順にシャードを埋めていく。各シャードの目標は
+    まだ割り当てていないバイト数を残りのシャード数で割ったもので、ファイルの中央が目標を
+    超えたら次のシャードに移る（大きなファイルが1つのシャードを占めても、残りは均等になる）。
+    どのホストでも同じ結果になり、ファイルの追加やサイズの変化で担当が変わるのは
+    主にシャードの境界付近のファイルだけ
+
+    Args:
+        files: (ルートからの相対パス, バイト数)
+        count: シャード数
+
+    Returns:
+        相対パス → シャード番号（1 から count）
+    """
+    ordered = sorted(files, key=lambda item: (shard_key(item[0]), item[0]))
+    # 空のファイルも数に入るように、最低1バイトとして扱う
+    remaining = sum(max(size, 1) for _, size in ordered)
+    assignment: Dict[str, int] = {}
+    shard, filled = 1, 0
+    target = remaining / count
+    for path, size in ordered:
+        weight = max(size, 1)
+        if shard < count and filled and filled + weight / 2 > target:
+            remaining -= filled
+            shard, filled = shard + 1, 0
+            target = remaining / (count - shard + 1)
+        assignment[path] = shard
+        filled += weight
+    return assignment
+
+
+def merge_progress(shards: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    シャードごとの処理状況を1つにまとめる
+
+    同じファイルが複数のシャードに記録されていれば（担当が移った直後など）、登録した
+    ドキュメントIDは両方を残し、サイズ・ハッシュは後のシャードのものを使う。
+    統計は数値ごとに合計する
+    """
+    merged: Dict[str, Any] = {
+        "processed_files": [],
+        "last_processed": None,
+        "total_files": 0,
+        "completed_files": 0,
+        "files": {},
+        "stats": {}
+    }
+    processed = set()
+    commits = set()
+    for progress in shards:
+        for file_path in progress.get("processed_files", []):
+            if file_path not in processed:
+                processed.add(file_path)
+                merged["processed_files"].append(file_path)
+        for file_path, entry in progress.get("files", {}).items():
+            previous = merged["files"].get(file_path)
+            if previous is not None:
+                logger.warning(f"複数のシャードに記録されています: {file_path}")
+                entry = dict(entry, doc_ids=list(dict.fromkeys(previous.get("doc_ids", []) + entry.get("doc_ids", []))))
+            merged["files"][file_path] = entry
+        merged["total_files"] += progress.get("total_files", 0)
+        merged["completed_files"] += progress.get("completed_files", 0)
+        merged["last_processed"] = progress.get("last_processed") or merged["last_processed"]
+        for key, value in progress.get("stats", {}).items():
+            if isinstance(value, (int, float)):
+                merged["stats"][key] = merged["stats"].get(key, 0) + value
+        if "last_commit" in progress:
+            commits.add(progress["last_commit"])
+    # 全シャードが同じコミットまで取り込んでいる場合だけ引き継ぐ
+    if len(commits) == 1 and all("last_commit" in progress for progress in shards):
+        merged["last_commit"] = commits.pop()
+    elif commits:
+        logger.warning("シャードごとに取り込んだコミットが異なるため、記録しません")
+    return merged
+
+
+def merge_references(shards: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    シャードごとの重複チャンク参照表を1つにまとめる
+
+    同じ本文の位置はシャードの順につなげ、代表のドキュメントは最初のシャードのものにする。
+    正規化設定（strip_comments）が異なる参照表は混ぜられないのでNone
+    """
+    if not shards:
+        return None
+    strip_comments = shards[0].get("strip_comments", False)
+    if any(data.get("strip_comments", False) != strip_comments for data in shards):
+        logger.warning("正規化設定が異なる参照表はマージできません")
+        return None
+    chunks: Dict[str, Dict[str, Any]] = {}
+    for data in shards:
+        for digest, entry in data.get("chunks", {}).items():
+            merged = chunks.get(digest)
+            if merged is None:
+                chunks[digest] = {**entry, "locations": list(entry.get("locations", []))}
+                continue
+            for location in entry.get("locations", []):
+                if location not in merged["locations"]:
+                    merged["locations"].append(location)
+            if "doc_id" not in merged and "doc_id" in entry:
+                merged["doc_id"] = entry["doc_id"]
+    return {"strip_comments": strip_comments, "chunks": chunks}
@@ -0,0 +1,272 @@
+"""
+読み込み前に適用するスキップルール（.lightragignore・サイズ・拡張子・ファイル名・先頭だけを見る自動生成判定）
+"""
+import fnmatch
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IGNORE_FILE_NAME = ".lightragignore"
+
+# 自動生成ファイルとみなすファイル名（小文字で比較）
+GENERATED_NAME_PATTERNS = [
+    "*.designer.pas", "*.designer.dfm",
+    "*generated*", "*autogen*", "*auto-gen*",
+    "*.g.pas"
+]
+# 先頭の数行にこれらが含まれていれば自動生成ファイルとみなす（小文字で比較）
+GENERATED_HEADER_PATTERNS = [
+    "auto-generated", "autogenerated", "generated automatically",
+    "do not edit", "do not modify", "generated code",
+    "this file is automatically generated"
+]
+GENERATED_HEADER_LINES = 10
+
+# スキップ理由（自動生成のものは統計上 auto_generated として数える）
+GENERATED_REASONS = ("generated_name", "generated_header")
+
+
+def _glob_segment(segment: str) -> str:
+    """パス区切りを含まないglobを正規表現にする"""
+    regex = ""
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = segment.find("]", i + 2)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                body = segment[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += "[" + body.replace("\\", "\\\\") + "]"
+                i = end
+        elif c == "\\" and i + 1 < len(segment):
+            i += 1
+            regex += re.escape(segment[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
+
+
+def translate_pattern(pattern: str) -> Tuple[re.Pattern, bool]:
+    """
+    gitignore形式のパターンを正規表現にする
+
+    Returns:
+        (ignoreファイルのあるディレクトリからの相対パスに対する正規表現, ディレクトリ専用か)
+    """
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # 先頭か途中に / があれば ignore ファイルの場所に固定、なければどの階層の名前にも一致
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    segments = pattern.split("/")
+    regex = ""
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == "**":
+            regex += ".*" if last else "(?:.*/)?"
+            continue
+        regex += _glob_segment(segment) + ("" if last else "/")
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile("^" + regex + "$"), dir_only
+
+
+class IgnoreFile:
+    """1つの .lightragignore の内容（後に書かれたルールほど優先）"""
+
+    def __init__(self, base: str, lines: List[str]):
+        """
+        Args:
+            base: ルートからこのファイルのあるディレクトリへの相対パス（ルートなら空文字）
+            lines: ファイルの各行
+        """
+        self.base = base
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip("\r")
+            if not line.endswith("\\ "):
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            regex, dir_only = translate_pattern(line)
+            self.rules.append((regex, negate, dir_only))
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """除外ならTrue、!で再包含ならFalse、どのルールにも一致しなければNone"""
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return None
+            path = path[len(self.base) + 1:]
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                result = not negate
+        return result
+
+
+class SkipRules:
+    """ファイル全体を読む前に、処理しなくてよいファイルを判定するクラス"""
+
+    def __init__(self, root: Optional[str], ignore_file: Optional[str] = IGNORE_FILE_NAME,
+                 max_bytes: int = 0, min_bytes: int = 0,
+                 extensions: Optional[List[str]] = None,
+                 filename_patterns: Optional[List[str]] = None,
+                 header_bytes: int = 4096):
+        """
+        Args:
+            root: 処理対象のルートディレクトリ（.lightragignore のパターンはここからの相対パス）。
+                Noneならパスはすでにルートからの相対パスとみなし、ignoreファイルは add_ignore_file で渡す
+            ignore_file: 各ディレクトリで読み込むignoreファイル名（Noneなら使わない）
+            max_bytes: これより大きいファイルをスキップ（0なら無制限）
+            min_bytes: これより小さいファイルをスキップ
+            extensions: 処理する拡張子（Noneならすべて）
+            filename_patterns: 自動生成ファイルとみなすファイル名のglob（追加分）
+            header_bytes: 自動生成の判定で読む先頭のバイト数
+        """
+        self.root = os.path.abspath(root) if root is not None else None
+        self.ignore_file = ignore_file
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.extensions = None
+        if extensions:
+            self.extensions = [ext.lower() if ext.startswith(".") else "." + ext.lower() for ext in extensions]
+        self.filename_patterns = GENERATED_NAME_PATTERNS + [p.lower() for p in (filename_patterns or [])]
+        self.header_bytes = header_bytes
+        self._header_patterns = [p.encode("ascii") for p in GENERATED_HEADER_PATTERNS]
+        self._ignore_files: Dict[str, Optional[IgnoreFile]] = {}
+        self._dir_ignored: Dict[str, bool] = {}
+
+    def _relative(self, path: str) -> str:
+        if self.root is None:
+            return path.replace(os.sep, "/").strip("/")
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        return "" if relative == "." else relative.replace(os.sep, "/")
+
+    def add_ignore_file(self, directory: str, lines: List[str]):
+        """
+        ignoreファイルの内容を直接登録する（アーカイブのメンバーなどディスク上にないもの）
+
+        Args:
+            directory: ignoreファイルのあるディレクトリ（ルートからの相対パス、ルートなら ""）
+        """
+        self._ignore_files[directory] = IgnoreFile(directory, lines)
+        self._dir_ignored.clear()
+
+    def _load_ignore_file(self, directory: str) -> Optional[IgnoreFile]:
+        if self.root is None:
+            return self._ignore_files.get(directory)
+        if directory not in self._ignore_files:
+            ignore = None
+            path = os.path.join(self.root, directory, self.ignore_file)
+            if os.path.isfile(path):
+                try:
+                    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                        ignore = IgnoreFile(directory, f.readlines())
+                except OSError as e:
+                    logger.warning(f"ignoreファイルの読み込みに失敗 {path}: {e}")
+            self._ignore_files[directory] = ignore
+        return self._ignore_files[directory]
+
+    def _match(self, relative: str, is_dir: bool) -> bool:
+        """ルートから親ディレクトリまでの ignore ファイルを順に適用し、最後に一致したルールで決める"""
+        result = False
+        parts = relative.split("/")[:-1]
+        for depth in range(len(parts) + 1):
+            ignore = self._load_ignore_file("/".join(parts[:depth]))
+            if ignore is not None:
+                matched = ignore.match(relative, is_dir)
+                if matched is not None:
+                    result = matched
+        return result
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        """.lightragignore で除外されているか（除外されたディレクトリの中身もすべて除外）"""
+        if not self.ignore_file:
+            return False
+        relative = self._relative(path)
+        if not relative or relative.startswith(".."):
+            return False
+        parts = relative.split("/")
+        for depth in range(1, len(parts)):
+            if self._is_dir_ignored("/".join(parts[:depth])):
+                return True
+        if is_dir:
+            return self._is_dir_ignored(relative)
+        return self._match(relative, False)
+
+    def _is_dir_ignored(self, relative: str) -> bool:
+        if relative not in self._dir_ignored:
+            self._dir_ignored[relative] = self._match(relative, True)
+        return self._dir_ignored[relative]
+
+    def is_generated_name(self, file_path: str) -> bool:
+        name = os.path.basename(file_path).lower()
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.filename_patterns)
+
+    def has_generated_header(self, file_path: str,
+                             read_head: Optional[Callable[[int], bytes]] = None) -> bool:
+        """
+        先頭の header_bytes だけを読んで自動生成ファイルの注記を探す
+
+        read_head を渡すとファイルを開かずにそこから先頭を読む（アーカイブのメンバーなど）
+        """
+        try:
+            if read_head is not None:
+                head = read_head(self.header_bytes)
+            else:
+                with open(file_path, 'rb') as f:
+                    head = f.read(self.header_bytes)
+        except OSError:
+            return False
+        for line in head.split(b"\n", GENERATED_HEADER_LINES)[:GENERATED_HEADER_LINES]:
+            line = line.lower()
+            if any(pattern in line for pattern in self._header_patterns):
+                return True
+        return False
+
+    def check(self, file_path: str, size: Optional[int] = None,
+              read_head: Optional[Callable[[int], bytes]] = None) -> Optional[str]:
+        """
+        スキップすべきならその理由を返す（処理するならNone）
+
+        安いルールから順に判定する: パターン → stat → 先頭数KBの読み込み。
+        探索時に得たサイズを size に渡せば stat を省く
+        """
+        if self.is_ignored(file_path):
+            return "ignored"
+        if self.extensions is not None and os.path.splitext(file_path)[1].lower() not in self.extensions:
+            return "extension"
+        if self.is_generated_name(file_path):
+            return "generated_name"
+        if size is None:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                return None
+        if self.max_bytes and size > self.max_bytes:
+            return "too_large"
+        if size < self.min_bytes:
+            return "too_small"
+        if self.has_generated_header(file_path, read_head):
+            return "generated_header"
+        return None
@@ -0,0 +1,237 @@
+"""
+ユニットをまたいだシンボル索引（ユニット → クラス → メンバー）
+
+AST解析の結果からクラス・メソッド・ルーチンの位置（行とバイト位置）をSQLiteに保存し、
+完全一致と前方一致でその場で引けるようにする。LightRAGには問い合わせない。
+ファイルごとに内容のハッシュを持ち、変わったファイルの行だけを入れ替える
+"""
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_KINDS = ("unit", "class", "procedure", "function", "constructor", "destructor")
+# 前方一致の範囲検索の上限（name >= prefix AND name < prefix + PREFIX_END）
+PREFIX_END = "\U0010ffff"
+
+
+class Symbol(NamedTuple):
+    unit: str
+    kind: str
+    # クラス名付きの名前（TFormMain.ButtonAddClick）。ユニットとクラスはその名前
+    name: str
+    class_name: Optional[str]
+    # 実装部（implementation）の本体か、interface / クラスの中の宣言か
+    implementation: bool
+    file_path: str
+    line_start: int
+    line_end: int
+    start_byte: int
+    end_byte: int
+
+    @property
+    def full_name(self) -> str:
+        """ユニット名付きの名前（MainForm.TFormMain.ButtonAddClick）"""
+        return self.unit if self.kind == "unit" else f"{self.unit}.{self.name}"
+
+
+def unit_name(file_path: str) -> str:
+    """ユニット名（Delphiではファイル名と同じ）"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def symbols_from_analysis(ast_info: Dict[str, Any], content: str) -> List[Dict[str, Any]]:
+    """
+    AST解析の結果（DelphiASTAnalyzer.ast_info_from_tree）を索引の行にする
+
+    先頭はユニット全体の行。宣言のメソッドにはクラス名を付けて、実装部と同じ名前で引けるようにする。
+    バイト位置はUTF-8にした内容での位置
+    """
+    symbols = [{
+        "kind": "unit", "name": "", "class_name": None, "implementation": False,
+        "line_start": 1, "line_end": content.count("\n") + 1,
+        "start_byte": 0, "end_byte": len(content.encode("utf-8", errors="surrogatepass"))
+    }]
+    for cls in ast_info.get("classes", []):
+        symbols.append({
+            "kind": "class", "name": cls["name"], "class_name": None, "implementation": False,
+            "line_start": cls.get("line_start", cls.get("line", 0)), "line_end": cls.get("line_end", 0),
+            "start_byte": cls.get("start_byte", 0), "end_byte": cls.get("end_byte", 0)
+        })
+    for func in ast_info.get("functions", []):
+        name = func["name"]
+        class_name = func.get("class_name")
+        if class_name and not name.startswith(class_name + "."):
+            name = f"{class_name}.{name}"
+        symbols.append({
+            "kind": func.get("type") if func.get("type") in SYMBOL_KINDS else "procedure",
+            "name": name, "class_name": class_name, "implementation": bool(func.get("implementation")),
+            "line_start": func.get("line_start", func.get("line", 0)), "line_end": func.get("line_end", 0),
+            "start_byte": func.get("start_byte", 0), "end_byte": func.get("end_byte", 0)
+        })
+    return symbols
+
+
+class SymbolIndex:
+    """ファイルごとに差し替えて更新するシンボル索引（SQLite）"""
+
+    def __init__(self, index_file: str = ".lightrag_symbols.sqlite"):
+        """
+        Args:
+            index_file: 索引ファイルのパス
+        """
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                unit TEXT NOT NULL,
+                sha256 TEXT
+            )
+        """)
+        # name_key はクラス名付きの名前、member_key は最後の名前、full_key はユニット名付きの名前（小文字）
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS symbols (
+                path TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                class_name TEXT,
+                implementation INTEGER NOT NULL,
+                line_start INTEGER NOT NULL,
+                line_end INTEGER NOT NULL,
+                start_byte INTEGER NOT NULL,
+                end_byte INTEGER NOT NULL,
+                name_key TEXT NOT NULL,
+                member_key TEXT NOT NULL,
+                full_key TEXT NOT NULL
+            )
+        """)
+        for column in ("path", "name_key", "member_key", "full_key"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_symbols_{column} ON symbols({column})")
+        self._conn.commit()
+
+    def file_hash(self, file_path: str) -> Optional[str]:
+        """索引にあるファイルの内容のハッシュ（なければNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM files WHERE path = ?", (file_path,)).fetchone()
+        return row[0] if row else None
+
+    def update_file(self, file_path: str, symbols: List[Dict[str, Any]],
+                    content_hash: Optional[str] = None) -> bool:
+        """
+        ファイルのシンボルをまとめて入れ替える（1つのトランザクション）
+
+        Args:
+            file_path: ファイルのパス
+            symbols: symbols_from_analysis の結果
+            content_hash: 内容のハッシュ。索引と同じなら何もしない
+
+        Returns:
+            索引を書き換えたか
+        """
+        if content_hash is not None and self.file_hash(file_path) == content_hash:
+            return False
+        unit = unit_name(file_path)
+        rows = []
+        for symbol in symbols:
+            name = symbol["name"] if symbol["kind"] != "unit" else unit
+            full_name = unit if symbol["kind"] == "unit" else f"{unit}.{name}"
+            rows.append((file_path, unit, symbol["kind"], name, symbol["class_name"],
+                         int(symbol["implementation"]), symbol["line_start"], symbol["line_end"],
+                         symbol["start_byte"], symbol["end_byte"], name.lower(),
+                         name.rsplit(".", 1)[-1].lower(), full_name.lower()))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM symbols WHERE path = ?", (file_path,))
+            self._conn.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO files (path, unit, sha256) VALUES (?, ?, ?)",
+                               (file_path, unit, content_hash))
+        return True
+
+    def remove_file(self, file_path: str):
+        """削除されたファイルのシンボルを消す"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM symbols WHERE path = ?", (file_path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (file_path,))
+
+    def rename_file(self, old_path: str, new_path: str):
+        """
+        名前が変わったファイルのシンボルを移す
+
+        ユニット名はファイル名なので、名前が変わったら新しいユニット名で入れ直す
+        """
+        if unit_name(old_path) != unit_name(new_path):
+            symbols = [symbol._asdict() for symbol in self.file_symbols(old_path)]
+            content_hash = self.file_hash(old_path)
+            self.remove_file(old_path)
+            if symbols:
+                self.update_file(new_path, symbols, content_hash)
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM symbols WHERE path = ?", (new_path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (new_path,))
+            self._conn.execute("UPDATE symbols SET path = ? WHERE path = ?", (new_path, old_path))
+            self._conn.execute("UPDATE files SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def indexed_files(self) -> List[str]:
+        """索引にあるファイルのパス"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files ORDER BY path")]
+
+    def file_symbols(self, file_path: str) -> List[Symbol]:
+        """ファイルのシンボル（行番号順）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT unit, kind, name, class_name, implementation, path, line_start, line_end, "
+                "start_byte, end_byte FROM symbols WHERE path = ? ORDER BY start_byte, kind != 'unit'",
+                (file_path,)).fetchall()
+        return [self._symbol(row) for row in rows]
+
+    def lookup(self, query: str, prefix: bool = False, limit: int = 50) -> List[Symbol]:
+        """
+        名前でシンボルを引く（大文字と小文字は区別しない）
+
+        クラス名付きの名前（TFormMain.ButtonAddClick）、メンバー名だけ（ButtonAddClick）、
+        ユニット名付きの名前（MainForm.TFormMain.ButtonAddClick）のどれでも引ける
+
+        Args:
+            query: 引く名前
+            prefix: 前方一致で引くか
+            limit: 返す件数の上限
+        """
+        key = query.lower()
+        if prefix:
+            # 範囲検索にして、各列のインデックスをそのまま使う
+            condition = " OR ".join(f"({column} >= ? AND {column} < ?)"
+                                    for column in ("name_key", "member_key", "full_key"))
+            params = [key, key + PREFIX_END] * 3
+        else:
+            condition = "name_key = ? OR member_key = ? OR full_key = ?"
+            params = [key] * 3
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT unit, kind, name, class_name, implementation, path, line_start, line_end, "
+                f"start_byte, end_byte FROM symbols WHERE {condition} "
+                "ORDER BY full_key, implementation, path LIMIT ?", params + [limit]).fetchall()
+        return [self._symbol(row) for row in rows]
+
+    @staticmethod
+    def _symbol(row) -> Symbol:
+        unit, kind, name, class_name, implementation, path, *span = row
+        return Symbol(unit, kind, name, class_name, bool(implementation), path, *span)
+
+    def summary(self) -> Dict[str, int]:
+        """索引にあるファイルとシンボルの数"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            symbols = self._conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+        return {"files": files, "symbols": symbols}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,8 +2,9 @@
 テキストのチャンク分割とトークン管理
 """
 import tiktoken
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 import logging
+from src.metrics import MetricsRecorder, NULL_METRICS
 
 logger = logging.getLogger(__name__)
 
@@ -11,20 +12,25 @@ logger = logging.getLogger(__name__)
 class TextChunker:
     """トークン制限を考慮したテキストチャンク分割クラス"""
     
-    def __init__(self, model_name: str = "text-embedding-3-large", max_tokens: int = 8000):
+    def __init__(self, model_name: str = "text-embedding-3-large", max_tokens: int = 8000,
+                 metrics: Optional[MetricsRecorder] = None):
         """
         Args:
             model_name: 使用するOpenAIモデル名
             max_tokens: 最大トークン数（8191の制限に対して余裕を持たせる）
+            metrics: トークン化の計測先（Noneなら計測しない）
         """
         self.model_name = model_name
         self.max_tokens = max_tokens
+        self.metrics = metrics or NULL_METRICS
         self.encoder = tiktoken.encoding_for_model(model_name)
         
     def count_tokens(self, text: str) -> int:
         """テキストのトークン数をカウント"""
         try:
-            tokens = self.encoder.encode(text)
+            with self.metrics.stage("tokenization", bytes=len(text)) as timer:
+                tokens = self.encoder.encode(text)
+                timer.tokens = len(tokens)
             return len(tokens)
         except Exception as e:
             logger.error(f"トークンカウントエラー: {e}")
@@ -58,74 +64,73 @@ class TextChunker:
     
     def chunk_by_section(self, text: str, section_delimiters: List[str] = None) -> List[Dict[str, Any]]:
         """セクション（関数、クラスなど）単位でチャンク分割"""
+        return list(self.iter_section_chunks(text.split('\n'), section_delimiters))
+    
+    def iter_section_chunks(self, lines: Iterable[str],
+                            section_delimiters: List[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        行のイテラブルをセクション単位のチャンクに分割し、できた順に返す
+        
+        保持するのは作成中の1チャンク分だけなので、巨大ファイルの行をストリームで渡せば
+        メモリはファイルサイズによらず一定に収まる。トークン数も行ごとに数える
+        """
         if section_delimiters is None:
             section_delimiters = [
                 '\nprocedure ', '\nfunction ', '\nclass ', 
                 '\ntype ', '\nconst ', '\nvar ',
                 '\nimplementation', '\ninterface'
             ]
+        delimiters = tuple(delimiter.strip().lower() for delimiter in section_delimiters)
         
-        chunks = []
-        current_chunk = ""
+        current_parts: List[str] = []
         current_tokens = 0
         chunk_metadata = {"type": "mixed", "sections": []}
         
-        # 行単位で処理
-        lines = text.split('\n')
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i]
+        for line in lines:
             line_tokens = self.count_tokens(line + '\n')
             
+            # 1行だけで上限を超える場合（生成コードの巨大な定数など）は行を分割する
+            if line_tokens > self.max_tokens:
+                if current_parts:
+                    yield {"content": "".join(current_parts), "metadata": chunk_metadata, "token_count": current_tokens}
+                for piece in self.chunk_text(line + '\n'):
+                    yield {"content": piece, "metadata": {"type": "continuation", "sections": []},
+                           "token_count": self.count_tokens(piece)}
+                current_parts, current_tokens = [], 0
+                chunk_metadata = {"type": "continuation", "sections": []}
+                continue
+            
             # セクション開始を検出
-            is_section_start = any(line.strip().lower().startswith(delimiter.strip().lower()) 
-                                 for delimiter in section_delimiters)
+            is_section_start = line.strip().lower().startswith(delimiters)
             
             # 新しいセクションかつ現在のチャンクが大きい場合
             if is_section_start and current_tokens > 0:
                 # 現在のチャンクが最大トークンの50%を超えていたら新しいチャンクを開始
                 if current_tokens + line_tokens > self.max_tokens * 0.5:
-                    if current_chunk:
-                        chunks.append({
-                            "content": current_chunk,
-                            "metadata": chunk_metadata,
-                            "token_count": current_tokens
-                        })
-                    current_chunk = line + '\n'
+                    if current_parts:
+                        yield {"content": "".join(current_parts), "metadata": chunk_metadata, "token_count": current_tokens}
+                    current_parts = [line + '\n']
                     current_tokens = line_tokens
                     chunk_metadata = {"type": self._detect_section_type(line), "sections": [line.strip()]}
                 else:
-                    current_chunk += line + '\n'
+                    current_parts.append(line + '\n')
                     current_tokens += line_tokens
                     chunk_metadata["sections"].append(line.strip())
             else:
                 # トークン制限チェック
                 if current_tokens + line_tokens > self.max_tokens:
-                    if current_chunk:
-                        chunks.append({
-                            "content": current_chunk,
-                            "metadata": chunk_metadata,
-                            "token_count": current_tokens
-                        })
-                    current_chunk = line + '\n'
+                    if current_parts:
+                        yield {"content": "".join(current_parts), "metadata": chunk_metadata, "token_count": current_tokens}
+                    current_parts = [line + '\n']
                     current_tokens = line_tokens
                     chunk_metadata = {"type": "continuation", "sections": []}
                 else:
-                    current_chunk += line + '\n'
+                    current_parts.append(line + '\n')
                     current_tokens += line_tokens
-            
-            i += 1
         
         # 最後のチャンクを追加
-        if current_chunk:
-            chunks.append({
-                "content": current_chunk,
-                "metadata": chunk_metadata,
-                "token_count": current_tokens
-            })
-        
-        return chunks
+        if current_parts:
+            yield {"content": "".join(current_parts), "metadata": chunk_metadata, "token_count": current_tokens}
     
     def _detect_section_type(self, line: str) -> str:
         """セクションタイプを検出"""
@@ -159,8 +164,8 @@ class TextChunker:
                         "metadata": {
                             "type": "function",
                             "name": func["name"],
-                            "line_start": func["line_start"],
-                            "line_end": func["line_end"]
+                            "line_start": func.get("line_start", func.get("line", 0)),
+                            "line_end": func.get("line_end", 0)
                         },
                         "token_count": func_tokens
                     })
@@ -229,8 +234,10 @@ class TextChunker:
     
     def _extract_class_content(self, code: str, class_info: Dict) -> str:
         """クラスのコンテンツを抽出（簡易実装）"""
-        # クラス名を含む行から次のクラスまたはendまでを抽出
         lines = code.split('\n')
+        if "line_start" in class_info and "line_end" in class_info:
+            return '\n'.join(lines[max(0, class_info["line_start"] - 1):class_info["line_end"]])
+        # 範囲がなければ、クラス名を含む行から次のクラスまたはendまでを抽出
         class_name = class_info["name"]
         
         start_idx = None
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.analysis_cache import AnalysisCache
+
+
+def test_roundtrip_and_version_invalidation(tmp_path):
+    cache_file = str(tmp_path / "cache.sqlite")
+    cache = AnalysisCache(cache_file, version="v1")
+    key = cache.make_key("unit A; end.")
+    assert cache.get(key) is None
+    cache.put(key, {"functions": [], "classes": [{"name": "TFoo", "line": 3}]})
+    assert cache.get(key)["classes"][0]["name"] == "TFoo"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    # 同じバージョンなら再起動後も使える
+    cache = AnalysisCache(cache_file, version="v1")
+    assert cache.get(key) is not None
+    cache.close()
+
+    # バージョンが変わるとキーも変わり、古いエントリは破棄される
+    cache = AnalysisCache(cache_file, version="v2")
+    assert cache.make_key("unit A; end.") != key
+    assert cache.total_bytes == 0
+    cache.close()
+
+
+def test_lru_eviction(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite"), max_bytes=300, version="v1")
+    keys = [cache.make_key(f"unit U{i};") for i in range(3)]
+    value = {"functions": [{"name": "x" * 80}], "classes": []}
+    cache.put(keys[0], value)
+    cache.put(keys[1], value)
+    cache.get(keys[0])  # keys[0]を最近使ったことにする
+    cache.put(keys[2], value)
+
+    assert cache.total_bytes <= 300
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    cache.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import tarfile
+import zipfile
+
+from src.archive_source import ArchiveSource, is_archive, normalize_member_path
+from src.file_utils import FileProcessor
+from src.skip_rules import SkipRules
+
+MAIN_TEXT = "unit Main;\r\n// 顧客マスタの登録と更新を行うユニットです\r\n// 日本語のコメントを含む\r\nend.\r\n"
+MEMBERS = {
+    "src/Main.pas": MAIN_TEXT.encode("shift_jis"),
+    "src/Gen.pas": b"// Auto-generated by a tool, do not edit\nunit Gen;\nend.\n",
+    "vendor/Lib.pas": b"unit Lib;\nend.\n",
+    ".git/Hidden.pas": b"unit Hidden;\nend.\n",
+    ".lightragignore": b"vendor/\n",
+}
+
+
+def _write_zip(path):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+
+
+def _write_tar(path):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo("./" + name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+def test_zip_and_tar_members_are_streamed_with_relative_paths(tmp_path):
+    _write_zip(tmp_path / "drop.zip")
+    _write_tar(tmp_path / "drop.tar.gz")
+    for name in ("drop.zip", "drop.tar.gz"):
+        path = str(tmp_path / name)
+        assert is_archive(path)
+        members = {member.path: reader.read() for member, reader in ArchiveSource(path)}
+        # 隠しディレクトリは探索と同じく除外する
+        assert set(members) == {"src/Main.pas", "src/Gen.pas", "vendor/Lib.pas", ".lightragignore"}
+        assert members["src/Main.pas"] == MEMBERS["src/Main.pas"]
+    assert not is_archive(str(tmp_path))
+
+
+def test_zip_returns_ignore_files_first(tmp_path):
+    _write_zip(tmp_path / "drop.zip")
+    first, _ = next(ArchiveSource(str(tmp_path / "drop.zip")).iter_members((".lightragignore",)))
+    assert first.path == ".lightragignore"
+
+
+def test_member_reader_keeps_the_head_for_the_full_read(tmp_path):
+    _write_tar(tmp_path / "drop.tar.gz")
+    for member, reader in ArchiveSource(str(tmp_path / "drop.tar.gz")):
+        head = reader.head(4)
+        assert reader.read() == MEMBERS[member.path]
+        assert head == MEMBERS[member.path][:4]
+
+
+def test_member_files_are_closed_and_large_members_spooled(tmp_path):
+    _write_zip(tmp_path / "drop.zip")
+    opened = []
+    for member, reader in ArchiveSource(str(tmp_path / "drop.zip")):
+        reader.head(4)
+        opened.append(reader._file)
+        if member.path == "src/Main.pas":
+            # 一時ファイルに書き出し、先頭を読み直さずに全体をmmapで返す
+            spooled = reader.spool()
+            assert not isinstance(spooled, bytes)
+            assert spooled[:] == MEMBERS[member.path]
+            assert reader.head(4) == MEMBERS[member.path][:4]
+    # 先頭だけ読んで飛ばしたメンバーも閉じている
+    assert opened and all(file.closed for file in opened)
+
+
+def test_member_paths_outside_the_root_are_rejected():
+    assert normalize_member_path("./a/../b/C.pas") == "b/C.pas"
+    assert normalize_member_path("/abs/C.pas") == "abs/C.pas"
+    assert normalize_member_path("../escape.pas") is None
+
+
+def test_skip_rules_and_decoding_work_on_members(tmp_path):
+    _write_zip(tmp_path / "drop.zip")
+    rules = SkipRules(None)
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+    reasons = {}
+    for member, reader in ArchiveSource(str(tmp_path / "drop.zip")).iter_members((".lightragignore",)):
+        if member.path == ".lightragignore":
+            rules.add_ignore_file("", reader.read().decode().splitlines())
+            continue
+        reasons[member.path] = rules.check(member.path, size=member.size, read_head=reader.head)
+        if reasons[member.path] is None:
+            content, encoding = processor.decode_bytes(reader.read(), member.path)
+            # テキストモードで読んだ場合と同じく改行は '\n' になる
+            assert encoding == "shift_jis"
+            assert content == MAIN_TEXT.replace("\r\n", "\n")
+    assert reasons == {"src/Main.pas": None, "src/Gen.pas": "generated_header", "vendor/Lib.pas": "ignored"}
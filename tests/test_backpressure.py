@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import requests
+
+from src.backpressure import PipelineMonitor, pipeline_depth
+
+
+class FakeClock:
+    """sleep で進むだけの時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeServer:
+    """登録したドキュメントを sleep のたびに1件ずつ処理済みにするLightRAG"""
+
+    def __init__(self):
+        self.pending = []
+        self.processed = []
+        self.listings = 0
+
+    def pipeline_status(self):
+        return {"busy": bool(self.pending), "docs": len(self.pending), "pending": len(self.pending),
+                "processing": 0}
+
+    def document_statuses(self):
+        self.listings += 1
+        return {
+            "pending": [{"id": doc_id} for doc_id in self.pending],
+            "processed": [{"id": doc_id} for doc_id in self.processed]
+        }
+
+    def work(self):
+        if self.pending:
+            self.processed.append(self.pending.pop(0))
+
+
+def _monitor(server, **options):
+    clock = FakeClock()
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        server.work()
+
+    return PipelineMonitor(server, clock=clock, sleep=sleep, **options), clock
+
+
+def _submit(server, monitor, doc_ids):
+    monitor.wait_for_capacity()
+    server.pending.extend(doc_ids)
+    monitor.track(doc_ids)
+
+
+def test_pauses_at_high_water_until_low_water():
+    server = FakeServer()
+    monitor, clock = _monitor(server, high_water=4, low_water=1, poll_seconds=1.0)
+    # 取得の間隔の間に登録した分も処理待ちとして数える
+    for i in range(4):
+        _submit(server, monitor, [f"doc-{i}"])
+    assert clock.now == 0
+    assert monitor.wait_for_capacity() == pytest.approx(3.0)
+    assert monitor.depth == 1
+    assert monitor.pauses == 1
+    # 最大値はサーバーから取得した値
+    assert monitor.max_depth == 3
+
+
+def test_records_latency_until_indexed():
+    server = FakeServer()
+    monitor, clock = _monitor(server, high_water=2, poll_seconds=1.0)
+    _submit(server, monitor, ["doc-a", "doc-b"])
+    monitor.wait_for_capacity()
+    summary = monitor.summary()
+    assert summary["indexed_documents"] == 1
+    assert summary["still_indexing"] == 1
+    assert summary["indexed_latency_max"] == 1.0
+    assert summary["pauses"] == 1
+
+
+def test_disabled_monitor_never_polls():
+    server = FakeServer()
+    server.document_statuses = None
+    monitor, clock = _monitor(server)
+    assert not monitor.enabled
+    assert monitor.wait_for_capacity() == 0
+    monitor.track(["doc-a"])
+    assert monitor.summary()["still_indexing"] == 0
+
+
+def test_polls_counts_and_lists_documents_only_now_and_then():
+    server = FakeServer()
+    monitor, clock = _monitor(server, high_water=10, low_water=0, poll_seconds=1.0, list_seconds=5.0)
+    _submit(server, monitor, [f"doc-{i}" for i in range(10)])
+    assert monitor.wait_for_capacity() == pytest.approx(10.0)
+    # 10回の取得のうち、全ドキュメントの一覧は5秒ごと（1秒後と6秒後）だけ
+    assert server.listings == 2
+    assert monitor.summary()["indexed_documents"] == 6
+    # 最後の集計では一覧を取得して、残りの索引完了を記録する
+    monitor.poll(list_documents=True)
+    assert monitor.summary()["indexed_documents"] == 10
+    assert pipeline_depth({"busy": True, "docs": 3}) == 3
+    assert pipeline_depth({"busy": False, "docs": 3}) == 0
+
+
+def test_failing_polls_stop_holding_uploads_back():
+    server = FakeServer()
+    monitor, clock = _monitor(server, high_water=2, poll_seconds=1.0, max_poll_failures=3)
+    _submit(server, monitor, ["doc-a", "doc-b"])
+
+    def unreachable():
+        raise requests.ConnectionError("connection refused")
+
+    server.pipeline_status = server.document_statuses = unreachable
+    # 前回の値のまま待ち続けず、3回失敗したら処理待ちを忘れて再開する
+    assert monitor.wait_for_capacity() == pytest.approx(3.0)
+    assert monitor.depth is None
+    assert monitor.wait_for_capacity() == 0
+
+
+def test_counts_from_the_listing_without_the_status_endpoint():
+    server = FakeServer()
+    response = requests.Response()
+    response.status_code = 404
+
+    def missing():
+        raise requests.HTTPError(response=response)
+
+    server.pipeline_status = missing
+    monitor, clock = _monitor(server, high_water=2, poll_seconds=1.0)
+    _submit(server, monitor, ["doc-a", "doc-b"])
+    assert monitor.wait_for_capacity() == pytest.approx(1.0)
+    assert not monitor.count_endpoint
+    assert server.listings == 2
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chunk_dedup import ChunkDeduplicator
+
+
+def _chunk(content, file_path, line):
+    return {
+        "content": f"Function: Foo\nType: procedure\nLine: {line}\n\n{content}",
+        "metadata": {"file_path": file_path, "chunk_type": "function", "line_number": line, "token_count": 12}
+    }
+
+
+def test_whitespace_normalized_duplicates_are_skipped(tmp_path):
+    refs = str(tmp_path / "refs.json")
+    dedup = ChunkDeduplicator(refs)
+    first = _chunk("procedure Foo;\nbegin\n  Bar;\nend;", "a/Foo.pas", 10)
+    copy = _chunk("procedure Foo;\r\nbegin\r\n    Bar;\r\nend;", "vendor/Foo.pas", 42)
+
+    assert dedup.filter_chunks([first, copy]) == [first]
+    locations = dedup.locations(first["content_hash"])
+    assert [loc["file_path"] for loc in locations] == ["a/Foo.pas", "vendor/Foo.pas"]
+
+    # 参照表は永続化され、次回の実行でも重複と判定される
+    dedup.save_references()
+    again = ChunkDeduplicator(refs)
+    assert again.filter_chunks([_chunk("procedure Foo; begin Bar; end;", "b/Foo.pas", 1)]) == []
+
+
+def test_comment_stripping_is_optional():
+    with_comment = {"content": "Result := 1; // 初期値\n{ note }", "metadata": {"file_path": "a.pas"}}
+    without_comment = {"content": "Result := 1;", "metadata": {"file_path": "b.pas"}}
+
+    assert len(ChunkDeduplicator(None).filter_chunks([dict(with_comment), dict(without_comment)])) == 2
+    stripping = ChunkDeduplicator(None, strip_comments=True)
+    assert len(stripping.filter_chunks([dict(with_comment), dict(without_comment)])) == 1
+    # 文字列リテラル中の // はコメント扱いしない
+    assert stripping.normalize("S := 'http://x'; // c") == "S := 'http://x';"
+
+
+def test_forgetting_the_representative_hands_its_document_over():
+    dedup = ChunkDeduplicator(None)
+    first = _chunk("procedure Foo; begin Bar; end;", "a/Foo.pas", 10)
+    copy = _chunk("procedure Foo; begin Bar; end;", "b/Foo.pas", 20)
+    only = _chunk("procedure Baz; begin end;", "a/Foo.pas", 30)
+    assert dedup.filter_chunks([first, copy, only]) == [first, only]
+    dedup.set_document(first["content_hash"], "doc-shared")
+    dedup.set_document(only["content_hash"], "doc-only")
+
+    # 他のファイルがまだ使う本文のドキュメントは削除せず引き継ぐ
+    assert dedup.forget_file("a/Foo.pas") == {"doc-shared": "b/Foo.pas"}
+    assert [loc["file_path"] for loc in dedup.locations(first["content_hash"])] == ["b/Foo.pas"]
+    assert dedup.locations(only["content_hash"]) == []
+    # 代表でなかったファイルを外しても何も引き継がない
+    assert dedup.forget_file("b/Foo.pas") == {}
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chunk_store import INDEX_FILE, ChunkStoreReader, ChunkStoreWriter, summarize_store
+
+
+def _chunks(name, count):
+    for i in range(count):
+        yield {"content": f"procedure {name}{i};\nbegin\nend;",
+               "metadata": {"file_path": f"{name}.pas", "chunk_type": "function", "token_count": 10}}
+
+
+def test_chunks_round_trip_per_file(tmp_path):
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.write_file("A.pas", _chunks("A", 3), content_hash="a1", bytes=100)
+    writer.write_file("B.pas", _chunks("B", 2000), content_hash="b1", bytes=200)
+
+    reader = ChunkStoreReader(str(tmp_path))
+    entries = dict((entry["file_path"], entry) for _, entry in reader.entries())
+    assert entries["A.pas"]["content_hash"] == "a1"
+    assert [chunk["content"] for chunk in reader.read_chunks(entries["A.pas"])] == \
+        [chunk["content"] for chunk in _chunks("A", 3)]
+    # 1ファイル分だけを展開して読める（隣のファイルのチャンクは混ざらない）
+    assert len(list(reader.read_chunks(entries["B.pas"]))) == 2000
+    assert summarize_store(reader) == {"files": 2, "chunks": 2003, "tokens": 20030, "removed_files": 0}
+
+
+def test_index_replays_rewrites_removals_and_renames_in_order(tmp_path):
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.write_file("A.pas", _chunks("A", 1), content_hash="a1")
+    writer.write_file("B.pas", _chunks("B", 1), content_hash="b1")
+    writer.write_file("A.pas", _chunks("A", 2), content_hash="a2")
+    writer.remove_file("B.pas")
+    writer.rename_file("A.pas", "C.pas")
+
+    reader = ChunkStoreReader(str(tmp_path))
+    replay = [(entry["file_path"], entry.get("content_hash"), entry.get("removed"), entry.get("renamed_from"))
+              for _, entry in reader.entries()]
+    # 書き直す前の A.pas は飛ばす
+    assert replay == [("B.pas", "b1", None, None), ("A.pas", "a2", None, None),
+                      ("B.pas", None, True, None), ("C.pas", None, None, "A.pas")]
+    assert [position for position, _ in reader.entries(4)] == [4]
+    assert summarize_store(reader)["files"] == 1
+
+
+def test_rewrite_after_a_rename_keeps_the_renamed_content(tmp_path):
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.write_file("A.pas", _chunks("A", 1), content_hash="a1")
+    writer.rename_file("A.pas", "B.pas")
+    writer.write_file("A.pas", _chunks("A", 2), content_hash="a2")
+    writer.write_file("A.pas", _chunks("A", 3), content_hash="a3")
+
+    reader = ChunkStoreReader(str(tmp_path))
+    replay = [(entry["file_path"], entry.get("content_hash"), entry.get("renamed_from"))
+              for _, entry in reader.entries()]
+    # 最初の A.pas は名前変更で B.pas になるので飛ばさない。名前変更のあとの書き直しは飛ばす
+    assert replay == [("A.pas", "a1", None), ("B.pas", None, "A.pas"), ("A.pas", "a3", None)]
+    assert summarize_store(reader)["files"] == 2
+
+
+def test_store_survives_an_interrupted_index_write_and_rotates_segments(tmp_path):
+    writer = ChunkStoreWriter(str(tmp_path), segment_bytes=1)
+    writer.write_file("A.pas", _chunks("A", 1))
+    with open(tmp_path / INDEX_FILE, "a", encoding="utf-8") as f:
+        f.write('{"file_path": "B.pa')
+
+    # 書きかけの行は無視し、続きはその次の行から書く
+    writer = ChunkStoreWriter(str(tmp_path), segment_bytes=1)
+    writer.write_file("C.pas", _chunks("C", 1))
+    reader = ChunkStoreReader(str(tmp_path))
+    entries = [entry for _, entry in reader.entries()]
+    assert [entry["file_path"] for entry in entries] == ["A.pas", "C.pas"]
+    assert entries[0]["segment"] != entries[1]["segment"]
+    assert [chunk["content"] for chunk in reader.read_chunks(entries[1])] == ["procedure C0;\nbegin\nend;"]
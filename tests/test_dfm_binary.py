@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import struct
+
+import pytest
+
+from src.dfm_binary import is_binary_dfm, read_binary_dfm
+from src.dfm_parser import BinaryData, DfmSyntaxError, parse_dfm, render_component
+
+PICTURE = bytes([9]) + b"TPngImage" + bytes(1000)
+
+
+def _short(text):
+    data = text.encode("shift_jis")
+    return bytes([len(data)]) + data
+
+
+def _int(value):
+    return b"\x02" + struct.pack("<b", value) if -128 <= value < 128 else b"\x04" + struct.pack("<i", value)
+
+
+def _extended(value):
+    # 仮数部64ビット（整数ビットあり）と符号付きの指数部15ビット
+    mantissa, exponent = value, 16383 + 63
+    while mantissa < 1 << 63:
+        mantissa *= 2
+        exponent -= 1
+    return b"\x05" + struct.pack("<QH", int(mantissa), exponent)
+
+
+def _binary_form():
+    """Delphiが書き出すのと同じ順のTPF0"""
+    return b"".join([
+        b"TPF0",
+        b"\xf1", _short("TFormMain"), _short("FormMain"),
+        _short("Caption"), b"\x12", struct.pack("<i", 7), "メイン画面\r\n".encode("utf-16-le"),
+        _short("Anchors"), b"\x0b", _short("akLeft"), _short("akTop"), b"\x00",
+        _short("ClientHeight"), _int(480),
+        _short("Position.X"), _extended(24),
+        _short("Visible"), b"\x08",
+        _short("OnCreate"), b"\x07", _short("FormCreate"),
+        b"\x00",
+        # 子: Image1（画像）、Grid1（コレクション）、Frame1（inline、作成順 [2]）
+        _short("TImage"), _short("Image1"),
+        _short("Picture.Data"), b"\x0a", struct.pack("<i", len(PICTURE)), PICTURE,
+        b"\x00", b"\x00",
+        _short("TDBGrid"), _short("Grid1"),
+        _short("Columns"), b"\x0e",
+        b"\x01", _short("FieldName"), b"\x06", _short("ID"), b"\x00",
+        b"\x01", _short("FieldName"), b"\x06", _short("NAME"), b"\x00",
+        b"\x00",
+        b"\x00", b"\x00",
+        b"\xf6", _int(2), _short("TFrameA"), _short("Frame1"),
+        _short("Lines.Strings"), b"\x01", b"\x06", _short("a"), b"\x06", _short("b"), b"\x00",
+        b"\x00", b"\x00",
+        b"\x00"
+    ])
+
+
+TEXT_FORM = f"""inherited FormMain: TFormMain
+  Caption = 'メイン画面'#13#10
+  Anchors = [akLeft, akTop]
+  ClientHeight = 480
+  Position.X = 24.0
+  Visible = False
+  OnCreate = FormCreate
+  object Image1: TImage
+    Picture.Data = {{{PICTURE.hex()}}}
+  end
+  object Grid1: TDBGrid
+    Columns = <
+      item
+        FieldName = 'ID'
+      end
+      item
+        FieldName = 'NAME'
+      end>
+  end
+  inline Frame1: TFrameA [2]
+    Lines.Strings = (
+      'a'
+      'b')
+  end
+end
+"""
+
+
+def test_decodes_the_same_tree_as_text_form():
+    data = _binary_form()
+    assert is_binary_dfm(data) and not is_binary_dfm(TEXT_FORM.encode("utf-8"))
+    form = read_binary_dfm(io.BytesIO(data))
+    assert render_component(form) == render_component(parse_dfm(TEXT_FORM.splitlines()))
+    picture = form.children[0].property("Picture.Data")
+    assert picture == BinaryData(len(PICTURE), PICTURE[:64])
+    assert picture.class_name == "TPngImage"
+    assert form.events() == [("OnCreate", "FormCreate")]
+
+
+def test_rejects_truncated_form():
+    data = _binary_form()
+    with pytest.raises(DfmSyntaxError):
+        read_binary_dfm(io.BytesIO(data[:len(data) // 2]))
+    with pytest.raises(DfmSyntaxError):
+        read_binary_dfm(io.BytesIO(TEXT_FORM.encode("utf-8")))
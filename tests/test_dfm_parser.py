@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.dfm_parser import (
+    BinaryData, Collection, DfmList, DfmSet, DfmSyntaxError, Identifier, chunk_form, parse_dfm, render_component
+)
+
+# Picture.Data の先頭はグラフィックのクラス名（長さ付き文字列）
+PNG_HEAD = (bytes([9]) + b"TPngImage" + bytes(range(16))).hex().upper()
+
+FORM = f"""inherited FormMain: TFormMain
+  Caption = 'It''s '#13#10'a form'
+  Hint = 'first line ' +
+    'second line'
+  Anchors = [akLeft, akTop]
+  Position.X = -8.5
+  Color = $00FF00
+  OnCreate = FormCreate
+  object Panel1: TPanel
+    Align = alTop
+    object Image1: TImage
+      Picture.Data = {{
+        {PNG_HEAD[:40]}
+        {PNG_HEAD[40:]}}}
+    end
+    inline Frame1: TFrameA
+      Lines.Strings = (
+        'a'
+        'b')
+    end
+  end
+  object Grid1: TDBGrid
+    Columns = <
+      item
+        FieldName = 'ID'
+        Title.Caption = 'Id'
+      end
+      item
+        FieldName = 'NAME'
+      end>
+  end
+  object Button1: TButton [2]
+    OnClick = Button1Click
+  end
+end
+"""
+
+
+def test_builds_component_tree_and_values():
+    form = parse_dfm(FORM.splitlines())
+    assert (form.kind, form.name, form.class_name) == ("inherited", "FormMain", "TFormMain")
+    assert form.property("Caption") == "It's \r\na form"
+    # + で行をまたいだ文字列はつなげる
+    assert form.property("Hint") == "first line second line"
+    assert form.property("Anchors") == DfmSet(["akLeft", "akTop"])
+    assert form.property("Position.X") == -8.5
+    assert form.property("Color") == 0xFF00
+    assert form.events() == [("OnCreate", "FormCreate")]
+    assert isinstance(form.property("OnCreate"), Identifier)
+
+    panel, grid, button = form.children
+    image, frame = panel.children
+    assert frame.kind == "inline"
+    assert frame.property("Lines.Strings") == DfmList(["a", "b"])
+    columns = grid.property("Columns")
+    assert isinstance(columns, Collection) and len(columns) == 2
+    assert columns[0].properties[1].name == "Title.Caption"
+    assert button.index == 2 and button.events() == [("OnClick", "Button1Click")]
+    assert (panel.line_start, panel.line_end) == (9, 21)
+
+    # バイナリデータは大きさと先頭だけを持つ
+    data = image.property("Picture.Data")
+    assert isinstance(data, BinaryData)
+    assert data.size == len(PNG_HEAD) // 2
+    assert data.class_name == "TPngImage"
+
+
+def test_binary_properties_are_summarized_or_dropped():
+    form = parse_dfm(FORM.splitlines())
+    summarized = render_component(form)
+    assert f"Picture.Data = {{binary data: {len(PNG_HEAD) // 2} bytes, TPngImage}}" in summarized
+    assert PNG_HEAD[:40] not in summarized
+    assert "Caption = 'It''s '#13#10'a form'" in summarized
+    assert "Picture.Data" not in render_component(form, binary_policy="drop")
+
+
+def test_chunks_by_component_within_budget():
+    def count_tokens(text):
+        return len(text.split())
+
+    form = parse_dfm(FORM.splitlines())
+    chunks = chunk_form(form, count_tokens, max_tokens=1000, target_tokens=35)
+    assert chunks[0]["chunk_type"] == "form"
+    assert "object Panel1: TPanel ... end" in chunks[0]["content"]
+    # 小さなコンポーネントは target_tokens までまとめる
+    assert [chunk["components"] for chunk in chunks[1:]] == [["Panel1"], ["Grid1", "Button1"]]
+    assert chunks[2]["parent"] == "FormMain"
+
+    # 上限を超えるコンポーネントは子ごとに分け、本文の先頭に親を書く
+    chunks = chunk_form(form, count_tokens, max_tokens=15, target_tokens=15)
+    panel_children = [chunk for chunk in chunks if chunk["parent"] == "FormMain.Panel1"]
+    assert [chunk["components"] for chunk in panel_children] == [["Image1"], ["Frame1"]]
+    assert panel_children[0]["content"].startswith("Form: FormMain (TFormMain)\nParent: Panel1 (TPanel)\n\n")
+
+
+def test_rejects_broken_form():
+    with pytest.raises(DfmSyntaxError):
+        parse_dfm(["object Form1: TForm1", "  Caption = 'x'"])
+    with pytest.raises(DfmSyntaxError):
+        parse_dfm(["object Form1: TForm1", "  Picture.Data = {", "  0102"])
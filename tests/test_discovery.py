@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+from src.discovery import iter_delphi_files
+from src.file_utils import FileProcessor
+
+
+def _make_tree(root):
+    for relative in ["Main.pas", "Main.DFM", "readme.txt",
+                     "a/A1.pas", "a/b/c/Deep.pas", "a/b/Form.dfm",
+                     ".git/Hidden.pas", "node_modules/x/Lib.pas", "z/Last.pas"]:
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("unit X;\nend.\n", encoding="utf-8")
+
+
+def _walk_reference(root):
+    """以前の os.walk による探索と同じ結果"""
+    found = []
+    for current, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['__pycache__', 'venv', 'node_modules']]
+        found.extend(os.path.join(current, f) for f in files if f.lower().endswith(('.pas', '.dfm')))
+    return sorted(found)
+
+
+def test_parallel_and_serial_discovery_match_os_walk(tmp_path):
+    _make_tree(tmp_path)
+    expected = _walk_reference(str(tmp_path))
+
+    for threads in (1, 4):
+        entries = list(iter_delphi_files(str(tmp_path), threads=threads))
+        assert sorted(entry.path for entry in entries) == expected
+        for entry in entries:
+            assert entry.size == os.path.getsize(entry.path)
+
+
+def test_legacy_reader_searches_every_directory_in_path_order(tmp_path):
+    import process_delphi_code
+    _make_tree(tmp_path)
+    # 以前の rglob と同じく、"." で始まるディレクトリや node_modules の中も読む
+    paths = [file["path"] for file in process_delphi_code.read_delphi_files(str(tmp_path))]
+    assert paths == sorted(os.path.join(current, name) for current, _, names in os.walk(tmp_path)
+                           for name in names if name.lower().endswith(('.pas', '.dfm')))
+    assert str(tmp_path / ".git" / "Hidden.pas") in paths
+
+
+def test_discovery_streams_before_the_walk_finishes(tmp_path):
+    _make_tree(tmp_path)
+    stream = iter_delphi_files(str(tmp_path), threads=2)
+    first = next(stream)
+    assert first.path.lower().endswith(('.pas', '.dfm'))
+    # 途中で打ち切ってもスレッドプールは片付く
+    stream.close()
+
+
+def test_find_delphi_files_caches_stats_without_writing_progress(tmp_path):
+    _make_tree(tmp_path)
+    progress = tmp_path / "progress.json"
+    processor = FileProcessor(str(progress))
+
+    files = processor.find_delphi_files(str(tmp_path))
+    assert files == _walk_reference(str(tmp_path))
+    assert not progress.exists()
+    assert set(processor.stat_cache) == set(files)
+
+    processor.mark_file_processed(files[0])
+    saved = json.loads(progress.read_text(encoding="utf-8"))
+    assert saved["total_files"] == len(files)
+    assert saved["files"][files[0]]["size"] == os.path.getsize(files[0])
+    assert FileProcessor(str(progress)).is_file_processed(files[0])
+
+
+def test_file_changed_uses_stat_then_content_hash(tmp_path):
+    path = tmp_path / "Unit1.pas"
+    path.write_text("unit Unit1;\nend.\n", encoding="utf-8")
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+    processor.mark_file_processed(str(path), doc_ids=["doc-1"], content_hash=processor.file_hash(str(path)))
+    assert not processor.file_changed(str(path))
+
+    # 更新時刻だけが変わった場合は内容のハッシュで変わっていないと判定する
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not processor.file_changed(str(path))
+    assert processor.file_entry(str(path))["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    path.write_text("unit Unit1;\n// 変更\nend.\n", encoding="utf-8")
+    assert processor.file_changed(str(path))
+    path.unlink()
+    assert processor.file_changed(str(path))
+    assert processor.forget_file(str(path))["doc_ids"] == ["doc-1"]
+    assert not processor.is_file_processed(str(path))
+
+
+def test_acknowledged_chunks_survive_a_restart_until_the_file_is_done(tmp_path):
+    progress = str(tmp_path / "progress.json")
+    processor = FileProcessor(progress)
+    processor.acknowledge_chunks("Big.pas", ["doc-1", "doc-2"], content_hash="v1")
+    processor.acknowledge_chunks("Big.pas", ["doc-2", "doc-3"], content_hash="v1")
+
+    # 途中で止まった後の実行でも受け付けられたチャンクがわかる
+    resumed = FileProcessor(progress)
+    assert resumed.partial_entry("Big.pas") == {"sha256": "v1", "doc_ids": ["doc-1", "doc-2", "doc-3"]}
+    assert not resumed.is_file_processed("Big.pas")
+
+    # 内容が変わったら記録し直す
+    resumed.acknowledge_chunks("Big.pas", ["doc-9"], content_hash="v2")
+    assert resumed.partial_entry("Big.pas")["doc_ids"] == ["doc-9"]
+
+    resumed.mark_file_processed("Big.pas", doc_ids=["doc-9", "doc-10"], content_hash="v2")
+    assert FileProcessor(progress).partial_entry("Big.pas") is None
+
+
+def test_rename_keeps_the_documents_of_the_file(tmp_path):
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+    processor.mark_file_processed("Old.pas", doc_ids=["doc-1"], content_hash="v1")
+    processor.acknowledge_chunks("Old.pas", ["doc-2"], content_hash="v2")
+    assert processor.rename_file("Old.pas", "New.pas")
+    assert processor.file_entry("New.pas")["doc_ids"] == ["doc-1"]
+    assert processor.partial_entry("New.pas")["doc_ids"] == ["doc-2"]
+
+    # 以前の形式（ドキュメントの記録なし）でも doc_ids を持つエントリになる
+    processor.progress_data["processed_files"].append("Legacy.pas")
+    processor.processed_set.add("Legacy.pas")
+    assert processor.rename_file("Legacy.pas", "Renamed.pas")
+    assert processor.file_entry("Renamed.pas")["doc_ids"] == []
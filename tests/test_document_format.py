@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+import pytest
+
+from src.document_format import DocumentFormatter
+
+
+def _chunk():
+    return {
+        "content": "procedure TForm1.Button1Click(Sender: TObject);\nbegin\nend;",
+        "metadata": {
+            "file_path": "src/Unit1.pas",
+            "file_name": "Unit1.pas",
+            "file_type": "pas",
+            "chunk_type": "function",
+            "function_name": "TForm1.Button1Click",
+            "line_number": 42,
+            "token_count": 17
+        }
+    }
+
+
+def test_default_keeps_the_previous_document_text():
+    # ドキュメントIDは本文から求めるので、既定の形式は以前と1文字も変えない
+    chunk = _chunk()
+    expected = (f"{chunk['content']}\n\n[Metadata]\n"
+                f"{json.dumps(chunk['metadata'], ensure_ascii=False, indent=2)}")
+    formatter = DocumentFormatter()
+    assert formatter.render(chunk) == expected
+    assert formatter.is_default
+
+
+def test_compact_header_is_one_line_without_the_file_path():
+    formatter = DocumentFormatter("compact")
+    text = formatter.render(_chunk())
+    header, body = text.split("\n", 1)
+    assert header == "[file_name=Unit1.pas; chunk_type=function; function_name=TForm1.Button1Click; line_number=42]"
+    assert body == _chunk()["content"]
+    assert "src/Unit1.pas" not in text
+    assert formatter.envelope(_chunk()) == header + "\n"
+
+
+def test_fields_and_template_are_configurable():
+    formatter = DocumentFormatter("compact", fields=["function_name"], template="{content}\n-- {file_name} {header}")
+    assert formatter.render(_chunk()).endswith("\n-- Unit1.pas [function_name=TForm1.Button1Click]")
+    assert DocumentFormatter(template="{content} {missing}").render(_chunk()).endswith(" ")
+    with pytest.raises(ValueError):
+        DocumentFormatter(template="{header}")
+    with pytest.raises(ValueError):
+        DocumentFormatter("yaml")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashlib
+
+import pytest
+
+from src.dfm_parser import parse_dfm
+from src.file_utils import FileProcessor
+from src.form_pairing import find_form_unit, pair_handlers
+
+UNIT = """unit MainForm;
+
+interface
+
+type
+  TFormMain = class(TForm)
+    procedure ButtonAddClick(Sender: TObject);
+  end;
+
+implementation
+
+procedure TFormMain.ButtonAddClick(Sender: TObject);
+begin
+  ShowMessage('clicked');
+end;
+
+end.
+"""
+
+FORM = """object FormMain: TFormMain
+  OnCreate = FormCreate
+  object ButtonAdd: TButton
+    Caption = 'Add'
+    OnClick = ButtonAddClick
+  end
+  object ButtonAgain: TButton
+    OnClick = ButtonAddClick
+  end
+  inline Frame1: TFrameA
+    object ButtonFrame: TButton
+      OnClick = ButtonAddClick
+    end
+  end
+end
+"""
+
+
+def _count_tokens(text):
+    return len(text.split())
+
+
+def test_analyzer_gives_exact_handler_spans():
+    pytest.importorskip("tree_sitter_pascal")
+    from src.delphi_ast_analyzer import DelphiASTAnalyzer
+
+    functions = DelphiASTAnalyzer().extract_functions(UNIT)
+    declaration, implementation = functions
+    assert (declaration["name"], declaration["class_name"], declaration["implementation"]) == (
+        "ButtonAddClick", "TFormMain", False)
+    # 名前はルーチン名だけで、クラス名付きの名前は qualified_name。実装部の範囲は本体の end; まで
+    assert (implementation["name"], implementation["class_name"], implementation["implementation"]) == (
+        "ButtonAddClick", "TFormMain", True)
+    assert implementation["qualified_name"] == declaration["qualified_name"] == "TFormMain.ButtonAddClick"
+    assert (implementation["line_start"], implementation["line_end"]) == (12, 15)
+    text = UNIT.encode("utf-8")[implementation["start_byte"]:implementation["end_byte"]].decode("utf-8")
+    assert text.startswith("procedure TFormMain.ButtonAddClick") and text.endswith("end;")
+
+
+def test_pairs_components_with_their_handler():
+    ast_info = {"functions": [
+        {"name": "ButtonAddClick", "class_name": "TFormMain", "implementation": False,
+         "line_start": 7, "line_end": 7},
+        {"name": "ButtonAddClick", "qualified_name": "TFormMain.ButtonAddClick", "class_name": "TFormMain",
+         "implementation": True, "line_start": 12, "line_end": 15}
+    ]}
+    chunks, unresolved = pair_handlers(parse_dfm(FORM.splitlines()), ast_info, UNIT, "MainForm.pas",
+                                       _count_tokens)
+    # FormCreate は実装がなく、フレームの中のボタンは TFrameA のハンドラ
+    assert unresolved == 2
+    assert len(chunks) == 1
+    chunk = chunks[0]
+    assert chunk["components"] == ["ButtonAdd", "ButtonAgain"]
+    assert chunk["metadata"]["events"] == ["ButtonAdd.OnClick", "ButtonAgain.OnClick"]
+    assert chunk["metadata"]["handler_line_start"] == 12
+    assert "Caption = 'Add'" in chunk["content"]
+    # ハンドラは1回だけ書く
+    assert chunk["content"].count("ShowMessage('clicked');") == 1
+    assert chunk["content"].endswith("procedure TFormMain.ButtonAddClick(Sender: TObject);\n"
+                                     "begin\n  ShowMessage('clicked');\nend;")
+
+
+def test_changed_unit_makes_form_stale(tmp_path):
+    unit = tmp_path / "MainForm.pas"
+    form = tmp_path / "MainForm.dfm"
+    unit.write_text(UNIT)
+    form.write_text(FORM)
+    assert find_form_unit(str(form)) == str(unit)
+
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+    digest = hashlib.sha256(unit.read_bytes()).hexdigest()
+    processor.mark_file_processed(str(form), depends_on={str(unit): digest})
+    assert not processor.dependencies_changed(str(form))
+    assert processor.dependent_files([str(unit)]) == [str(form)]
+
+    # 更新時刻だけが変わっても内容が同じなら処理し直さない
+    os.utime(unit, ns=(0, 10 ** 9))
+    assert not processor.dependencies_changed(str(form))
+    unit.write_text(UNIT.replace("clicked", "pressed"))
+    assert processor.dependencies_changed(str(form))
+
+
+def test_published_properties_starting_with_on_are_not_events():
+    form = parse_dfm("""object FormMain: TFormMain
+  object EditAmount: TNumberEdit
+    OnlyNumbers = True
+    OnExit = nil
+    OnChange = False
+    Online = Connected
+    OnClick = ButtonAddClick
+  end
+end
+""".splitlines())
+    assert form.children[0].events() == [("OnClick", "ButtonAddClick")]
+    ast_info = {"functions": [
+        {"name": "TFormMain.ButtonAddClick", "class_name": "TFormMain", "implementation": True,
+         "line_start": 12, "line_end": 15}
+    ]}
+    # 存在しないハンドラ True などを見つからなかった割り当てとして数えない
+    chunks, unresolved = pair_handlers(form, ast_info, UNIT, "MainForm.pas", _count_tokens)
+    assert (len(chunks), unresolved) == (1, 0)
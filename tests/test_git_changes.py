@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shutil
+import subprocess
+
+import pytest
+
+from src.git_changes import GitError, changed_files, head_commit
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="gitがない")
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   check=True, capture_output=True)
+
+
+def _commit(repo, message):
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", message)
+    return head_commit(str(repo))
+
+
+def test_changed_files_classifies_changes(tmp_path):
+    repo = tmp_path / "repo"
+    (repo / "src").mkdir(parents=True)
+    body = "unit Same;\n" + "".join(f"procedure P{i};\nbegin\nend;\n" for i in range(20)) + "end.\n"
+    (repo / "src" / "Keep.pas").write_text("unit Keep;\nend.\n")
+    (repo / "src" / "Gone.pas").write_text("unit Gone;\nend.\n")
+    (repo / "src" / "Old.pas").write_text(body)
+    (repo / "src" / "Form.dfm").write_text("object Form1: TForm1\nend\n")
+    (repo / "notes.txt").write_text("x\n")
+    _git(repo, "init", "-q")
+    base = _commit(repo, "init")
+
+    (repo / "src" / "Keep.pas").write_text("unit Keep;\n// changed\nend.\n")
+    (repo / "src" / "Gone.pas").unlink()
+    (repo / "src" / "Old.pas").rename(repo / "src" / "New.pas")
+    (repo / "src" / "Form.dfm").rename(repo / "src" / "Form.txt")
+    (repo / "src" / "Defs.inc").write_text("const X = 1;\n")
+    (repo / "notes.txt").write_text("y\n")
+    _commit(repo, "change")
+
+    changes = {change.path: change for change in changed_files(str(repo), base)}
+    assert set(changes) == {"src/Keep.pas", "src/Gone.pas", "src/New.pas", "src/Form.dfm", "src/Defs.inc"}
+    assert changes["src/Keep.pas"].status == "M"
+    assert changes["src/Gone.pas"].status == "D"
+    assert changes["src/New.pas"].status == "R"
+    assert changes["src/New.pas"].old_path == "src/Old.pas"
+    assert changes["src/New.pas"].similarity == 100
+    # 対象外の拡張子への名前変更は削除として扱う
+    assert changes["src/Form.dfm"].status == "D"
+    assert changes["src/Defs.inc"].status == "A"
+
+    # サブディレクトリを指定すると、その配下の相対パスになる
+    assert {c.path for c in changed_files(str(repo / "src"), base)} == {
+        "Keep.pas", "Gone.pas", "New.pas", "Form.dfm", "Defs.inc"}
+
+
+def test_git_errors_are_reported(tmp_path):
+    with pytest.raises(GitError):
+        head_commit(str(tmp_path))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importlib
+import zipfile
+
+import pytest
+import tiktoken
+
+from mock_lightrag_server import start_in_thread
+
+UNIT = """unit {name};
+interface
+implementation
+procedure Run;
+begin
+  WriteLn('{name}');
+end;
+end.
+"""
+
+
+class _WordEncoder:
+    """語ごとに1トークン（BPEの辞書をダウンロードせずに処理の流れだけを試す）"""
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda name: _WordEncoder())
+    # 処理ログ（process_delphi.log）は作業ディレクトリに書かれる
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("process_delphi_code_enhanced")
+    server, url = start_in_thread()
+    monkeypatch.setattr(module, "LIGHTRAG_API_URL", url)
+
+    def make_processor(**options):
+        options.setdefault("analysis_cache_file", None)
+        options.setdefault("chunk_refs_file", str(tmp_path / "refs.json"))
+        return module.EnhancedDelphiProcessor(str(tmp_path / "progress.json"), **options)
+
+    yield make_processor, server.mock
+    server.shutdown()
+
+
+def _write_unit(directory, name):
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{name}.pas").write_text(UNIT.format(name=name))
+    return str(directory / f"{name}.pas")
+
+
+def test_rejected_upload_leaves_the_file_unprocessed(tmp_path, pipeline):
+    make_processor, mock = pipeline
+    path = _write_unit(tmp_path / "src", "Alpha")
+    mock.config["error_rate"] = 1.0
+    processor = make_processor()
+    processor.process_directory(str(tmp_path / "src"))
+    # 失敗として数え、処理済みにしない
+    assert processor.stats["failed_files"] == 1
+    assert not processor.file_processor.is_file_processed(path)
+
+    mock.config["error_rate"] = 0.0
+    processor = make_processor()
+    processor.process_directory(str(tmp_path / "src"))
+    assert processor.stats["failed_files"] == 0
+    assert processor.file_processor.file_entry(path)["doc_ids"]
+    assert len(mock.documents) == 1
+
+
+def _write_big_unit(directory):
+    body = "".join(f"procedure P{i};\nbegin\n  WriteLn({i});\nend;\n\n" for i in range(400))
+    directory.mkdir()
+    (directory / "Big.pas").write_text("unit Big;\ninterface\nimplementation\n" + body + "end.\n")
+
+
+def _stream_without_parser(processor, monkeypatch):
+    """1MB以上のファイルと同じくストリームで処理させ、構文解析器の代わりに最後のルーチンを返す"""
+    monkeypatch.setattr(processor, "should_stream", lambda file_path, size=None: True)
+    analyzed = []
+    monkeypatch.setattr(processor, "analyze_pas_content", lambda content: analyzed.append(content) or {
+        "functions": [{"type": "procedure", "name": "P399", "line_start": 1999, "line_end": 2002}],
+        "classes": []})
+    return analyzed
+
+
+def test_streamed_unit_is_indexed_later_and_keeps_its_memory_scope(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    _write_big_unit(tmp_path / "big")
+    processor = make_processor(profile_memory=True, symbol_index_file=str(tmp_path / "symbols.sqlite"))
+    analyzed = _stream_without_parser(processor, monkeypatch)
+    # 32チャンクずつの登録が何回かに分かれるように小さく切る
+    processor.text_chunker.max_tokens = 50
+    record_file = processor.memory_profiler.record_file
+    uploaded_before_record = []
+    monkeypatch.setattr(processor.memory_profiler, "record_file", lambda *args: (
+        uploaded_before_record.append(len(mock.documents)), record_file(*args)))
+    processor.process_directory(str(tmp_path / "big"))
+
+    # 取り込みでは全体をデコードして解析せず、メンバーなし・ハッシュなしで索引に残す
+    assert analyzed == []
+    path = str(tmp_path / "big" / "Big.pas")
+    assert processor.symbol_index.indexed_files() == [path]
+    assert processor.symbol_index.file_hash(path) is None
+    # ファイルの計測は、前のバッチを登録しながら最後のチャンクを作り終えてから閉じる
+    assert len(uploaded_before_record) == 1
+    assert 0 < uploaded_before_record[0] < len(mock.documents)
+    assert processor.memory_profiler._stack == []
+
+    # index コマンドが全体を解析して埋める
+    processor.index_directory(str(tmp_path / "big"))
+    assert len(analyzed) == 1 and analyzed[0].endswith("end.\n")
+    assert processor.symbol_index.lookup("P399")[0].file_path == path
+    assert processor.symbol_index.file_hash(path) is not None
+
+
+def test_streamed_unit_is_not_analyzed_without_a_symbol_index(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    _write_big_unit(tmp_path / "big")
+    processor = make_processor()
+    analyzed = _stream_without_parser(processor, monkeypatch)
+    processor.process_directory(str(tmp_path / "big"), dry_run=True)
+    assert analyzed == []
+    assert processor.stats["failed_files"] == 0
+
+
+def test_reconcile_accepts_entries_without_documents(tmp_path, pipeline):
+    make_processor, mock = pipeline
+    path = _write_unit(tmp_path / "src", "Alpha")
+    processor = make_processor()
+    processor.process_directory(str(tmp_path / "src"))
+    # 以前の形式のエントリ（doc_ids なし）
+    del processor.file_processor.file_entry(path)["doc_ids"]
+    result = processor.reconcile(str(tmp_path / "src"), dry_run=True)
+    assert result["missing_files"] == []
+
+
+def test_archive_drops_leave_directory_files_alone(tmp_path, pipeline):
+    make_processor, mock = pipeline
+    project = _write_unit(tmp_path / "projA", "A")
+    make_processor().process_directory(str(tmp_path / "projA"))
+
+    def drop(name, units):
+        with zipfile.ZipFile(tmp_path / name, "w") as archive:
+            for unit in units:
+                archive.writestr(f"B/{unit}.pas", UNIT.format(name=unit))
+        processor = make_processor(archive_name="custB")
+        processor.process_directory(str(tmp_path / name))
+        return processor.file_processor
+
+    drop("custB_01.zip", ["B", "C"])
+    # 次の版では C がなくなった
+    manifest = drop("custB_02.zip", ["B"])
+    assert sorted(manifest.progress_data["files"]) == [project, "custB/B/B.pas"]
+    assert len(mock.documents) == 2
+
+    # 別のアーカイブは自分の名前の下だけを見る
+    with zipfile.ZipFile(tmp_path / "other.zip", "w") as archive:
+        archive.writestr("B/B.pas", UNIT.format(name="Other"))
+    processor = make_processor()
+    processor.process_directory(str(tmp_path / "other.zip"))
+    assert sorted(processor.file_processor.progress_data["files"]) == [
+        project, "custB/B/B.pas", "other.zip/B/B.pas"]
+    assert processor.stats["deleted_files"] == 0
+
+
+def test_uploads_charge_token_counts_and_time_out(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    _write_unit(tmp_path / "src", "Alpha")
+    processor = make_processor(upload_timeout=0.2)
+    charged = []
+    acquire = processor.throttle.acquire
+    monkeypatch.setattr(processor.throttle, "acquire", lambda documents, tokens: (
+        charged.append(tokens), acquire(documents, tokens))[1])
+    # 最初の登録は応答が遅すぎてタイムアウトし、混雑として送り直す
+    mock.config["latency_ms"] = 1000
+    overloaded = []
+    monkeypatch.setattr(processor.throttle, "throttled", lambda retry_after=None: (
+        overloaded.append(retry_after), mock.config.update(latency_ms=0)))
+    processor.process_directory(str(tmp_path / "src"))
+
+    # 単純なチャンク（ファイル全体）にもトークン数を付けて速度制限に渡す
+    assert overloaded == [None]
+    assert len(charged) == 2 and charged[0] == charged[1] > 0
+    assert processor.stats["throttled_requests"] == 1
+    assert processor.stats["failed_files"] == 0
+
+
+def test_failed_upload_does_not_claim_the_body_for_later_copies(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    copies = {_write_unit(tmp_path / "src" / "a", "U"), _write_unit(tmp_path / "src" / "b", "U")}
+    processor = make_processor()
+    insert = processor.insert_chunks_to_lightrag
+    attempts = []
+    # 最初に送ったファイル（探索の順なので a/U.pas とは限らない）だけ受け付けられない
+    monkeypatch.setattr(processor, "insert_chunks_to_lightrag", lambda chunks: (
+        attempts.append(chunks[0]["metadata"]["file_path"]), len(attempts) > 1 and insert(chunks))[1])
+    processor.process_directory(str(tmp_path / "src"))
+
+    # もう一方は失敗したファイルの重複として飛ばさずに本文をアップロードする
+    failed, uploaded = attempts
+    assert {failed, uploaded} == copies
+    assert len(mock.documents) == 1
+    assert processor.stats["failed_files"] == 1
+    assert processor.file_processor.file_entry(uploaded)["doc_ids"]
+    reloaded = make_processor()
+    entry, = reloaded.deduplicator.references.values()
+    assert [location["file_path"] for location in entry["locations"]] == [uploaded]
+
+    # 次の実行では失敗したファイルがもう一方の重複になる
+    reloaded.process_directory(str(tmp_path / "src"))
+    assert reloaded.file_processor.is_file_processed(failed)
+    assert reloaded.stats["duplicate_chunks"] == 1
+    assert len(mock.documents) == 1
+
+
+def test_failed_upload_does_not_leave_a_near_duplicate_representative(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    body = "procedure Steps;\nbegin\n" + "".join(f"  Total := Total + {i};\n" for i in range(60)) + "end;\n"
+    copies = set()
+    for name, edit in (("a", "Total + 7;"), ("b", "Total + 700;")):
+        (tmp_path / "src" / name).mkdir(parents=True)
+        path = tmp_path / "src" / name / "Calc.pas"
+        path.write_text("unit Calc;\ninterface\nimplementation\n" + body.replace("Total + 7;", edit) + "end.\n")
+        copies.add(str(path))
+    processor = make_processor(near_dup_policy="skip")
+    insert = processor.insert_chunks_to_lightrag
+    attempts = []
+    monkeypatch.setattr(processor, "insert_chunks_to_lightrag", lambda chunks: (
+        attempts.append(chunks[0]["metadata"]["file_path"]), len(attempts) > 1 and insert(chunks))[1])
+    processor.process_directory(str(tmp_path / "src"))
+
+    # 登録に失敗した代表のほぼ重複として飛ばさない
+    failed, uploaded = attempts
+    assert {failed, uploaded} == copies
+    assert processor.stats["near_duplicate_chunks"] == 0
+    assert len(mock.documents) == 1
+    assert processor.file_processor.file_entry(uploaded)["doc_ids"]
+
+
+def test_streamed_archive_member_is_chunked_from_a_spooled_file(tmp_path, pipeline, monkeypatch):
+    make_processor, mock = pipeline
+    _write_big_unit(tmp_path / "big")
+    with zipfile.ZipFile(tmp_path / "drop.zip", "w") as archive:
+        archive.write(tmp_path / "big" / "Big.pas", "src/Big.pas")
+    processor = make_processor()
+    monkeypatch.setattr(processor, "should_stream", lambda file_path, size=None: True)
+    spooled = []
+    prepare_file = processor.prepare_file
+    monkeypatch.setattr(processor, "prepare_file", lambda file_path, data=None: (
+        spooled.append(type(data).__name__), prepare_file(file_path, data))[1])
+    processor.process_directory(str(tmp_path / "drop.zip"))
+
+    # メンバーは bytes としてメモリに読まず、一時ファイルのmmapから窓ごとにデコードする
+    assert spooled == ["mmap"]
+    assert processor.file_processor.file_entry("drop.zip/src/Big.pas")["doc_ids"]
+    assert processor.stats["failed_files"] == 0
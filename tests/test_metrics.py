@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.metrics import MetricsRecorder, NULL_METRICS
+
+
+def test_stage_summary_merge_and_prometheus(tmp_path):
+    metrics = MetricsRecorder()
+    for seconds in [0.001, 0.002, 0.003, 0.1]:
+        metrics.observe("parse", seconds, bytes=1000)
+    with metrics.stage("tokenization") as timer:
+        timer.tokens = 42
+    metrics.gauge("prepare_in_flight", 4)
+    metrics.gauge("prepare_in_flight", 1)
+
+    # ワーカープロセスの記録を取り込む
+    worker = MetricsRecorder()
+    worker.observe("parse", 0.004, bytes=500)
+    metrics.merge(worker.export(reset=True))
+    assert worker.stages == {}
+
+    summary = metrics.summary()
+    parse = summary["stages"]["parse"]
+    assert parse["count"] == 5
+    assert parse["bytes"] == 4500
+    assert parse["p50_ms"] == 3.0
+    assert parse["max_ms"] == 100.0
+    assert summary["stages"]["tokenization"]["tokens"] == 42
+    assert summary["gauges"]["prepare_in_flight"] == {"value": 1, "max": 4}
+
+    path = tmp_path / "delphi.prom"
+    metrics.write_prometheus(str(path), counters={"processed_files": 3})
+    text = path.read_text()
+    assert 'delphi_lightrag_stage_seconds_bucket{stage="parse",le="+Inf"} 5' in text
+    assert 'delphi_lightrag_stage_seconds_bucket{stage="parse",le="0.0025"} 2' in text
+    assert 'delphi_lightrag_queue_depth_max{queue="prepare_in_flight"} 4' in text
+    assert "delphi_lightrag_processed_files 3" in text
+
+
+def test_disabled_recorder_is_noop():
+    with NULL_METRICS.stage("parse") as timer:
+        timer.bytes = 10
+    NULL_METRICS.observe("parse", 1.0)
+    NULL_METRICS.gauge("queue", 3)
+    assert NULL_METRICS.summary()["stages"] == {}
+    assert NULL_METRICS.gauges == {}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from mock_lightrag_server import compute_doc_id, start_in_thread
+
+
+def test_insert_status_progression_and_stats():
+    server, url = start_in_thread({"processing_docs_per_minute": 600})
+    try:
+        response = requests.post(f"{url}/documents/texts",
+                                 json={"texts": ["unit A;", "unit B;", "unit A;"], "file_sources": ["a", "b", "a"]})
+        assert response.status_code == 200
+
+        statuses = requests.get(f"{url}/documents").json()["statuses"]
+        ids = {doc["id"] for docs in statuses.values() for doc in docs}
+        assert ids == {compute_doc_id("unit A;"), compute_doc_id("unit B;")}
+        assert "pending" in statuses or "processing" in statuses
+
+        # 1件0.1秒で処理されるので、しばらく待てば全件processedになる
+        time.sleep(0.3)
+        statuses = requests.get(f"{url}/documents").json()["statuses"]
+        assert list(statuses) == ["processed"]
+
+        stats = requests.get(f"{url}/mock/stats").json()
+        assert stats["texts_received"] == 3
+        assert stats["documents_stored"] == 2
+        assert stats["endpoints"]["POST /documents/texts"]["statuses"] == {"200": 1}
+    finally:
+        server.shutdown()
+
+
+def test_throttle_and_errors():
+    server, url = start_in_thread({"requests_per_minute": 60})
+    try:
+        assert requests.get(f"{url}/docs").status_code == 200
+        throttled = requests.post(f"{url}/documents/texts", json={"texts": ["x"]})
+        assert throttled.status_code == 429
+        assert int(throttled.headers["Retry-After"]) >= 1
+    finally:
+        server.shutdown()
+
+    server, url = start_in_thread({"error_rate": 1.0})
+    try:
+        assert requests.post(f"{url}/documents/texts", json={"texts": ["x"]}).status_code >= 500
+        # 読み取り系は失敗させない
+        assert requests.get(f"{url}/documents").status_code == 200
+        assert requests.get(f"{url}/mock/stats").json()["errors"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.near_duplicate import NearDuplicateDetector
+
+FORM = "\n".join(
+    f"  object Button{i}: TButton\n    Left = {i * 8}\n    Top = 16\n    Caption = 'Button {i}'\n  end"
+    for i in range(40)
+)
+
+
+def _chunk(content, file_path):
+    return {"content": content, "metadata": {"file_path": file_path, "chunk_type": "full_form", "token_count": 500}}
+
+
+def test_signatures_estimate_similarity():
+    detector = NearDuplicateDetector()
+    edited = FORM.replace("Caption = 'Button 7'", "Caption = 'OK'")
+    other = "\n".join(f"procedure TCalc.Step{i}(Value: Integer);\nbegin\n  FTotal := FTotal + Value * {i};\nend;"
+                      for i in range(40))
+    sigs = detector.signatures([FORM, edited, other, FORM])
+
+    assert (sigs[0] == sigs[3]).all()
+    assert (sigs[0] == sigs[1]).mean() >= 0.9
+    assert (sigs[0] == sigs[2]).mean() < 0.5
+    # バッチの分け方で署名は変わらない
+    assert (detector.signatures([FORM, edited, other, FORM], batch_size=1) == sigs).all()
+
+
+def test_find_duplicates_across_batch():
+    detector = NearDuplicateDetector(threshold=0.8)
+    edited = FORM.replace("Top = 16\n    Caption = 'Button 3'", "Top = 24\n    Caption = 'Button 3'")
+    results = detector.find_duplicates([FORM, "unit Other; end.", edited])
+    assert results[0] is None and results[1] is None
+    assert results[2][0] == 0 and results[2][1] >= 0.8
+
+
+@pytest.mark.parametrize("policy", ["skip", "representative", "annotate"])
+def test_policies(policy):
+    detector = NearDuplicateDetector(threshold=0.8, policy=policy)
+    edited = FORM.replace("Caption = 'Button 7'", "Caption = 'OK'")
+    kept = detector.process_chunks([_chunk(FORM, "a/Main.dfm"), _chunk(edited, "b/Main.dfm")])
+
+    assert kept[0]["content"] == FORM
+    if policy == "skip":
+        assert len(kept) == 1
+        return
+    assert len(kept) == 2
+    assert kept[1]["metadata"]["near_duplicate_of"] == "a/Main.dfm"
+    if policy == "representative":
+        assert kept[1]["metadata"]["chunk_type"] == "near_duplicate_summary"
+        assert "+    Caption = 'OK'" in kept[1]["content"]
+        assert len(kept[1]["content"]) < len(edited)
+    else:
+        assert kept[1]["content"] == edited
+
+
+def test_discarded_representative_is_not_matched():
+    detector = NearDuplicateDetector(policy="skip")
+    edited = FORM.replace("Caption = 'Button 7'", "Caption = 'OK'")
+    assert len(detector.process_chunks([_chunk(FORM, "a.dfm")])) == 1
+    # a.dfm の登録が失敗したので、次のほぼ重複は飛ばさずに代表になる
+    detector.discard([{"file_path": "a.dfm", "chunk_type": "full_form"}])
+    assert len(detector) == 0
+    assert detector.process_chunks([_chunk(edited, "b.dfm")])[0]["metadata"]["file_path"] == "b.dfm"
+    assert detector.process_chunks([_chunk(FORM, "c.dfm")]) == []
+    assert len(detector) == 1
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.rate_limiter import BACKOFF_SECONDS, UploadThrottle, parse_retry_after
+
+
+class FakeClock:
+    """sleep で進むだけの時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _throttle(**rates):
+    clock = FakeClock()
+    return UploadThrottle(**rates, clock=clock, sleep=clock.sleep), clock
+
+
+def test_uploads_are_paced_to_the_token_rate():
+    throttle, clock = _throttle(tokens_per_minute=6000)
+    # バースト分（10秒分 = 1000トークン）は待たずに送れる
+    assert throttle.acquire(1, 1000) == 0
+    # 残りは毎秒100トークンのペースになる
+    for _ in range(10):
+        throttle.acquire(1, 500)
+    assert clock.now == pytest.approx(45.0)
+
+
+def test_batches_larger_than_the_burst_are_not_blocked_forever():
+    throttle, clock = _throttle(docs_per_minute=60)
+    assert throttle.acquire(100, 0) == 0
+    throttle.acquire(1, 0)
+    assert clock.now == pytest.approx(90.0)
+
+
+def test_throttling_halves_the_rate_and_recovers():
+    throttle, clock = _throttle(docs_per_minute=60)
+    throttle.acquire(10, 0)
+    throttle.throttled(retry_after=5)
+    assert throttle.fraction == 0.5
+    # Retry-After の間は送らず（その間に半分の速度で2.5件分たまる）、そのあとは半分の速度
+    throttle.acquire(1, 0)
+    assert clock.now == pytest.approx(5.0)
+    for _ in range(4):
+        throttle.acquire(1, 0)
+    assert clock.now == pytest.approx(8.0)
+    for _ in range(20):
+        throttle.succeeded()
+    assert throttle.fraction == 1.0
+
+
+def test_backoff_without_retry_after_grows_until_a_success():
+    throttle, clock = _throttle()
+    assert not throttle.enabled
+    throttle.throttled()
+    throttle.throttled()
+    throttle.acquire(1, 100)
+    assert clock.now == pytest.approx(BACKOFF_SECONDS * 2)
+    throttle.succeeded()
+    throttle.throttled()
+    throttle.acquire(1, 100)
+    assert clock.now == pytest.approx(BACKOFF_SECONDS * 3)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.scheduler import (BYTES_PER_TOKEN, estimate_tokens, ideal_makespan, list_schedule_makespan,
+                           makespan_report, order_by_cost)
+
+
+def test_estimate_uses_the_previous_token_count_scaled_by_size():
+    assert estimate_tokens(4000) == 4000 / BYTES_PER_TOKEN
+    assert estimate_tokens(2000, {"size": 1000, "tokens": 300}) == 600
+    # 前回の記録にトークン数がなければバイト数から見積もる
+    assert estimate_tokens(2000, {"size": 1000}) == 2000 / BYTES_PER_TOKEN
+
+
+def test_orders():
+    files = [("a.pas", 5), ("b.pas", 50), ("c.pas", 1), ("d.pas", 5)]
+    assert order_by_cost(files, "lpt") == ["b.pas", "a.pas", "d.pas", "c.pas"]
+    assert order_by_cost(files, "small-first") == ["c.pas", "a.pas", "d.pas", "b.pas"]
+    assert order_by_cost(files, "discovery") == ["a.pas", "b.pas", "c.pas", "d.pas"]
+
+
+def test_lpt_avoids_a_large_task_at_the_end():
+    # 見つかった順だと最後の大きなファイルが1つのワーカーだけを長く使う
+    costs = [1.0] * 12 + [12.0]
+    assert list_schedule_makespan(costs, 4) == 15.0
+    assert list_schedule_makespan(sorted(costs, reverse=True), 4) == 12.0
+    assert ideal_makespan(costs, 4) == 12.0
+
+
+def test_makespan_report_compares_with_the_ideal():
+    spans = [(0.0, 4.0), (0.0, 2.0), (2.0, 6.0)]
+    report = makespan_report(spans, workers=2)
+    assert report["makespan"] == 6.0
+    assert report["total_work"] == 10.0
+    assert report["ideal"] == 5.0
+    assert report["overhead_pct"] == pytest.approx(20.0)
+    assert makespan_report([], workers=2)["tasks"] == 0
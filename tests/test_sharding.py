@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+
+import pytest
+
+from src.sharding import assign_shards, merge_progress, merge_references, parse_shard, shard_file
+
+
+def _corpus(count=2000, seed=1):
+    rng = random.Random(seed)
+    return [(f"src/mod{i % 37}/Unit{i:05d}.pas", int(rng.lognormvariate(9, 1.2))) for i in range(count)]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for spec in ("0/4", "5/4", "a/b", "1"):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+    assert shard_file(".lightrag_progress.json", 2, 4) == ".lightrag_progress.shard-2-of-4.json"
+
+
+def test_assignment_is_deterministic_and_balanced_by_bytes():
+    files = _corpus()
+    assignment = assign_shards(files, 4)
+    # 入力の順序によらず同じ割り当てになる
+    assert assign_shards(list(reversed(files)), 4) == assignment
+
+    sizes = dict(files)
+    totals = [sum(sizes[path] for path, shard in assignment.items() if shard == i) for i in range(1, 5)]
+    ideal = sum(sizes.values()) / 4
+    assert max(abs(total - ideal) for total in totals) <= max(sizes.values())
+
+
+def test_adding_a_file_moves_few_files():
+    files = _corpus()
+    before = assign_shards(files, 4)
+    after = assign_shards(files + [("src/new/Added.pas", 5000)], 4)
+    moved = [path for path in before if before[path] != after[path]]
+    assert len(moved) < len(files) * 0.05
+
+
+def test_large_file_does_not_leave_a_shard_empty():
+    files = [("Huge.pas", 100000)] + [(f"Small{i}.pas", 1000) for i in range(30)]
+    assert set(assign_shards(files, 3).values()) == {1, 2, 3}
+
+
+def test_merge_progress_combines_files_and_stats():
+    shard1 = {"processed_files": ["a.pas", "b.pas"], "total_files": 3, "completed_files": 2,
+              "files": {"a.pas": {"doc_ids": ["doc-a"]}, "b.pas": {"doc_ids": ["doc-b1"]}},
+              "stats": {"processed_files": 2, "total_chunks": 5}, "last_commit": "abc"}
+    shard2 = {"processed_files": ["b.pas", "c.pas"], "total_files": 2, "completed_files": 2,
+              "files": {"b.pas": {"doc_ids": ["doc-b2"], "size": 9}, "c.pas": {"doc_ids": []}},
+              "stats": {"processed_files": 2, "total_chunks": 4}, "last_commit": "abc"}
+    merged = merge_progress([shard1, shard2])
+    assert merged["processed_files"] == ["a.pas", "b.pas", "c.pas"]
+    assert merged["total_files"] == 5
+    assert merged["stats"] == {"processed_files": 4, "total_chunks": 9}
+    # 両方のシャードに記録されたファイルはどちらのドキュメントも持つ
+    assert merged["files"]["b.pas"] == {"doc_ids": ["doc-b1", "doc-b2"], "size": 9}
+    assert merged["last_commit"] == "abc"
+
+    shard2["last_commit"] = "def"
+    assert "last_commit" not in merge_progress([shard1, shard2])
+
+
+def test_merge_references_keeps_the_first_representative():
+    location1 = {"file_path": "a.pas", "chunk_index": 0}
+    location2 = {"file_path": "b.pas", "chunk_index": 3}
+    shard1 = {"strip_comments": False, "chunks": {"h": {"token_count": 4, "locations": [location1], "doc_id": "doc-1"}}}
+    shard2 = {"strip_comments": False, "chunks": {"h": {"token_count": 4, "locations": [location2], "doc_id": "doc-2"}}}
+    merged = merge_references([shard1, shard2])
+    assert merged["chunks"]["h"] == {"token_count": 4, "locations": [location1, location2], "doc_id": "doc-1"}
+    assert merge_references([shard1, dict(shard2, strip_comments=True)]) is None
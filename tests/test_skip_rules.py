@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.file_utils import FileProcessor
+from src.skip_rules import SkipRules
+
+
+def _write(root, relative, text="unit Foo;\nend.\n"):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_gitignore_semantics(tmp_path):
+    (tmp_path / ".lightragignore").write_text(
+        "# コメント\n"
+        "*.bak.pas\n"
+        "/Build/\n"
+        "third_party/**/Tests/\n"
+        "Legacy*\n"
+        "!LegacyKeep.pas\n",
+        encoding="utf-8")
+    (tmp_path / "Sub").mkdir()
+    (tmp_path / "Sub" / ".lightragignore").write_text("Local.pas\n", encoding="utf-8")
+    rules = SkipRules(str(tmp_path))
+
+    assert rules.is_ignored(_write(tmp_path, "Deep/Old.bak.pas"))
+    assert rules.is_ignored(_write(tmp_path, "Build/Out.pas"))
+    # 先頭の / はルートに固定されるので、下の階層の Build は対象外
+    assert not rules.is_ignored(_write(tmp_path, "Src/Build/Keep.pas"))
+    assert rules.is_ignored(_write(tmp_path, "third_party/a/b/Tests/T.pas"))
+    assert not rules.is_ignored(_write(tmp_path, "third_party/a/Main.pas"))
+    assert rules.is_ignored(_write(tmp_path, "LegacyUnit.pas"))
+    assert not rules.is_ignored(_write(tmp_path, "LegacyKeep.pas"))
+    # サブディレクトリの ignore ファイルはその配下だけに効く
+    assert rules.is_ignored(_write(tmp_path, "Sub/Local.pas"))
+    assert not rules.is_ignored(_write(tmp_path, "Local.pas"))
+
+
+def test_check_order_and_reasons(tmp_path):
+    rules = SkipRules(str(tmp_path), max_bytes=1000, min_bytes=1, extensions=["pas", ".dfm"],
+                      filename_patterns=["*_tlb.pas"])
+
+    assert rules.check(_write(tmp_path, "Main.pas")) is None
+    assert rules.check(_write(tmp_path, "Main.inc")) == "extension"
+    assert rules.check(_write(tmp_path, "Form1.Designer.pas")) == "generated_name"
+    assert rules.check(_write(tmp_path, "Office_TLB.pas")) == "generated_name"
+    assert rules.check(_write(tmp_path, "Big.pas", "x" * 2000)) == "too_large"
+    assert rules.check(_write(tmp_path, "Empty.pas", "")) == "too_small"
+    assert rules.check(_write(tmp_path, "Gen.pas", "// This file is automatically generated\nunit Gen;\n")) \
+        == "generated_header"
+
+
+def test_generated_header_reads_only_the_head(tmp_path):
+    rules = SkipRules(str(tmp_path), header_bytes=64)
+    # 先頭のバイト数を超えた位置にある注記は見ない
+    late = _write(tmp_path, "Late.pas", "x" * 100 + "\n// DO NOT EDIT\n")
+    # 先頭10行より後の注記も見ない（従来の is_auto_generated と同じ）
+    deep = _write(tmp_path, "Deep.pas", "\n" * 10 + "// do not edit\n")
+    head = _write(tmp_path, "Head.pas", "{ Generated code }\nunit Head;\n")
+
+    assert not rules.has_generated_header(late)
+    assert not rules.has_generated_header(deep)
+    assert rules.has_generated_header(head)
+
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+    for path in (deep, head):
+        with open(path, encoding="utf-8") as f:
+            assert processor.is_auto_generated(path, f.read()) == rules.has_generated_header(path)
+
+
+def test_ignored_directories_are_not_walked(tmp_path):
+    (tmp_path / ".lightragignore").write_text("vendor/\n", encoding="utf-8")
+    _write(tmp_path, "Main.pas")
+    _write(tmp_path, "vendor/Lib.pas")
+    _write(tmp_path, "src/vendor/Other.pas")
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+
+    files = processor.find_delphi_files(str(tmp_path), skip_rules=SkipRules(str(tmp_path)))
+    assert [os.path.relpath(path, tmp_path) for path in files] == ["Main.pas"]
+    assert len(processor.find_delphi_files(str(tmp_path))) == 3
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.file_utils import FileProcessor
+
+SOURCE = "unit 巨大;\r\n\r\n// 日本語のコメント\r\nprocedure Foo;\r\nbegin\r\n  Bar('値');\r\nend;\r\n\r\nend.\r\n"
+
+
+def test_iter_lines_matches_text_mode_read(tmp_path):
+    path = tmp_path / "Huge.pas"
+    path.write_bytes((SOURCE * 50).encode("shift_jis"))
+    processor = FileProcessor(str(tmp_path / "progress.json"))
+
+    with open(path, 'r', encoding='shift_jis') as f:
+        expected = f.read().split('\n')
+    # 小さなウィンドウで、マルチバイト文字やCRLFがウィンドウの境界をまたぐようにする
+    for window in (1, 7, 64, 1 << 20):
+        assert list(processor.iter_lines(str(path), 'shift_jis', window=window)) == expected
+
+
+def test_section_chunks_stream_like_chunk_by_section():
+    try:
+        from src.text_chunker import TextChunker
+        chunker = TextChunker(max_tokens=60)
+    except Exception as e:
+        pytest.skip(f"tiktokenのエンコーディングを読み込めない: {e}")
+
+    text = (SOURCE.replace("\r\n", "\n") + "function Baz: Integer;\nbegin\n  Result := 1;\nend;\n") * 20
+    streamed = chunker.iter_section_chunks(iter(text.split('\n')))
+    assert iter(streamed) is streamed
+    chunks = list(streamed)
+    assert chunks == chunker.chunk_by_section(text)
+    assert "".join(c["content"] for c in chunks) == text + "\n"
+    assert all(c["token_count"] <= 60 for c in chunks)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.symbol_index import SymbolIndex, symbols_from_analysis
+
+UNIT = """unit MainForm;
+interface
+type
+  TFormMain = class(TForm)
+    procedure ButtonAddClick(Sender: TObject);
+  end;
+implementation
+procedure TFormMain.ButtonAddClick(Sender: TObject);
+begin
+end;
+end.
+"""
+
+AST_INFO = {
+    "classes": [{"name": "TFormMain", "line_start": 4, "line_end": 6, "start_byte": 30, "end_byte": 110}],
+    "functions": [
+        {"type": "procedure", "name": "ButtonAddClick", "class_name": "TFormMain", "implementation": False,
+         "line_start": 5, "line_end": 5, "start_byte": 60, "end_byte": 100},
+        {"type": "procedure", "name": "TFormMain.ButtonAddClick", "class_name": "TFormMain",
+         "implementation": True, "line_start": 8, "line_end": 10, "start_byte": 130, "end_byte": 200}
+    ]
+}
+
+
+def _index(tmp_path):
+    index = SymbolIndex(str(tmp_path / "symbols.sqlite"))
+    index.update_file("src/MainForm.pas", symbols_from_analysis(AST_INFO, UNIT), "sha-1")
+    return index
+
+
+def test_exact_and_prefix_lookup(tmp_path):
+    index = _index(tmp_path)
+    # クラス名付き・メンバー名だけ・ユニット名付きのどれでも、大文字小文字を区別せずに引ける
+    for query in ("TFormMain.ButtonAddClick", "buttonaddclick", "MainForm.TFormMain.ButtonAddClick"):
+        declaration, implementation = index.lookup(query)
+        assert (declaration.implementation, implementation.implementation) == (False, True)
+    assert implementation.name == "TFormMain.ButtonAddClick"
+    assert implementation.full_name == "MainForm.TFormMain.ButtonAddClick"
+    assert (implementation.file_path, implementation.line_start, implementation.line_end) == (
+        "src/MainForm.pas", 8, 10)
+    assert (implementation.start_byte, implementation.end_byte) == (130, 200)
+
+    unit, = index.lookup("mainform")
+    assert (unit.kind, unit.line_start, unit.line_end, unit.end_byte) == ("unit", 1, 12, len(UNIT))
+    assert [symbol.name for symbol in index.lookup("TFormMain.Button", prefix=True)] == [
+        "TFormMain.ButtonAddClick", "TFormMain.ButtonAddClick"]
+    assert [symbol.kind for symbol in index.lookup("tform", prefix=True)] == ["class", "procedure", "procedure"]
+    assert index.lookup("TFormMain.Button") == []
+    index.close()
+
+
+def test_updates_one_file_at_a_time(tmp_path):
+    index = _index(tmp_path)
+    other = {"classes": [{"name": "TCustomerGrid", "line_start": 3, "line_end": 9}], "functions": []}
+    index.update_file("src/Grid.pas", symbols_from_analysis(other, "unit Grid;"), "sha-2")
+    # 内容が同じなら書き換えない
+    assert not index.update_file("src/MainForm.pas", [], "sha-1")
+    assert index.update_file("src/MainForm.pas", symbols_from_analysis({}, UNIT), "sha-3")
+    assert index.lookup("ButtonAddClick") == []
+    assert index.lookup("TCustomerGrid")[0].file_path == "src/Grid.pas"
+
+    # 名前が変わればユニット名も変わる
+    index.rename_file("src/Grid.pas", "src/CustomerGrid.pas")
+    assert index.lookup("Grid") == []
+    assert index.lookup("CustomerGrid.TCustomerGrid")[0].file_path == "src/CustomerGrid.pas"
+    assert index.file_hash("src/CustomerGrid.pas") == "sha-2"
+    index.rename_file("src/MainForm.pas", "lib/MainForm.pas")
+    assert index.lookup("MainForm")[0].file_path == "lib/MainForm.pas"
+    index.remove_file("lib/MainForm.pas")
+    assert index.indexed_files() == ["src/CustomerGrid.pas"]
+    assert index.summary() == {"files": 1, "symbols": 2}
+    index.close()
+
+
+def test_lookups_use_the_name_indexes(tmp_path):
+    index = _index(tmp_path)
+    # 索引が大きくても表を全件走査しない
+    for prefix in (False, True):
+        condition = ("name_key = ? OR member_key = ? OR full_key = ?" if not prefix else
+                     " OR ".join(f"({column} >= ? AND {column} < ?)"
+                                 for column in ("name_key", "member_key", "full_key")))
+        plan = index._conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM symbols WHERE {condition}",
+                                   ["x"] * (6 if prefix else 3)).fetchall()
+        details = [row[-1] for row in plan]
+        assert not any(detail.startswith("SCAN") for detail in details), details
+    index.close()
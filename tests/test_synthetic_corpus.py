@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import compare_results
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+def test_corpus_is_deterministic(tmp_path):
+    first = generate_corpus(str(tmp_path / "a"), "tiny", seed=7)
+    second = generate_corpus(str(tmp_path / "b"), "tiny", seed=7)
+
+    assert first["files"] == second["files"]
+    for entry in first["files"]:
+        assert (tmp_path / "a" / entry["path"]).read_bytes() == (tmp_path / "b" / entry["path"]).read_bytes()
+
+    # Shift-JISのユニットはShift-JISで書かれている
+    sjis = [entry for entry in first["files"] if entry["encoding"] == "shift_jis"]
+    assert sjis
+    text = (tmp_path / "a" / sjis[0]["path"]).read_bytes().decode("shift_jis")
+    assert "日本語コメント" in text
+
+
+def test_compare_flags_only_slow_stages():
+    baseline = {"stages": {"parse": {"seconds": 1.0}, "chunking": {"seconds": 2.0}, "scan": {"seconds": 0.001}}}
+    current = {"stages": {"parse": {"seconds": 1.1}, "chunking": {"seconds": 3.0}, "scan": {"seconds": 0.01}}}
+
+    rows = {row["stage"]: row for row in compare_results(current, baseline, tolerance=0.25)}
+    assert not rows["parse"]["regressed"]
+    assert rows["chunking"]["regressed"]
+    # 基準が短すぎるステージは誤差が大きいので判定しない
+    assert not rows["scan"]["regressed"]